@@ -9,7 +9,6 @@ from flask_cors import CORS
 import base64
 import io
 from PIL import Image
-import tempfile
 import os
 import sys
 
@@ -35,61 +34,164 @@ except ImportError as e:
     print(f"OCR module not available: {e}")
     OCR_AVAILABLE = False
 
+try:
+    import solution_grader
+    GRADER_AVAILABLE = True
+except ImportError as e:
+    print(f"Grader module not available: {e}")
+    GRADER_AVAILABLE = False
+
+MAX_JOB_WAIT_SECONDS = 30
+
+def _ocr_source_from_request(rasterize=True):
+    """
+    Read the drawing from the request: a multipart 'image' upload or a JSON
+    stroke payload {"strokes": [[x0, y0, dx1, dy1, ...], ...]} which is
+    rasterised here (or only validated with rasterize=False).
+    Returns (source, None) or (None, error response).
+    """
+    if request.is_json:
+        strokes = (request.get_json(silent=True) or {}).get('strokes')
+        if strokes is None:
+            return None, (jsonify({'error': 'No strokes provided'}), 400)
+        try:
+            if not rasterize:
+                lcd.decode_strokes(strokes)
+                return strokes, None
+            return lcd.rasterize_strokes(strokes), None
+        except ValueError as e:
+            return None, (jsonify({'error': f'Invalid strokes: {str(e)}'}), 400)
+    if 'image' not in request.files:
+        return None, (jsonify({'error': 'No image file provided'}), 400)
+    file = request.files['image']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No image file selected'}), 400)
+    # The upload stream goes straight into the pipeline, no temp file
+    return file.stream, None
+
+def _ocr_result_status(result):
+    """Map a process_image result to an HTTP status, demoting solve errors to warnings"""
+    if result.get("ocr_unavailable"):
+        # SimpleTex circuit is open - clients should retry later or use demo mode
+        result["error"] = "OCR unavailable"
+        return 503
+    if result.get("error") and not result.get("latex_raw"):
+        # Real OCR failure
+        return 500
+    if result.get("error") and result.get("latex_raw"):
+        # OCR succeeded but solving failed - this is not a 500 error
+        print(f"[DEBUG] OCR succeeded but solving failed: {result['error']}")
+        result["warning"] = result.pop("error")  # Convert error to warning
+    return 200
+
 @app.route('/api/ocr/process', methods=['POST'])
 def process_ocr():
-    """Process uploaded image through OCR"""
-    temp_file = None
+    """Process a drawing (image upload or stroke payload) through OCR"""
     try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No image file selected'}), 400
-        
-        # Save the uploaded file temporarily
-        temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        temp_file.close()
-        file.save(temp_file.name)
-        
+        if not OCR_AVAILABLE:
+            return jsonify({"error": "OCR module not available"}), 500
+
+        source, error_response = _ocr_source_from_request()
+        if error_response:
+            return error_response
+
         # Real OCR processing using your lcd module
-        if OCR_AVAILABLE:
-            result = lcd.process_image(temp_file.name)
-            print(f"[DEBUG] OCR result: {result}")
-            
-            # Clean up temp file before returning
-            if temp_file:
-                os.unlink(temp_file.name)
-            
-            # Check if OCR actually failed or just had solving issues
-            if result.get("error") and not result.get("latex_raw"):
-                # Real OCR failure
-                return jsonify(result), 500
-            elif result.get("error") and result.get("latex_raw"):
-                # OCR succeeded but solving failed - this is not a 500 error
-                print(f"[DEBUG] OCR succeeded but solving failed: {result['error']}")
-                result["warning"] = result.pop("error")  # Convert error to warning
-                return jsonify(result), 200
-            else:
-                # Complete success
-                return jsonify(result), 200
+        result = lcd.process_image(source)
+        print(f"[DEBUG] OCR result: {result}")
+        status = _ocr_result_status(result)
+        response = jsonify(result)
+        if status == 503:
+            response.headers['Retry-After'] = str(max(1, int(result.get('retry_after', 0) + 0.999)))
+        return response, status
+        
+    except Exception as e:
+        print(f"[DEBUG] API exception: {e}")
+        return jsonify({'error': f'OCR processing failed: {str(e)}'}), 500
+
+@app.route('/api/ocr/lines', methods=['POST'])
+def process_ocr_lines():
+    """
+    OCR a multi-line drawing: the page is split into lines (by stroke
+    bounding boxes for stroke payloads, ink projection for images) and the
+    lines are recognised concurrently. Returns the lines top to bottom.
+    """
+    try:
+        if not OCR_AVAILABLE:
+            return jsonify({"error": "OCR module not available"}), 500
+
+        source, error_response = _ocr_source_from_request(rasterize=False)
+        if error_response:
+            return error_response
+        if request.is_json:
+            result = lcd.process_lines(strokes=source)
         else:
-            # Fallback if OCR not available
-            result = {
-                "error": "OCR module not available"
-            }
-            # Clean up temp file before returning
-            if temp_file:
-                os.unlink(temp_file.name)
+            result = lcd.process_lines(image=source)
+
+        for line in result['lines']:
+            line['status'] = _ocr_result_status(line)
+        if result.get('ocr_unavailable'):
+            result['error'] = 'OCR unavailable'
+            return jsonify(result), 503
+        if result['error'] or not any(line['status'] == 200 for line in result['lines']):
+            result['error'] = result['error'] or 'OCR failed for every line'
             return jsonify(result), 500
-        
+        return jsonify(result), 200
+
     except Exception as e:
         print(f"[DEBUG] API exception: {e}")
-        # Clean up temp file before returning error
-        if temp_file:
-            os.unlink(temp_file.name)
         return jsonify({'error': f'OCR processing failed: {str(e)}'}), 500
 
+@app.route('/api/ocr/jobs', methods=['POST'])
+def submit_ocr_job():
+    """Queue a drawing for OCR and return a job id immediately (202)"""
+    try:
+        if not OCR_AVAILABLE:
+            return jsonify({"error": "OCR module not available"}), 500
+
+        source, error_response = _ocr_source_from_request()
+        if error_response:
+            return error_response
+        if not isinstance(source, Image.Image):
+            # The request stream is gone once we return, read it now
+            source = lcd.read_image_source(source)
+
+        try:
+            job_id = lcd.ocr_jobs.submit(source)
+        except lcd.OCRQueueFull as e:
+            return jsonify({'error': str(e), 'queue': lcd.ocr_jobs.stats()}), 503
+        return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+    except Exception as e:
+        print(f"[DEBUG] API exception: {e}")
+        return jsonify({'error': f'OCR job submission failed: {str(e)}'}), 500
+
+@app.route('/api/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """
+    Poll an OCR job. ?wait=N long-polls up to N seconds (max 30) for it to
+    finish; the result uses the same shape as /api/ocr/process.
+    """
+    if not OCR_AVAILABLE:
+        return jsonify({"error": "OCR module not available"}), 500
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    job = lcd.ocr_jobs.get(job_id, wait=max(wait, 0))
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job id'}), 404
+    if job['status'] == 'done':
+        job['result_status'] = _ocr_result_status(job['result'])
+    return jsonify(job), 200
+
+@app.route('/api/ocr/jobs', methods=['GET'])
+def ocr_job_stats():
+    """Queue depth and throughput counters for the OCR job queue"""
+    if not OCR_AVAILABLE:
+        return jsonify({"error": "OCR module not available"}), 500
+    return jsonify(lcd.ocr_jobs.stats())
+
 @app.route('/api/solver/solve', methods=['POST'])
 def solve_equation():
     """Solve the given equation"""
@@ -156,14 +258,211 @@ def solve_equation():
         print(f"[DEBUG] API solver exception: {e}")
         return jsonify({'error': f'Equation solving failed: {str(e)}'}), 500
 
+def _submission_from_json(data, default_equation=None):
+    """
+    Validate one grading submission {"equation", "lines", "final_answer",
+    "student_id"}. Returns (submission, None) or (None, error message).
+    """
+    if not isinstance(data, dict):
+        return None, 'Submission must be an object'
+    equation = data.get('equation') or default_equation
+    if not isinstance(equation, str) or not equation.strip():
+        return None, 'No equation provided'
+    lines = data.get('lines', [])
+    if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+        return None, 'lines must be a list of strings'
+    final_answer = data.get('final_answer')
+    if final_answer is not None and not isinstance(final_answer, str):
+        return None, 'final_answer must be a string'
+    if not lines and not final_answer:
+        return None, 'No solution lines or final answer provided'
+    return {'student_id': data.get('student_id'), 'equation': equation.strip(),
+            'lines': lines, 'final_answer': final_answer}, None
+
+@app.route('/api/grade', methods=['POST'])
+def grade_solution():
+    """Grade one student's solution: per-criterion flags, correctness and feedback"""
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        submission, error = _submission_from_json(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        result = solution_grader.grade_submission(submission['equation'], submission['lines'],
+                                                  submission['final_answer'])
+        result['student_id'] = submission['student_id']
+        return jsonify(result), 200
+        
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Grading failed: {str(e)}'}), 500
+
+@app.route('/api/grade/batch', methods=['POST'])
+def grade_solutions_batch():
+    """
+    Grade a class in parallel. Body: {"equation": shared default,
+    "submissions": [{"student_id", "equation", "lines", "final_answer"}, ...]}.
+    Returns per-student results in input order plus class aggregates.
+    """
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        data = request.get_json(silent=True) or {}
+        submissions = data.get('submissions')
+        if not isinstance(submissions, list) or not submissions:
+            return jsonify({'error': 'No submissions provided'}), 400
+        if len(submissions) > solution_grader.MAX_BATCH_SUBMISSIONS:
+            return jsonify({'error': f'Too many submissions (max {solution_grader.MAX_BATCH_SUBMISSIONS})'}), 400
+        
+        validated = []
+        for index, item in enumerate(submissions):
+            submission, error = _submission_from_json(item, data.get('equation'))
+            if error:
+                return jsonify({'error': f'Submission {index}: {error}'}), 400
+            validated.append(submission)
+        
+        return jsonify(solution_grader.grade_batch(validated)), 200
+        
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Batch grading failed: {str(e)}'}), 500
+
+@app.route('/api/grade/hint', methods=['POST'])
+def grade_hint():
+    """
+    Next-step hint for {"equation", "lines": [...]} (or "line"): the latest
+    recognised line is matched to the equation's cached step graph.
+    """
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        data = request.get_json(silent=True) or {}
+        equation = data.get('equation')
+        if not isinstance(equation, str) or '=' not in equation:
+            return jsonify({'error': "No equation provided (expected 'lhs = rhs')"}), 400
+        lines = [data['line']] if 'line' in data else data.get('lines', [])
+        if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+            return jsonify({'error': 'lines must be a list of strings'}), 400
+        try:
+            reference = solution_grader.get_reference(equation.strip())
+        except Exception as e:
+            return jsonify({'error': f'Invalid equation: {str(e)}'}), 400
+        return jsonify(solution_grader.next_step_hint(reference, lines)), 200
+
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Hint failed: {str(e)}'}), 500
+
+@app.route('/api/grade/sessions', methods=['POST'])
+def create_grading_session():
+    """
+    Start a line-by-line grading session for {"equation"}. The equation is
+    analysed once; lines are then posted one at a time.
+    """
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        data = request.get_json(silent=True) or {}
+        equation = data.get('equation')
+        if not isinstance(equation, str) or '=' not in equation:
+            return jsonify({'error': "No equation provided (expected 'lhs = rhs')"}), 400
+        try:
+            session = solution_grader.grading_sessions.create(equation.strip())
+        except Exception as e:
+            return jsonify({'error': f'Invalid equation: {str(e)}'}), 400
+        return jsonify({'session_id': session.session_id,
+                        'equation_info': session.reference.info(),
+                        'ttl': solution_grader.grading_sessions.ttl}), 201
+
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Could not start grading session: {str(e)}'}), 500
+
+@app.route('/api/grade/sessions/<session_id>/lines', methods=['POST'])
+def add_session_lines(session_id):
+    """Add {"line"} (or {"lines": [...]}) to a session; returns each new line's analysis"""
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        session = solution_grader.grading_sessions.get(session_id)
+        if session is None:
+            return jsonify({'error': 'Unknown or expired session id'}), 404
+        data = request.get_json(silent=True) or {}
+        lines = [data['line']] if 'line' in data else data.get('lines')
+        if not isinstance(lines, list) or not lines or not all(isinstance(line, str) for line in lines):
+            return jsonify({'error': 'line must be a string (or lines a list of strings)'}), 400
+        return jsonify({'session_id': session_id,
+                        'lines': [session.add_line(line) for line in lines],
+                        'line_count': len(session.lines)}), 200
+
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Line analysis failed: {str(e)}'}), 500
+
+@app.route('/api/grade/sessions/<session_id>/hint', methods=['GET'])
+def grading_session_hint(session_id):
+    """Next-step hint for the lines a session has seen so far"""
+    if not GRADER_AVAILABLE:
+        return jsonify({'error': 'Grader module not available'}), 500
+    session = solution_grader.grading_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session id'}), 404
+    result = session.hint()
+    result['session_id'] = session_id
+    return jsonify(result), 200
+
+@app.route('/api/grade/sessions/<session_id>', methods=['GET', 'DELETE'])
+def grading_session_result(session_id):
+    """
+    GET: the grade of the lines so far (same shape as /api/grade), from the
+    session's accumulated state; ?final_answer= overrides the last x = line.
+    DELETE: end the session.
+    """
+    try:
+        if not GRADER_AVAILABLE:
+            return jsonify({'error': 'Grader module not available'}), 500
+        if request.method == 'DELETE':
+            if solution_grader.grading_sessions.close(session_id) is None:
+                return jsonify({'error': 'Unknown or expired session id'}), 404
+            return jsonify({'session_id': session_id, 'closed': True}), 200
+        session = solution_grader.grading_sessions.get(session_id)
+        if session is None:
+            return jsonify({'error': 'Unknown or expired session id'}), 404
+        result = session.result(request.args.get('final_answer'))
+        result.update({'session_id': session_id, 'line_count': len(session.lines)})
+        return jsonify(result), 200
+
+    except Exception as e:
+        print(f"[DEBUG] API grading exception: {e}")
+        return jsonify({'error': f'Grading failed: {str(e)}'}), 500
+
+@app.route('/api/ocr/cache', methods=['GET'])
+def ocr_cache_stats():
+    """Hit/miss counters for the perceptual-hash OCR result cache"""
+    if not OCR_AVAILABLE:
+        return jsonify({'error': 'OCR module not available'}), 500
+    return jsonify(lcd.ocr_cache.stats())
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    health = {
         'status': 'healthy',
         'ocr_available': OCR_AVAILABLE,
-        'solver_available': SOLVER_AVAILABLE
-    })
+        'solver_available': SOLVER_AVAILABLE,
+        'grader_available': GRADER_AVAILABLE
+    }
+    if OCR_AVAILABLE:
+        health['ocr_client'] = lcd.simpletex_client.stats()
+        health['ocr_queue'] = lcd.ocr_jobs.stats()
+        health['latex_conversion'] = lcd.latex_converter.stats()
+        health['ocr_breaker'] = lcd.ocr_breaker.stats()
+        if health['ocr_breaker']['state'] != 'closed':
+            health['status'] = 'degraded'
+    if GRADER_AVAILABLE:
+        health['equation_references'] = solution_grader.reference_cache.stats()
+        health['grading_sessions'] = solution_grader.grading_sessions.stats()
+    return jsonify(health)
 
 if __name__ == '__main__':
     print("Starting Drawing Solver API...")
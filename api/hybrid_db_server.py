@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import os
@@ -14,7 +14,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the rational function calculator
 try:
-    from yessss import RationalFunctionCalculator
+    from yessss import (RationalFunctionCalculator, analysis_cache, fields_request, cache_request,
+                        batch_request, COMMON_FUNCTIONS)
     CALCULATOR_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Rational function calculator not available: {e}")
@@ -707,18 +708,8 @@ def analyze_rational_function():
                 'error': 'No function provided'
             }), 400
         
-        # Create calculator instance
-        calculator = RationalFunctionCalculator()
-        
-        # Capture the output by redirecting stdout
-        import io
-        from contextlib import redirect_stdout
-        
-        output = io.StringIO()
-        with redirect_stdout(output):
-            calculator.analyze_rational_function(function_str)
-        
-        analysis_output = output.getvalue()
+        # Equivalent inputs share one cached report
+        analysis_output = analysis_cache.analysis_report(function_str)
         
         return jsonify({
             'success': True,
@@ -873,6 +864,66 @@ def find_asymptotes():
             'error': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/rational-function/fields', methods=['POST'])
+def analyze_fields():
+    """Compute only the requested analysis fields with a single parse"""
+    if not CALCULATOR_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Rational function calculator not available'
+        }), 503
+    
+    try:
+        payload, status = fields_request(request.get_json(force=True))
+        return jsonify(payload), status
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/rational-function/cache', methods=['GET', 'POST'])
+def analysis_cache_endpoint():
+    """Report analysis cache statistics, or warm it with a list of functions"""
+    if not CALCULATOR_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Rational function calculator not available'
+        }), 503
+    
+    try:
+        data = (request.get_json(force=True) or {}) if request.method == 'POST' else None
+        payload, status = cache_request(data)
+        return jsonify(payload), status
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/rational-function/batch', methods=['POST'])
+def analyze_batch_endpoint():
+    """Analyze many functions in parallel, streaming one JSON line per input"""
+    if not CALCULATOR_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Rational function calculator not available'
+        }), 503
+    
+    try:
+        payload, status = batch_request(request.get_json(force=True))
+        if status != 200:
+            return jsonify(payload), status
+        return Response(stream_with_context(payload), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
 @app.route('/api/rational-function/health', methods=['GET'])
 def rational_function_health():
     """Health check for rational function calculator"""
@@ -886,6 +937,8 @@ def rational_function_health():
 
 if __name__ == '__main__':
     init_db()
+    if CALCULATOR_AVAILABLE:
+        analysis_cache.warm(COMMON_FUNCTIONS)
     port = int(os.environ.get('PORT', '5055'))
     host = os.environ.get('HOST', '0.0.0.0')
     print(f"Hybrid DB server running on http://{host}:{port}")
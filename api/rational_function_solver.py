@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import sys
 import os
@@ -10,14 +10,22 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the solver functions
 try:
-    from yessss import RationalFunctionCalculator
+    from yessss import (RationalFunctionCalculator, analysis_cache, fields_request, cache_request,
+                        batch_request, COMMON_FUNCTIONS)
 except ImportError as e:
     print(f"Error importing solver: {e}")
+    analysis_cache = None
+    COMMON_FUNCTIONS = []
     # Fallback functions if import fails
     class RationalFunctionCalculator:
         def analyze_rational_function(self, func_str):
             return "Solver not available"
 
+    def _solver_unavailable(data=None):
+        return {'success': False, 'error': 'Solver not available'}, 503
+
+    fields_request = cache_request = batch_request = _solver_unavailable
+
 app = Flask(__name__)
 CORS(app)
 
@@ -34,19 +42,8 @@ def analyze_rational_function():
                 'error': 'No function provided'
             }), 400
         
-        # Create calculator instance
-        calculator = RationalFunctionCalculator()
-        
-        # Capture the output by redirecting stdout
-        import io
-        import sys
-        from contextlib import redirect_stdout
-        
-        output = io.StringIO()
-        with redirect_stdout(output):
-            calculator.analyze_rational_function(function_str)
-        
-        analysis_output = output.getvalue()
+        # Equivalent inputs share one cached report
+        analysis_output = analysis_cache.analysis_report(function_str)
         
         # Parse the output to extract structured data
         analysis_data = parse_analysis_output(analysis_output, function_str)
@@ -224,6 +221,48 @@ def find_asymptotes():
             'error': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/rational-function/fields', methods=['POST'])
+def analyze_fields():
+    """Compute only the requested analysis fields with a single parse"""
+    try:
+        payload, status = fields_request(request.get_json())
+        return jsonify(payload), status
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/rational-function/cache', methods=['GET', 'POST'])
+def analysis_cache_endpoint():
+    """Report analysis cache statistics, or warm it with a list of functions"""
+    try:
+        data = (request.get_json() or {}) if request.method == 'POST' else None
+        payload, status = cache_request(data)
+        return jsonify(payload), status
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/rational-function/batch', methods=['POST'])
+def analyze_batch_endpoint():
+    """Analyze many functions in parallel, streaming one JSON line per input"""
+    try:
+        payload, status = batch_request(request.get_json())
+        if status != 200:
+            return jsonify(payload), status
+        return Response(stream_with_context(payload), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
 def parse_analysis_output(output, function_str):
     """Parse the analysis output to extract structured data"""
     try:
@@ -333,4 +372,6 @@ def health_check():
     })
 
 if __name__ == '__main__':
+    if analysis_cache is not None:
+        analysis_cache.warm(COMMON_FUNCTIONS)
     app.run(debug=True, host='0.0.0.0', port=5001)
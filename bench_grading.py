@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed benchmark for solution grading (solution_grader.py).
+
+Grades a labelled corpus of student solutions and reports per-submission
+latency percentiles plus agreement with the expected labels, overall, per
+category and per criterion. Categories: correct, wrong_answer,
+missing_restrictions, missing_verification and ocr_noisy (correct work with
+the kind of damage OCR does to a line).
+
+Everything runs in-process through solution_grader.grade_submission: no
+Tkinter UI, no SimpleTex. The built-in corpus is derived from
+BASE_SOLUTIONS; pass --corpus to grade a JSON/JSONL file of entries shaped
+like {"id", "category", "equation", "lines", "final_answer", "expected":
+{"correct": bool, "<criterion>": bool, ...}} (--write-corpus dumps the
+built-in one in that format).
+
+Usage:
+    python bench_grading.py
+    python bench_grading.py --repeat 20 --noisy-copies 3 --json report.json
+    python bench_grading.py --cold --corpus class_solutions.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import solution_grader
+
+CATEGORIES = ["correct", "wrong_answer", "missing_restrictions", "missing_verification", "ocr_noisy"]
+
+# Complete, correct worked solutions. `restriction`, `verification` and
+# `answers` are indices into `lines`; `wrong_answer` replaces the answers
+BASE_SOLUTIONS = [
+    {
+        "equation": "(x+2)/(x-1)=2",
+        "lines": ["Denominators: x-1", "Restriction: x ≠ 1", "Multiply both sides by (x-1)",
+                  "x+2 = 2(x-1)", "x+2 = 2x-2", "x = 4", "Check: LHS = 6/3 = 2 = RHS"],
+        "restriction": [1], "verification": [6], "answers": [5],
+        "wrong_answer": "x = 0",
+    },
+    {
+        "equation": "1/x + 1/(x+1) = 5/6",
+        "lines": ["Denominators: x, x+1", "Restrictions: x ≠ 0, x ≠ -1", "LCD = 6x(x+1)",
+                  "6(x+1) + 6x = 5x(x+1)", "5x² - 7x - 6 = 0", "(5x+3)(x-2) = 0",
+                  "x = -3/5", "x = 2", "Check x = 2: 1/2 + 1/3 = 5/6"],
+        "restriction": [1], "verification": [8], "answers": [6, 7],
+        "wrong_answer": "x = -7",
+    },
+    {
+        "equation": "x/(x-2) + 3/(x+2) = 1",
+        "lines": ["Denominators: x-2, x+2", "Restrictions: x ≠ 2, x ≠ -2", "LCD = (x-2)(x+2)",
+                  "x(x+2) + 3(x-2) = (x-2)(x+2)", "x² + 5x - 6 = x² - 4", "5x = 2", "x = 2/5",
+                  "Check: LHS = (2/5)/(-8/5) + 3/(12/5) = 1 = RHS"],
+        "restriction": [1], "verification": [7], "answers": [6],
+        "wrong_answer": "x = -2/5",
+    },
+    {
+        "equation": "2/(x+3) = 1/(x-1)",
+        "lines": ["Denominators: x+3, x-1", "Restrictions: x ≠ -3, x ≠ 1",
+                  "Multiply both sides by (x+3)(x-1)", "2(x-1) = x+3", "2x - 2 = x + 3", "x = 5",
+                  "Check: LHS = 2/8 = 1/4, RHS = 1/4"],
+        "restriction": [1], "verification": [6], "answers": [5],
+        "wrong_answer": "x = 1",
+    },
+    {
+        "equation": "(x-4)/(x+2) = 1/2",
+        "lines": ["Denominator: x+2", "Restriction: x ≠ -2", "Multiply both sides by 2(x+2)",
+                  "2(x-4) = x+2", "2x - 8 = x + 2", "x = 10", "Check: LHS = 6/12 = 1/2 = RHS"],
+        "restriction": [1], "verification": [6], "answers": [5],
+        "wrong_answer": "x = 6",
+    },
+]
+
+ALL_MET = {name: True for name in solution_grader.CRITERIA}
+
+
+def ocr_noise(line, rng):
+    """`line` with one or two OCR-style slips: spacing, letter case, bracket and symbol swaps"""
+    slips = [
+        lambda s: s.replace(" ", ""),
+        lambda s: s.replace(" = ", "  =  "),
+        lambda s: s.replace("x", "X"),
+        lambda s: s.replace("(", "[").replace(")", "]"),
+        lambda s: s.replace("≠", "!="),
+        lambda s: s.replace("²", "^2"),
+        lambda s: s.replace("-", "−"),
+    ]
+    for slip in rng.sample(slips, rng.randint(1, 2)):
+        line = slip(line)
+    return line
+
+
+def build_corpus(noisy_copies=1, seed=0):
+    """Labelled entries for every BASE_SOLUTIONS equation in every category"""
+    rng = random.Random(seed)
+    corpus = []
+    for number, base in enumerate(BASE_SOLUTIONS):
+        lines = base["lines"]
+
+        def entry(category, entry_lines, expected, suffix=""):
+            corpus.append({"id": f"eq{number}-{category}{suffix}", "category": category,
+                           "equation": base["equation"], "lines": entry_lines, "expected": expected})
+
+        entry("correct", list(lines), dict(ALL_MET, correct=True))
+        # The work up to the answer, then a wrong answer (and no check of it)
+        entry("wrong_answer", lines[:base["answers"][0]] + [base["wrong_answer"]],
+              {"correct": False, "final_answer": False})
+        entry("missing_restrictions", [line for i, line in enumerate(lines) if i not in base["restriction"]],
+              {"correct": True, "restrictions": False, "final_answer": True})
+        entry("missing_verification", [line for i, line in enumerate(lines) if i not in base["verification"]],
+              {"correct": True, "verification": False, "final_answer": True})
+        for copy in range(noisy_copies):
+            entry("ocr_noisy", [ocr_noise(line, rng) for line in lines],
+                  {"correct": True, "final_answer": True}, suffix=f"-{copy}")
+    return corpus
+
+
+def load_corpus(path):
+    """Labelled entries from a JSON list or a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def disagreements(entry, result):
+    """[(label, expected, got)] for every labelled field the grade gets wrong"""
+    wrong = []
+    for label, expected in entry["expected"].items():
+        if label == "correct":
+            got = bool(result["correct"])
+        else:
+            got = bool(result["criteria"].get(label, {}).get("met"))
+        if got != expected:
+            wrong.append((label, expected, got))
+    return wrong
+
+
+def run_benchmark(corpus, repeat=1, cold=False):
+    """Grade the corpus `repeat` times; returns a report dict"""
+    latencies = []
+    by_category = defaultdict(lambda: {"submissions": 0, "agree": 0})
+    by_label = defaultdict(lambda: {"labelled": 0, "agree": 0})
+    errors = Counter()
+    misses = []
+
+    started = time.perf_counter()
+    for run in range(repeat):
+        if cold:
+            solution_grader.reference_cache.clear()
+            solution_grader.parse_step.cache_clear()
+            solution_grader.step_values.cache_clear()
+        for entry in corpus:
+            start = time.perf_counter()
+            result = solution_grader.grade_submission(entry["equation"], entry["lines"],
+                                                      entry.get("final_answer"))
+            latencies.append(time.perf_counter() - start)
+            if result["error"]:
+                errors[result["error"][:60]] += 1
+            wrong = disagreements(entry, result)
+            category = by_category[entry.get("category", "unlabelled")]
+            category["submissions"] += 1
+            category["agree"] += not wrong
+            wrong_labels = {label for label, _, _ in wrong}
+            for label in entry["expected"]:
+                by_label[label]["labelled"] += 1
+                by_label[label]["agree"] += label not in wrong_labels
+            if wrong and run == 0:
+                misses.append({"id": entry.get("id"), "category": entry.get("category"),
+                               "disagreements": [{"label": label, "expected": expected, "got": got}
+                                                 for label, expected, got in wrong]})
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    agree = sum(c["agree"] for c in by_category.values())
+    return {
+        "submissions": len(corpus),
+        "repeat": repeat,
+        "cold": cold,
+        "graded": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_s": round(total / wall, 1) if wall else None,
+        "latency_ms": {name: round(_percentile(latencies, q) * 1000, 2)
+                       for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))}
+                      if latencies else {},
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "agreement": round(agree / total, 4) if total else None,
+        "categories": {name: dict(c, agreement=round(c["agree"] / c["submissions"], 4))
+                       for name, c in sorted(by_category.items())},
+        "labels": {name: dict(c, agreement=round(c["agree"] / c["labelled"], 4))
+                   for name, c in sorted(by_label.items())},
+        "errors": dict(errors.most_common()),
+        "disagreements": misses,
+        "reference_cache": solution_grader.reference_cache.stats(),
+    }
+
+
+def print_report(report):
+    print("\n📊 Grading benchmark")
+    print(f"   Submissions: {report['submissions']} x {report['repeat']}"
+          f"{' (cold caches)' if report['cold'] else ''}")
+    print(f"   Wall time:   {report['wall_seconds']} s ({report['throughput_per_s']} grades/s)")
+    print("   Latency:     " + ", ".join(f"{k} {v} ms" for k, v in report["latency_ms"].items())
+          + f", max {report['max_ms']} ms")
+    print(f"   Agreement:   {report['agreement']:.1%}")
+    print("   By category:")
+    for name, c in report["categories"].items():
+        print(f"     {name:22s} {c['agree']:4d}/{c['submissions']:<4d} {c['agreement']:.1%}")
+    print("   By label:")
+    for name, c in report["labels"].items():
+        print(f"     {name:22s} {c['agree']:4d}/{c['labelled']:<4d} {c['agreement']:.1%}")
+    if report["errors"]:
+        print(f"   Errors: {report['errors']}")
+    for miss in report["disagreements"][:10]:
+        print(f"   ❌ {miss['id']}: " + ", ".join(f"{d['label']} expected {d['expected']} got {d['got']}"
+                                              for d in miss["disagreements"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grading accuracy and latency")
+    parser.add_argument("--corpus", help="labelled JSON/JSONL corpus (default: built-in)")
+    parser.add_argument("--noisy-copies", type=int, default=2,
+                        help="OCR-noisy variants per built-in solution")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the corpus")
+    parser.add_argument("--cold", action="store_true",
+                        help="clear the equation-reference and step-parse caches before each pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write-corpus", metavar="PATH", help="write the corpus as JSONL and exit")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.noisy_copies, args.seed)
+    if not corpus:
+        print("❌ Empty corpus")
+        return 1
+    if args.write_corpus:
+        with open(args.write_corpus, "w", encoding="utf-8") as f:
+            for entry in corpus:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"📝 {len(corpus)} labelled submissions written to {args.write_corpus}")
+        return 0
+
+    report = run_benchmark(corpus, repeat=args.repeat, cold=args.cold)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n📝 Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
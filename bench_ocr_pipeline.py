@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the OCR pipeline behind /api/ocr/process.
+
+Drives the endpoint with a corpus of canvas images at a fixed concurrency
+and reports throughput, latency percentiles and an error breakdown for the
+whole lcd.process_image path (preprocessing, cache, HTTP client, LaTeX
+parsing and solving).
+
+By default everything runs in-process: the Flask app from
+api/drawing_solver_api.py is called through its test client and SimpleTex
+is replaced by simpletex_standin.SimpleTexStandIn with fixtures for every
+corpus image. Pass --api-url to benchmark a running server instead (start
+it with SIMPLETEX_API_URL pointing at a stand-in).
+
+Usage:
+    python bench_ocr_pipeline.py --synthetic 20 --requests 200 --concurrency 8
+    python bench_ocr_pipeline.py --corpus drawings/ --latency-ms 400 --error-rate 0.05
+    python bench_ocr_pipeline.py --api-url http://localhost:5001/api/ocr/process
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+
+import lcd
+from simpletex_standin import SimpleTexStandIn, image_key
+
+
+def synthetic_corpus(count, seed=0, size=(600, 400)):
+    """Canvas-like PNGs with a few random pen strokes each"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        img = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(img)
+        x = rng.randint(40, 120)
+        baseline = rng.randint(150, 250)
+        for _ in range(rng.randint(4, 9)):
+            points = [(x + rng.randint(0, 30), baseline + rng.randint(-40, 40))
+                      for _ in range(rng.randint(2, 6))]
+            draw.line(points, fill="black", width=3)
+            x += rng.randint(25, 50)
+        corpus.append(lcd.read_image_source(img))
+    return corpus
+
+
+def load_corpus(directory):
+    paths = sorted(p for ext in ("*.png", "*.jpg", "*.jpeg")
+                   for p in glob.glob(os.path.join(directory, ext)))
+    corpus = []
+    for path in paths:
+        with open(path, "rb") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def standin_fixtures(corpus):
+    """Fixture per corpus image, keyed the way the pipeline will upload it"""
+    fixtures = {}
+    for i, data in enumerate(corpus):
+        try:
+            png_bytes, _ = lcd.preprocess_image_for_ocr(data)
+        except (ValueError, OSError):
+            continue
+        fixtures[image_key(png_bytes)] = f"x+{i}={i + 1}"
+    return fixtures
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _classify(status, payload):
+    if status == 200:
+        return "ok_with_warning" if payload.get("warning") else "ok"
+    return f"{status}: {str(payload.get('error', ''))[:60]}"
+
+
+def run_benchmark(corpus, total_requests, concurrency, api_url=None):
+    """Send total_requests uploads (cycling the corpus); returns a report dict"""
+    local = threading.local()
+    if not api_url:
+        import drawing_solver_api
+
+    def post(index):
+        data = corpus[index % len(corpus)]
+        start = time.perf_counter()
+        try:
+            if api_url:
+                resp = requests.post(api_url, files={"image": ("drawing.png", data, "image/png")},
+                                     timeout=60)
+                status, payload = resp.status_code, resp.json()
+            else:
+                if not hasattr(local, "client"):
+                    local.client = drawing_solver_api.app.test_client()
+                resp = local.client.post("/api/ocr/process",
+                                         data={"image": (io.BytesIO(data), "drawing.png")},
+                                         content_type="multipart/form-data")
+                status, payload = resp.status_code, resp.get_json() or {}
+            outcome = _classify(status, payload)
+        except Exception as e:
+            outcome = f"exception: {type(e).__name__}"
+        return time.perf_counter() - start, outcome
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(post, range(total_requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in samples)
+    outcomes = Counter(outcome for _, outcome in samples)
+    succeeded = outcomes["ok"] + outcomes["ok_with_warning"]
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "corpus_size": len(corpus),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total_requests / wall, 2) if wall else None,
+        "success_rate": round(succeeded / total_requests, 4) if total_requests else None,
+        "latency_ms": {name: round(_percentile(latencies, q) * 1000, 1)
+                       for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))}
+                      if latencies else {},
+        "outcomes": dict(outcomes.most_common()),
+    }
+
+
+def print_report(report):
+    print("\n📊 OCR pipeline benchmark")
+    print(f"   Requests:    {report['requests']} (concurrency {report['concurrency']}, "
+          f"corpus {report['corpus_size']})")
+    print(f"   Wall time:   {report['wall_seconds']} s")
+    print(f"   Throughput:  {report['throughput_rps']} req/s")
+    print(f"   Success:     {report['success_rate']:.1%}")
+    print("   Latency:     " + ", ".join(f"{k} {v} ms" for k, v in report["latency_ms"].items()))
+    print("   Outcomes:")
+    for outcome, count in report["outcomes"].items():
+        print(f"     {count:6d}  {outcome}")
+    for section in ("ocr_cache", "ocr_client", "ocr_breaker", "standin"):
+        if section in report:
+            print(f"   {section}: {report[section]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/ocr/process end to end")
+    parser.add_argument("--corpus", help="directory of canvas images (png/jpg)")
+    parser.add_argument("--synthetic", type=int, default=20,
+                        help="number of generated canvases when --corpus is not given")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--api-url", help="benchmark a running server instead of in-process")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="stand-in median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the OCR result cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic, args.seed)
+    if not corpus:
+        print("❌ Empty corpus")
+        return 1
+
+    standin = None
+    if not args.api_url:
+        standin = SimpleTexStandIn(fixtures=standin_fixtures(corpus), default_latex="x=0",
+                                   latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                                   error_rate=args.error_rate, seed=args.seed)
+        lcd.SIMPLETEX_API_URL = standin.start()
+        if args.no_cache:
+            lcd.ocr_cache = lcd.OCRResultCache(maxsize=0)
+
+    try:
+        report = run_benchmark(corpus, args.requests, args.concurrency, api_url=args.api_url)
+        if standin:
+            report.update({"ocr_cache": lcd.ocr_cache.stats(),
+                           "ocr_client": lcd.simpletex_client.stats(),
+                           "ocr_breaker": lcd.ocr_breaker.stats(),
+                           "standin": standin.stats()})
+    finally:
+        if standin:
+            standin.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
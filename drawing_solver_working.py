@@ -6,7 +6,6 @@ Working Drawing Solver - OCR button included with graceful dependency handling
 import tkinter as tk
 from tkinter import ttk, messagebox
 import os
-import tempfile
 
 # Try to import modules, but handle missing dependencies gracefully
 try:
@@ -262,16 +261,8 @@ class WorkingDrawingSolverApp:
             # Get drawing as image
             img = self.drawing_area.get_drawing_as_image()
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
-            # Process through OCR
-            result = lcd.process_image(temp_file.name)
-            
-            # Clean up temp file
-            os.unlink(temp_file.name)
+            # Process through OCR (in memory, no temp file)
+            result = lcd.process_image(img)
             
             if result["error"]:
                 messagebox.showerror("OCR Error", f"Failed to process image: {result['error']}")
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Headless batch grading of a whole section's worksheets.
+
+Takes a directory (or a .zip / .tar / .tar.gz archive of one) with one
+submission per student and writes a gradebook, without any prompts:
+
+    section/
+        equation.txt            the equation, e.g. (x+2)/(x-1)=2 (or --equation)
+        alice.txt               transcribed solution, one line per line
+        bob/
+            01.png 02.png ...   one image per solution line, OCRed in order
+            answer.txt          optional final answer ("x = 4")
+        carol/
+            page.png            a whole page: segmented into lines, then OCRed
+            equation.txt        optional per-student equation
+        dave/
+            lines.txt           transcribed text also works inside a folder
+
+Line images go through lcd (SimpleTex) on a thread pool; grading runs on a
+process pool. Every finished student is appended to grading_manifest.jsonl
+in the output directory, so an interrupted run picks up where it stopped:
+students whose files are unchanged since they were graded are skipped, and
+failures (e.g. OCR unavailable) are retried. The report is written as
+grades.csv, grades.jsonl and summary.json.
+
+Usage:
+    python grade_worksheets.py section/ --equation "(x+2)/(x-1)=2"
+    python grade_worksheets.py section.zip --out grades/ --workers 4 --ocr-workers 8
+    python grade_worksheets.py section/ --restart
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import sympy as sp
+
+import solution_grader
+
+try:
+    import lcd
+    OCR_AVAILABLE = True
+except ImportError as e:
+    print(f"OCR module not available: {e}")
+    OCR_AVAILABLE = False
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+TEXT_NAMES = ("lines.txt", "solution.txt")
+MANIFEST_NAME = "grading_manifest.jsonl"
+OCR_WORKERS = 4
+
+
+def _natural_key(name):
+    """Sort "2.png" before "10.png" """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def _read_text(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return f.read()
+
+
+def _text_lines(path):
+    return [line.strip() for line in _read_text(path).splitlines() if line.strip()]
+
+
+def extract_archive(path, directory):
+    """Unpack a .zip or .tar[.gz] into `directory`, refusing members that escape it"""
+    root = os.path.realpath(directory)
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        names = archive.namelist()
+        members = None
+    elif tarfile.is_tarfile(path):
+        archive = tarfile.open(path)
+        # Regular files and folders only: no links or devices
+        members = [m for m in archive.getmembers() if m.isfile() or m.isdir()]
+        names = [m.name for m in members]
+    else:
+        raise ValueError(f"{path} is neither a directory nor a zip/tar archive")
+    with archive:
+        for name in names:
+            target = os.path.realpath(os.path.join(root, name))
+            if os.path.commonpath([root, target]) != root:
+                raise ValueError(f"Archive member escapes the extraction directory: {name}")
+        archive.extractall(root, members=members)
+    # An archive of a single folder: use that folder
+    entries = [e for e in os.listdir(root) if not e.startswith(('.', '__MACOSX'))]
+    if len(entries) == 1 and os.path.isdir(os.path.join(root, entries[0])):
+        return os.path.join(root, entries[0])
+    return root
+
+
+def discover_submissions(root, equation=None):
+    """
+    One submission per student file/folder under `root`:
+    {'student_id', 'equation', 'final_answer', 'text_lines' or 'images', 'files', 'fingerprint'}.
+    """
+    section_equation = equation
+    if section_equation is None and os.path.isfile(os.path.join(root, "equation.txt")):
+        section_equation = _read_text(os.path.join(root, "equation.txt")).strip()
+
+    submissions = []
+    for name in sorted(os.listdir(root), key=_natural_key):
+        path = os.path.join(root, name)
+        if name.startswith('.') or name == "equation.txt" or name == MANIFEST_NAME:
+            continue
+        submission = {'student_id': os.path.splitext(name)[0], 'equation': section_equation,
+                      'final_answer': None, 'text_lines': None, 'images': [], 'files': []}
+        if os.path.isfile(path) and name.lower().endswith(".txt"):
+            submission['text_lines'] = _text_lines(path)
+            submission['files'] = [path]
+        elif os.path.isdir(path) and not os.path.exists(os.path.join(path, MANIFEST_NAME)):
+            files = sorted((f for f in os.listdir(path) if not f.startswith('.')), key=_natural_key)
+            lower = {f.lower(): f for f in files}
+            if "equation.txt" in lower:
+                submission['equation'] = _read_text(os.path.join(path, lower["equation.txt"])).strip()
+            if "answer.txt" in lower:
+                submission['final_answer'] = _read_text(os.path.join(path, lower["answer.txt"])).strip() or None
+            text = next((lower[n] for n in TEXT_NAMES if n in lower), None)
+            if text:
+                submission['text_lines'] = _text_lines(os.path.join(path, text))
+            else:
+                submission['images'] = [os.path.join(path, f) for f in files
+                                        if f.lower().endswith(IMAGE_EXTENSIONS)]
+            submission['files'] = [os.path.join(path, f) for f in files]
+        else:
+            continue
+        submission['fingerprint'] = fingerprint(submission)
+        submissions.append(submission)
+    return submissions
+
+
+def fingerprint(submission):
+    """Hash of everything that decides a student's grade: equation, answer and file contents"""
+    digest = hashlib.sha256()
+    digest.update((submission['equation'] or "").encode())
+    digest.update((submission['final_answer'] or "").encode())
+    for path in submission['files']:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def ocr_line_text(result):
+    """Solution-line text from an lcd.process_image result ("lhs = rhs"), or None"""
+    sympy_out = result.get("sympy_out")
+    if isinstance(sympy_out, str) and sympy_out.strip():
+        if sympy_out.startswith("Eq("):
+            try:
+                eq = sp.sympify(sympy_out)
+                return f"{sp.sstr(eq.lhs)} = {sp.sstr(eq.rhs)}"
+            except Exception:
+                pass
+        return sympy_out.strip()
+    latex = result.get("latex_raw")
+    if isinstance(latex, str) and latex.strip():
+        return latex.strip()
+    return None
+
+
+def transcribe(submission):
+    """
+    The solution lines of a submission: read from text, or OCRed image by
+    image (a "page*" image is split into lines first). Returns
+    (lines, ocr_count, error).
+    """
+    if submission['text_lines'] is not None:
+        return submission['text_lines'], 0, None
+    if not submission['images']:
+        return [], 0, "No solution lines or line images found"
+    if not OCR_AVAILABLE:
+        return None, 0, "OCR module not available"
+
+    lines = []
+    for path in submission['images']:
+        name = os.path.basename(path)
+        if name.lower().startswith("page"):
+            page = lcd.process_lines(image=path)
+            if page.get("ocr_unavailable"):
+                return None, len(lines), "OCR unavailable"
+            results = page["lines"]
+            if page.get("error") and not results:
+                return None, len(lines), f"OCR failed on {name}: {page['error']}"
+        else:
+            results = [lcd.process_image(path)]
+        for result in results:
+            if result.get("ocr_unavailable"):
+                return None, len(lines), "OCR unavailable"
+            text = ocr_line_text(result)
+            if text is None:
+                return None, len(lines), f"OCR failed on {name}: {result.get('error') or 'no text'}"
+            lines.append(text)
+    return lines, len(lines), None
+
+
+def load_manifest(path):
+    """{student_id: latest manifest record}; unreadable trailing lines (a killed write) are ignored"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['student_id']] = record
+    return records
+
+
+def _record(submission, lines, ocr_lines, result=None, error=None):
+    record = {'student_id': submission['student_id'], 'fingerprint': submission['fingerprint'],
+              'equation': submission['equation'], 'lines': lines, 'ocr_lines': ocr_lines,
+              'graded_at': time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if error:
+        record.update(status='failed', error=error)
+    else:
+        record.update(status='graded', error=result.get('error'), result=result)
+    return record
+
+
+def grade_section(root, out_dir, equation=None, workers=None, ocr_workers=OCR_WORKERS,
+                  restart=False, log=print):
+    """
+    Grade every submission under `root`, appending each finished student to
+    the manifest in `out_dir`. Students already graded with the same
+    fingerprint are skipped unless `restart`. workers=0 grades in-process.
+    Returns (records in student order, counts).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if restart and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    done = load_manifest(manifest_path)
+
+    submissions = discover_submissions(root, equation)
+    pending = [s for s in submissions
+               if not (done.get(s['student_id'], {}).get('status') == 'graded'
+                       and done[s['student_id']]['fingerprint'] == s['fingerprint'])]
+    counts = {'students': len(submissions), 'skipped': len(submissions) - len(pending),
+              'graded': 0, 'failed': 0}
+    log(f"📚 {len(submissions)} submissions, {counts['skipped']} already graded, {len(pending)} to do")
+
+    grader = None
+    if workers != 0 and pending:
+        grader = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest, \
+                ThreadPoolExecutor(max_workers=max(1, ocr_workers), thread_name_prefix="worksheet-ocr") as ocr:
+
+            def finish(record):
+                manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+                done[record['student_id']] = record
+                counts['graded' if record['status'] == 'graded' else 'failed'] += 1
+                status = "✅" if record['status'] == 'graded' and record['result']['correct'] else \
+                    ("❌" if record['status'] == 'graded' else "⚠")
+                log(f"  {status} {record['student_id']}"
+                    + (f" - {record['error']}" if record.get('error') else ""))
+
+            transcriptions = {ocr.submit(transcribe, s): s for s in pending}
+            grading = {}
+            for future in as_completed(transcriptions):
+                submission = transcriptions[future]
+                try:
+                    lines, ocr_lines, error = future.result()
+                except Exception as e:
+                    lines, ocr_lines, error = None, 0, f"Transcription failed: {e}"
+                if not error and not submission['equation']:
+                    error = "No equation (add equation.txt or pass --equation)"
+                if error:
+                    finish(_record(submission, lines, ocr_lines, error=error))
+                    continue
+                args = (submission['equation'], lines, submission['final_answer'])
+                if grader is None:
+                    finish(_record(submission, lines, ocr_lines, solution_grader.grade_submission(*args)))
+                else:
+                    grading[grader.submit(solution_grader.grade_submission, *args)] = \
+                        (submission, lines, ocr_lines)
+            for future in as_completed(grading):
+                submission, lines, ocr_lines = grading[future]
+                try:
+                    finish(_record(submission, lines, ocr_lines, future.result()))
+                except Exception as e:
+                    finish(_record(submission, lines, ocr_lines, error=f"Grading failed: {e}"))
+    finally:
+        if grader is not None:
+            grader.shutdown()
+
+    records = [done[s['student_id']] for s in submissions if s['student_id'] in done]
+    return records, counts
+
+
+CSV_FIELDS = ['student_id', 'status', 'correct', 'final_answer'] + \
+    [f"{name}_met" for name in solution_grader.CRITERIA] + \
+    ['first_broken_line', 'likely_mistake', 'line_count', 'ocr_lines', 'error', 'ms']
+
+
+def _csv_row(record):
+    result = record.get('result') or {}
+    criteria = result.get('criteria', {})
+    diagnosis = criteria.get('final_answer', {}).get('diagnosis') or []
+    first_error = criteria.get('steps', {}).get('first_error')
+    row = {
+        'student_id': record['student_id'],
+        'status': record['status'],
+        'correct': result.get('correct') if record['status'] == 'graded' else None,
+        'final_answer': result.get('final_answer'),
+        'first_broken_line': None if first_error is None else first_error + 1,
+        'likely_mistake': diagnosis[0]['mistake'] if diagnosis else None,
+        'line_count': len(record.get('lines') or []),
+        'ocr_lines': record.get('ocr_lines'),
+        'error': record.get('error'),
+        'ms': result.get('ms'),
+    }
+    for name in solution_grader.CRITERIA:
+        row[f"{name}_met"] = criteria[name]['met'] if name in criteria else None
+    return row
+
+
+def write_report(records, out_dir, formats=("csv", "jsonl")):
+    """grades.csv / grades.jsonl plus summary.json; returns the summary"""
+    graded = [r['result'] for r in records if r['status'] == 'graded']
+    summary = solution_grader.summarize_grades(graded)
+    summary['failed'] = [{'student_id': r['student_id'], 'error': r['error']}
+                         for r in records if r['status'] != 'graded']
+    if "csv" in formats:
+        with open(os.path.join(out_dir, "grades.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(_csv_row(record))
+    if "jsonl" in formats:
+        with open(os.path.join(out_dir, "grades.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a directory or archive of worksheets, no prompts")
+    parser.add_argument("source", help="submissions directory, or a .zip/.tar/.tar.gz of one")
+    parser.add_argument("--equation", help="equation for every student (default: equation.txt)")
+    parser.add_argument("--out", help="output directory (default: <source>_grades)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="grading processes (default: CPU count; 0 grades in-process)")
+    parser.add_argument("--ocr-workers", type=int, default=OCR_WORKERS,
+                        help="students OCRed concurrently")
+    parser.add_argument("--format", default="csv,jsonl", help="report formats: csv, jsonl or both")
+    parser.add_argument("--restart", action="store_true", help="ignore the manifest and regrade everyone")
+    args = parser.parse_args()
+
+    source = args.source.rstrip("/\\")
+    out_dir = args.out or (os.path.splitext(source)[0] if os.path.isfile(source) else source) + "_grades"
+    started = time.perf_counter()
+    workdir = None
+    try:
+        if os.path.isdir(source):
+            root = source
+        elif os.path.isfile(source):
+            workdir = tempfile.mkdtemp(prefix="worksheets-")
+            root = extract_archive(source, workdir)
+        else:
+            print(f"❌ No such directory or archive: {source}")
+            return 1
+        records, counts = grade_section(root, out_dir, equation=args.equation, workers=args.workers,
+                                        ocr_workers=args.ocr_workers, restart=args.restart)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = write_report(records, out_dir, formats=[f.strip() for f in args.format.split(",")])
+    print(f"\n📊 {counts['students']} students: {counts['graded']} graded now, "
+          f"{counts['skipped']} from the manifest, {counts['failed']} failed "
+          f"({time.perf_counter() - started:.1f} s)")
+    if summary['accuracy'] is not None:
+        print(f"   Correct: {summary['correct']}/{summary['graded']} ({summary['accuracy']:.0%})")
+    for mistake in summary['common_mistakes'][:3]:
+        print(f"   Common mistake: {mistake['mistake']} ({mistake['students']} students)")
+    print(f"📝 Report written to {out_dir}")
+    return 0 if not summary['failed'] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,23 @@ of latex2sympy2 list outputs.
 
 Replace SIMPLETEX_UAT with your UAT token.
 """
+import io
+import os
 import re
 import sys
+import time
+import uuid
+import sqlite3
+import random
+import hashlib
+import threading
 import requests
+import numpy as np
 import sympy as sp
+from PIL import Image, ImageDraw, ImageFilter
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from latex2sympy2 import latex2sympy
 from sympy import Eq
 try:
@@ -22,21 +35,765 @@ except ImportError:
 # CONFIG - replace token & image path
 # =========================
 SIMPLETEX_UAT = "mOha3P9qrzXqWTbl5DosMWNQZXU9f0hhD80HXJ1O1uew77n43VT2pOys3Afw6s2n"
-SIMPLETEX_API_URL = "https://server.simpletex.net/api/latex_ocr"
+# Point at a local stand-in (simpletex_standin.py) for tests and benchmarks
+SIMPLETEX_API_URL = os.environ.get("SIMPLETEX_API_URL", "https://server.simpletex.net/api/latex_ocr")
 IMAGE_PATH = "taena.png"
 
+# Image preprocessing before upload: crop to the ink, scale the ink to a
+# height the OCR reads well, and send a small 1-bit PNG instead of the canvas
+OCR_INK_THRESHOLD = 160       # grayscale values below this count as ink
+OCR_MARGIN = 16               # white border kept around the ink, in output px
+OCR_TARGET_INK_HEIGHT = 96    # ink bounding-box height after scaling
+OCR_MAX_WIDTH = 1600          # cap for very long single-line formulas
+OCR_MAX_UPSCALE = 2.0
+OCR_TARGET_STROKE = 3.0       # stroke width (px) after scaling
+OCR_MAX_STROKE_POINTS = 20000  # total points accepted in a stroke payload
+
+# OCR result cache keyed by the preprocessed image. By default only
+# byte-identical images hit: "x = 1.7" and "x = 17" can be 2 bits apart in
+# the perceptual hash, so near matches (Hamming distance <= threshold and a
+# similar aspect ratio) are opt-in. Set OCR_CACHE_DB to also keep results in SQLite.
+OCR_CACHE_SIZE = 512
+OCR_PHASH_THRESHOLD = 0         # bits; 0 disables near matching
+OCR_CACHE_DB = os.environ.get("OCR_CACHE_DB")
+
+# Shared SimpleTex HTTP client: pooled keep-alive connections, bounded
+# retries with jittered exponential backoff on transient failures and
+# optional hedging (a second request once the first is slower than p95)
+OCR_POOL_SIZE = 8
+OCR_RETRIES = 2
+OCR_BACKOFF = 0.5             # seconds before the first retry
+OCR_HEDGE = False             # hedged requests may be billed twice
+OCR_HEDGE_MIN_SAMPLES = 20    # latencies needed before hedging kicks in
+
+# Circuit breaker around SimpleTex: open after too many failed or slow calls
+# in the rolling window, fail fast while open, then let probes through
+OCR_BREAKER_WINDOW = 20
+OCR_BREAKER_MIN_CALLS = 5
+OCR_BREAKER_FAILURE_RATE = 0.5
+OCR_BREAKER_SLOW_SECONDS = 10.0
+OCR_BREAKER_SLOW_RATE = 0.8
+OCR_BREAKER_COOLDOWN = 30.0   # seconds open before half-open probing
+OCR_BREAKER_PROBES = 1        # concurrent probe requests while half-open
+
+# Multi-line drawings: rows (canvas px) split where the vertical gap between
+# ink bands is at least OCR_LINE_MIN_GAP; bands thinner than
+# OCR_LINE_MIN_HEIGHT (a lone fraction bar, a stray dot) join their nearest
+# neighbour. Lines are OCRed concurrently on up to OCR_LINE_WORKERS threads.
+OCR_LINE_MIN_GAP = 24
+OCR_LINE_MIN_HEIGHT = 12
+OCR_LINE_WORKERS = 8
+
+# Asynchronous OCR jobs: the worker count caps concurrent SimpleTex calls,
+# submissions beyond OCR_JOB_MAX_PENDING are rejected instead of queued
+OCR_JOB_WORKERS = 4
+OCR_JOB_MAX_PENDING = 64
+OCR_JOB_TTL = 600             # seconds a finished job stays pollable
+
 # =========================
 # Helper functions
 # =========================
-def send_to_simpletex(image_path, token, api_url=SIMPLETEX_API_URL, timeout=20):
-    headers = {"token": token}
-    with open(image_path, "rb") as f:
-        files = {"file": ("image.png", f, "image/png")}
+def _estimate_stroke_width(ink: np.ndarray) -> float:
+    """Average stroke width of a boolean ink mask: area / (half the perimeter)"""
+    area = int(ink.sum())
+    if area == 0:
+        return 0.0
+    padded = np.pad(ink, 1)
+    interior = (padded[1:-1, 1:-1] & padded[:-2, 1:-1] & padded[2:, 1:-1]
+                & padded[1:-1, :-2] & padded[1:-1, 2:])
+    perimeter = area - int(interior.sum())
+    return 2.0 * area / max(perimeter, 1)
+
+def read_image_source(image) -> bytes:
+    """Encoded image bytes from a path, bytes, a binary file-like object or a PIL image"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, Image.Image):
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        return buf.getvalue()
+    if hasattr(image, "read"):
+        return image.read()
+    with open(image, "rb") as f:
+        return f.read()
+
+def _flatten_transparency(img):
+    """Composite transparent canvas exports onto white so ink stays dark"""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba)
+    return img
+
+def preprocess_image_for_ocr(image, margin=OCR_MARGIN, target_height=OCR_TARGET_INK_HEIGHT,
+                             max_width=OCR_MAX_WIDTH, target_stroke=OCR_TARGET_STROKE):
+    """
+    Prepare a canvas image for upload.
+    - crop to the ink bounding box plus a white margin
+    - scale so the ink is target_height px tall (capped width / upscale)
+    - thicken or thin strokes towards target_stroke px
+    - binarise and re-encode as an optimised 1-bit PNG
+    `image` is anything read_image_source accepts. Returns (png_bytes, stats) where stats
+    reports sizes, bytes saved and time spent. Raises ValueError if the image
+    has no ink, so blank canvases never reach the OCR service.
+    """
+    start = time.perf_counter()
+    if isinstance(image, Image.Image):
+        original_bytes = None
+        img = image
+    else:
+        data = read_image_source(image)
+        original_bytes = len(data)
+        img = Image.open(io.BytesIO(data))
+
+    img = _flatten_transparency(img)
+    gray = img.convert("L")
+    if original_bytes is None:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        original_bytes = buf.tell()
+
+    ink = np.asarray(gray) < OCR_INK_THRESHOLD
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if rows.size == 0:
+        raise ValueError("No ink found in image")
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    left, right = int(cols[0]), int(cols[-1]) + 1
+    cropped = gray.crop((left, top, right, bottom))
+    stroke = _estimate_stroke_width(ink[top:bottom, left:right])
+
+    ink_w, ink_h = cropped.size
+    scale = min(target_height / ink_h, OCR_MAX_UPSCALE, (max_width - 2 * margin) / ink_w)
+    new_size = (max(1, round(ink_w * scale)), max(1, round(ink_h * scale)))
+    if new_size != cropped.size:
+        cropped = cropped.resize(new_size, Image.LANCZOS)
+
+    # Normalise stroke width with a 3x3 min/max filter (one pixel per side)
+    scaled_stroke = stroke * scale
+    if scaled_stroke < target_stroke - 1:
+        cropped = cropped.filter(ImageFilter.MinFilter(3))   # thicken dark ink
+    elif scaled_stroke > 2 * target_stroke:
+        cropped = cropped.filter(ImageFilter.MaxFilter(3))   # thin dark ink
+
+    canvas = Image.new("L", (new_size[0] + 2 * margin, new_size[1] + 2 * margin), 255)
+    canvas.paste(cropped, (margin, margin))
+    binary = canvas.point(lambda v: 255 if v >= OCR_INK_THRESHOLD else 0).convert("1")
+
+    out = io.BytesIO()
+    binary.save(out, format="PNG", optimize=True)
+    png_bytes = out.getvalue()
+    stats = {
+        "original_bytes": original_bytes,
+        "processed_bytes": len(png_bytes),
+        "bytes_saved": original_bytes - len(png_bytes),
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+        "size": binary.size,
+        "stroke_width": round(scaled_stroke, 2),
+    }
+    return png_bytes, stats
+
+def encode_strokes(lines):
+    """
+    Compact stroke payload from point lists (e.g. DrawingArea.lines):
+    each stroke becomes [x0, y0, dx1, dy1, dx2, dy2, ...] in integers.
+    """
+    strokes = []
+    for line in lines:
+        flat, prev = [], None
+        for x, y in line:
+            x, y = int(round(x)), int(round(y))
+            flat.extend((x, y) if prev is None else (x - prev[0], y - prev[1]))
+            prev = (x, y)
+        if flat:
+            strokes.append(flat)
+    return strokes
+
+def decode_strokes(strokes):
+    """Inverse of encode_strokes; raises ValueError on malformed payloads"""
+    if not isinstance(strokes, list):
+        raise ValueError("strokes must be a list of integer lists")
+    lines, total = [], 0
+    for flat in strokes:
+        if (not isinstance(flat, list) or len(flat) < 2 or len(flat) % 2
+                or not all(isinstance(v, int) and not isinstance(v, bool) for v in flat)):
+            raise ValueError("each stroke must be an even-length list of integers")
+        total += len(flat) // 2
+        if total > OCR_MAX_STROKE_POINTS:
+            raise ValueError(f"stroke payload exceeds {OCR_MAX_STROKE_POINTS} points")
+        x, y = flat[0], flat[1]
+        line = [(x, y)]
+        for i in range(2, len(flat), 2):
+            x, y = x + flat[i], y + flat[i + 1]
+            line.append((x, y))
+        lines.append(line)
+    return lines
+
+def rasterize_strokes(strokes, margin=OCR_MARGIN, target_height=OCR_TARGET_INK_HEIGHT,
+                      max_width=OCR_MAX_WIDTH, stroke_width=OCR_TARGET_STROKE):
+    """
+    Draw a delta-encoded stroke payload straight at OCR resolution: the ink
+    is scaled to target_height px (same limits as preprocess_image_for_ocr)
+    and drawn with stroke_width px lines, so no full-size canvas is ever
+    created. Returns a grayscale PIL image.
+    """
+    lines = decode_strokes(strokes)
+    points = [p for line in lines for p in line]
+    if not points:
+        raise ValueError("No ink found in image")
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    min_x, min_y = min(xs), min(ys)
+    ink_w, ink_h = max(xs) - min_x + 1, max(ys) - min_y + 1
+    scale = min(target_height / ink_h, OCR_MAX_UPSCALE, (max_width - 2 * margin) / ink_w)
+
+    pad = margin + stroke_width
+    size = (round(ink_w * scale + 2 * pad), round(ink_h * scale + 2 * pad))
+    img = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    width = max(1, round(stroke_width))
+    for line in lines:
+        scaled = [((x - min_x) * scale + pad, (y - min_y) * scale + pad) for x, y in line]
+        if len(scaled) == 1:
+            (cx, cy), r = scaled[0], width / 2
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=0)
+        else:
+            draw.line(scaled, fill=0, width=width, joint="curve")
+    return img
+
+def _group_bands(bands, min_gap=OCR_LINE_MIN_GAP, min_height=OCR_LINE_MIN_HEIGHT):
+    """
+    Group vertical ink extents into text lines. `bands` are (top, bottom, item)
+    tuples; returns [(top, bottom, [items])] ordered top to bottom. Bands
+    closer than min_gap merge; a line thinner than min_height is folded into
+    whichever neighbouring line is nearer.
+    """
+    lines = []
+    for top, bottom, item in sorted(bands, key=lambda band: band[0]):
+        if lines and top - lines[-1][1] < min_gap:
+            line = lines[-1]
+            line[1] = max(line[1], bottom)
+            line[2].append(item)
+        else:
+            lines.append([top, bottom, [item]])
+
+    i = 0
+    while len(lines) > 1 and i < len(lines):
+        top, bottom, items = lines[i]
+        if bottom - top >= min_height:
+            i += 1
+            continue
+        gap_above = top - lines[i - 1][1] if i > 0 else None
+        gap_below = lines[i + 1][0] - bottom if i + 1 < len(lines) else None
+        j = i - 1 if gap_below is None or (gap_above is not None and gap_above <= gap_below) else i + 1
+        target = lines[j]
+        target[0], target[1] = min(target[0], top), max(target[1], bottom)
+        target[2] = target[2] + items if j < i else items + target[2]
+        del lines[i]
+        i = max(0, i - 1)
+    return [(top, bottom, items) for top, bottom, items in lines]
+
+def segment_lines(image, threshold=OCR_INK_THRESHOLD, min_gap=OCR_LINE_MIN_GAP,
+                  min_height=OCR_LINE_MIN_HEIGHT):
+    """
+    Split a full-page drawing into text lines by horizontal ink projection.
+    `image` is anything read_image_source accepts. Returns [(line_image, (top, bottom))]
+    top to bottom, each a full-width grayscale crop; [] for a blank canvas.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(io.BytesIO(read_image_source(image)))
+    gray = _flatten_transparency(image).convert("L")
+    ink_rows = (np.asarray(gray) < threshold).any(axis=1)
+    # Runs of consecutive ink rows become bands
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], ink_rows.astype(np.int8), [0]))))
+    bands = [(int(top), int(bottom), None) for top, bottom in zip(edges[::2], edges[1::2])]
+    return [(gray.crop((0, top, gray.width, bottom)), (top, bottom))
+            for top, bottom, _ in _group_bands(bands, min_gap, min_height)]
+
+def segment_strokes(strokes, min_gap=OCR_LINE_MIN_GAP, min_height=OCR_LINE_MIN_HEIGHT):
+    """
+    Split a delta-encoded stroke payload into text lines using stroke
+    bounding boxes. Returns [(line_strokes, (top, bottom))] top to bottom,
+    where line_strokes is again an encoded payload (strokes keep their order).
+    """
+    lines = decode_strokes(strokes)
+    bands = [(min(y for _, y in line), max(y for _, y in line) + 1, index)
+             for index, line in enumerate(lines) if line]
+    return [(encode_strokes([lines[i] for i in sorted(indices)]), (top, bottom))
+            for top, bottom, indices in _group_bands(bands, min_gap, min_height)]
+
+_DCT_SIZE = 32
+_DCT_MATRIX = np.cos(np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1)
+                     / (2 * _DCT_SIZE))
+
+def perceptual_hash(image) -> int:
+    """
+    64-bit DCT perceptual hash of an image (PIL image or PNG bytes):
+    32x32 grayscale → 2D DCT → low 8x8 frequencies compared to their median.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS),
+                        dtype=np.float64)
+    low = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _phash_bands(phash: int):
+    """Four 16-bit bands; any hash within distance 3 shares at least one band"""
+    return [(phash >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+class OCRResultCache:
+    """
+    Two-tier cache of SimpleTex results for preprocessed images.
+    Exact duplicates (same PNG bytes) are looked up by SHA-256; with
+    threshold > 0 near duplicates also hit by perceptual hash within
+    `threshold` bits and a similar aspect ratio. The memory tier is a
+    bounded LRU; the optional SQLite tier persists results across restarts.
+    fetch() lets concurrent misses for the same image share one upload.
+    """
+
+    def __init__(self, maxsize=OCR_CACHE_SIZE, threshold=OCR_PHASH_THRESHOLD, db_path=None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.db_path = db_path
+        self._entries = OrderedDict()   # sha256 -> (phash, size, latex)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight = {}             # sha256 -> Future of the upload in progress
+        if db_path:
+            with sqlite3.connect(db_path) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                    "digest TEXT PRIMARY KEY, phash TEXT NOT NULL, width INTEGER, height INTEGER,"
+                    "b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER, latex TEXT NOT NULL,"
+                    "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+                for band in ("b0", "b1", "b2", "b3"):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_ocr_cache_{band} ON ocr_cache({band})")
+
+    def _similar(self, phash, size, other_phash, other_size):
+        if hamming_distance(phash, other_phash) > self.threshold:
+            return False
+        # Same hash on a much wider/narrower image is a different formula
+        ratio, other_ratio = size[0] / size[1], other_size[0] / other_size[1]
+        return abs(ratio - other_ratio) <= 0.1 * max(ratio, other_ratio)
+
+    def _remember(self, digest, phash, size, latex):
+        self._entries[digest] = (phash, tuple(size), latex)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _lookup_db(self, digest, phash, size):
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT phash, width, height, latex FROM ocr_cache WHERE digest = ?",
+                               (digest,)).fetchone()
+            if row:
+                return row, "exact"
+            if self.threshold <= 0:
+                return None, None
+            if self.threshold >= 4:
+                rows = conn.execute("SELECT phash, width, height, latex FROM ocr_cache")
+            else:
+                rows = conn.execute(
+                    "SELECT phash, width, height, latex FROM ocr_cache "
+                    "WHERE b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?", _phash_bands(phash))
+            for row in rows:
+                if self._similar(phash, size, int(row[0], 16), (row[1], row[2])):
+                    return row, "near"
+        return None, None
+
+    def get(self, png_bytes, phash, size):
+        """Return (latex, kind) with kind in exact/near/db, or (None, None)"""
+        digest = hashlib.sha256(png_bytes).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.exact_hits += 1
+                return entry[2], "exact"
+            for key, (other_phash, other_size, latex) in reversed(self._entries.items()):
+                if self.threshold <= 0:
+                    break
+                if self._similar(phash, size, other_phash, other_size):
+                    self._entries.move_to_end(key)
+                    self.near_hits += 1
+                    return latex, "near"
+        if self.db_path:
+            row, kind = self._lookup_db(digest, phash, size)
+            if row is not None:
+                with self._lock:
+                    self._remember(digest, int(row[0], 16), (row[1], row[2]), row[3])
+                    self.db_hits += 1
+                return row[3], "db-" + kind
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def put(self, png_bytes, phash, size, latex):
+        digest = hashlib.sha256(png_bytes).hexdigest()
+        with self._lock:
+            self._remember(digest, phash, size, latex)
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (digest, phash, width, height, b0, b1, b2, b3, latex) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (digest, f"{phash:016x}", size[0], size[1], *_phash_bands(phash), latex))
+
+    def fetch(self, png_bytes, phash, size, load):
+        """
+        Return (latex, kind) from the cache, calling load() on a miss.
+        Concurrent misses for the same bytes (a double-clicked upload) wait
+        for the first caller's load() instead of starting their own; they get
+        its result, or its exception, with kind "coalesced".
+        """
+        latex, kind = self.get(png_bytes, phash, size)
+        if latex is not None:
+            return latex, kind
+        digest = hashlib.sha256(png_bytes).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                # The upload we would have waited for finished after get()
+                return entry[2], "exact"
+            future = self._inflight.get(digest)
+            leader = future is None
+            if leader:
+                future = self._inflight[digest] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), "coalesced"
         try:
-            resp = requests.post(api_url, headers=headers, files=files, timeout=timeout)
-            resp.raise_for_status()
-        except requests.RequestException as e:
-            raise RuntimeError(f"SimpleTex request failed: {e}") from e
+            latex = load()
+            self.put(png_bytes, phash, size, latex)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(latex)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+        return latex, "miss"
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "persistent": bool(self.db_path),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.exact_hits = self.near_hits = self.db_hits = self.misses = self.coalesced = 0
+
+ocr_cache = OCRResultCache(db_path=OCR_CACHE_DB)
+
+class _TransientError(Exception):
+    """Failure worth retrying: connection trouble, timeouts, 429 and 5xx"""
+
+class SimpleTexClient:
+    """
+    Shared HTTP client for SimpleTex uploads.
+    One requests.Session keeps connections alive across calls; transient
+    failures are retried up to `retries` times with jittered exponential
+    backoff. With hedge=True a second identical request is started once the
+    first has been outstanding longer than the observed p95 latency, and
+    whichever succeeds first wins.
+    """
+
+    def __init__(self, pool_size=OCR_POOL_SIZE, retries=OCR_RETRIES, backoff=OCR_BACKOFF,
+                 hedge=OCR_HEDGE, hedge_min_samples=OCR_HEDGE_MIN_SAMPLES):
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=2 * pool_size)
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "attempts": 0, "retries": 0, "hedges": 0,
+                         "hedge_wins": 0, "failures": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _percentile(self, q):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None when hedging is off / unwarmed"""
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return self._percentile(0.95)
+
+    def _post_once(self, api_url, payload, token, timeout):
+        self._count("attempts")
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(api_url, headers={"token": token},
+                                     files={"file": ("image.png", payload, "image/png")},
+                                     timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _TransientError(str(e)) from e
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise _TransientError(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return resp
+
+    def _attempt(self, api_url, payload, token, timeout):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._post_once(api_url, payload, token, timeout)
+        first = self._executor.submit(self._post_once, api_url, payload, token, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        self._count("hedges")
+        second = self._executor.submit(self._post_once, api_url, payload, token, timeout)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is second:
+                    self._count("hedge_wins")
+                return resp
+        raise error
+
+    def post(self, api_url, payload, token, timeout=20):
+        """POST PNG bytes, retrying transient failures; raises requests exceptions"""
+        self._count("requests")
+        for attempt in range(self.retries + 1):
+            try:
+                return self._attempt(api_url, payload, token, timeout)
+            except _TransientError as e:
+                if attempt == self.retries:
+                    self._count("failures")
+                    raise requests.RequestException(f"{e} (after {attempt + 1} attempts)") from e
+                self._count("retries")
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            except requests.RequestException:
+                self._count("failures")
+                raise
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            samples = len(self._latencies)
+        p50, p95 = self._percentile(0.5), self._percentile(0.95)
+        stats.update({
+            "latency_samples": samples,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge": self.hedge,
+        })
+        return stats
+
+simpletex_client = SimpleTexClient()
+
+class OCRUnavailable(RuntimeError):
+    """Raised instead of calling SimpleTex while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"OCR unavailable: SimpleTex circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    closed → open when, over the last `window` calls (at least `min_calls`),
+    the failure rate reaches `failure_rate` or the share of calls slower than
+    `slow_seconds` reaches `slow_rate`. open → half_open after `cooldown`
+    seconds; up to `probes` requests then go through, and one success closes
+    the breaker while a failure or slow call re-opens it. A probe still
+    running after `slow_seconds` already counts as slow.
+
+    Every state change starts a new generation; admit() hands out the
+    current one and record() ignores results from an older generation, so a
+    slow call started before the breaker opened cannot close it later.
+    """
+
+    def __init__(self, window=OCR_BREAKER_WINDOW, min_calls=OCR_BREAKER_MIN_CALLS,
+                 failure_rate=OCR_BREAKER_FAILURE_RATE, slow_seconds=OCR_BREAKER_SLOW_SECONDS,
+                 slow_rate=OCR_BREAKER_SLOW_RATE, cooldown=OCR_BREAKER_COOLDOWN,
+                 probes=OCR_BREAKER_PROBES, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.probes = probes
+        self._clock = clock
+        self._calls = deque(maxlen=window)   # (failed, slow)
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.generation = 0
+        self._opened_at = None
+        self._in_flight_probes = 0
+        self._probe_started_at = None
+        self.counters = {"opened": 0, "rejected": 0, "failures": 0, "slow_calls": 0,
+                         "stale_results": 0}
+
+    def _transition(self, state):
+        self.state = state
+        self.generation += 1
+        self._calls.clear()
+        self._in_flight_probes = 0
+
+    def _open(self):
+        self._transition("open")
+        self._opened_at = self._clock()
+        self.counters["opened"] += 1
+
+    def _retry_after(self, now):
+        if self.state == "open":
+            return max(0.0, self.cooldown - (now - self._opened_at))
+        if self.state == "half_open" and self._in_flight_probes >= self.probes:
+            # Wait out the probe; once it is overdue it counts as slow and
+            # the breaker re-opens for a full cooldown
+            remaining = self.slow_seconds - (now - self._probe_started_at)
+            return remaining if remaining > 0 else self.cooldown
+        return 0.0
+
+    def retry_after(self):
+        """Seconds until a request could be admitted (0 when one would be now)"""
+        with self._lock:
+            return self._retry_after(self._clock())
+
+    def is_open(self):
+        """True while requests would be rejected (cooling down or probe slots full)"""
+        return self.retry_after() > 0
+
+    def admit(self):
+        """Return the generation a new call runs under, or None if it is rejected"""
+        with self._lock:
+            now = self._clock()
+            if self.state == "open":
+                if now - self._opened_at < self.cooldown:
+                    self.counters["rejected"] += 1
+                    return None
+                self._transition("half_open")
+            if self.state == "half_open":
+                if self._in_flight_probes >= self.probes:
+                    if now - self._probe_started_at >= self.slow_seconds:
+                        self.counters["slow_calls"] += 1
+                        self._open()
+                    self.counters["rejected"] += 1
+                    return None
+                if not self._in_flight_probes:
+                    self._probe_started_at = now
+                self._in_flight_probes += 1
+            return self.generation
+
+    def allow_request(self):
+        return self.admit() is not None
+
+    def record(self, failed, elapsed, generation=None):
+        """Record a finished call; `generation` is what admit() returned for it"""
+        slow = elapsed > self.slow_seconds
+        with self._lock:
+            self.counters["failures"] += failed
+            self.counters["slow_calls"] += slow
+            if generation is not None and generation != self.generation:
+                self.counters["stale_results"] += 1
+                return   # late result of a call started before the last state change
+            if self.state == "half_open":
+                if failed or slow:
+                    self._open()
+                else:
+                    self._transition("closed")
+                return
+            if self.state == "open":
+                return
+            self._calls.append((failed, slow))
+            n = len(self._calls)
+            if n >= self.min_calls:
+                failures = sum(1 for f, _ in self._calls if f)
+                slows = sum(1 for _, sl in self._calls if sl)
+                if failures / n >= self.failure_rate or slows / n >= self.slow_rate:
+                    self._open()
+
+    def reset(self):
+        with self._lock:
+            self._transition("closed")
+            self._opened_at = None
+
+    def stats(self):
+        with self._lock:
+            n = len(self._calls)
+            return {
+                "state": self.state,
+                "generation": self.generation,
+                "retry_after": round(self._retry_after(self._clock()), 1),
+                "window_calls": n,
+                "window_failure_rate": round(sum(1 for f, _ in self._calls if f) / n, 3) if n else 0.0,
+                **self.counters,
+            }
+
+ocr_breaker = CircuitBreaker()
+
+def _is_service_failure(error):
+    """Client errors (4xx other than 429) say nothing about SimpleTex health"""
+    response = getattr(error, "response", None)
+    if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+        return False
+    return True
+
+def send_to_simpletex(image, token, api_url=None, timeout=20, client=None, breaker=None):
+    """
+    Upload an image (path, bytes, file-like or PIL image) to SimpleTex and return its LaTeX.
+    Raises OCRUnavailable without making a request while the breaker is open.
+    """
+    payload = read_image_source(image)
+    breaker = breaker or ocr_breaker
+    generation = breaker.admit()
+    if generation is None:
+        raise OCRUnavailable(breaker.retry_after())
+    start = time.perf_counter()
+    failed = True
+    try:
+        resp = (client or simpletex_client).post(api_url or SIMPLETEX_API_URL, payload, token,
+                                                 timeout=timeout)
+        failed = False
+    except requests.RequestException as e:
+        failed = _is_service_failure(e)
+        raise RuntimeError(f"SimpleTex request failed: {e}") from e
+    finally:
+        breaker.record(failed, time.perf_counter() - start, generation)
 
     try:
         res_json = resp.json()
@@ -72,116 +829,216 @@ def clean_ocr_artifacts(latex: str) -> str:
     s = re.sub(r'\s+', ' ', s).strip()
     return s
 
+# ---- single-pass LaTeX transcription ----
+# Tokens are (kind, text) with kind in cmd/num/var/sym. One left-to-right
+# walk over the tokens emits either normalised LaTeX (for latex2sympy2) or a
+# SymPy-ready string, so the cost is linear in the input length.
+_LATEX_IGNORED_CHARS = "​‌‍﻿ $"
+_LATEX_SPACING = {",", ";", "!", ":", ">", " ", "quad", "qquad", "displaystyle", "textstyle",
+                  "big", "Big", "bigl", "bigr", "Bigl", "Bigr"}
+_LATEX_FRACS = {"frac", "dfrac", "tfrac"}
+_LATEX_RENAMES = {"dfrac": "frac", "tfrac": "frac", "times": "cdot"}
+_LATEX_OPERATORS = {"cdot": "*", "times": "*", "div": "/", "neq": "!=", "ne": "!=",
+                    "leq": "<=", "le": "<=", "geq": ">=", "ge": ">=", "lt": "<", "gt": ">"}
+_LATEX_CONSTANTS = {"pi": "pi", "infty": "oo"}
+_LATEX_FUNCTIONS = {"sin", "cos", "tan", "ln", "log", "exp"}
+_LATEX_TEXT = {"mathrm", "text", "mathit", "operatorname"}
+
+_LATEX_TOKEN = re.compile(r"\\([A-Za-z]+|.?)|(\d[\d.]*|\.\d[\d.]*)|([A-Za-z])|(\s+)|(.)", re.S)
+
+def _tokenize_latex(s: str):
+    """One regex scan: commands, numbers, single letters and other symbols"""
+    tokens = []
+    for cmd, num, var, space, sym in _LATEX_TOKEN.findall(s):
+        if num:
+            tokens.append(("num", num))
+        elif var:
+            tokens.append(("var", var))
+        elif sym:
+            if sym not in _LATEX_IGNORED_CHARS:
+                tokens.append(("sym", "-" if sym == "−" else sym))
+        elif not space:
+            # \name, a control symbol (\, \; \{ \\) or a trailing lone backslash
+            tokens.append(("cmd", cmd))
+    return tokens
+
+class _LatexTranscriber:
+    """Recursive walk over _tokenize_latex output; every token is consumed once."""
+
+    def __init__(self, latex: str):
+        self.tokens = _tokenize_latex(latex)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take_first_digit(self):
+        """TeX arguments take one character: \\frac12 is \\frac{1}{2}, x^23 is x^{2}3"""
+        kind, text = self.tokens[self.pos]
+        if kind == "num" and len(text) > 1:
+            self.tokens[self.pos] = ("num", text[1:])
+            return text[0]
+        self.pos += 1
+        return text
+
+    # -- normalised LaTeX ---------------------------------------------------
+    def latex(self, stop=None) -> str:
+        out = []
+        while self.pos < len(self.tokens):
+            kind, text = self._peek()
+            if kind == "sym" and text == stop:
+                self.pos += 1
+                break
+            if kind != "cmd":
+                self.pos += 1
+                out.append(text)
+                if kind == "sym" and text == "{":
+                    out.append(self.latex("}") + "}")
+                continue
+            self.pos += 1
+            if text in _LATEX_SPACING:
+                continue
+            name = _LATEX_RENAMES.get(text, text)
+            out.append("\\" + name)
+            if name == "frac":
+                out.append(self._latex_arg() + self._latex_arg())
+            elif name.isalpha() and self._peek()[0] in ("var", "num"):
+                out.append(" ")
+        return "".join(out)
+
+    def _latex_arg(self) -> str:
+        kind, text = self._peek()
+        if kind is None:
+            return "{}"
+        if kind == "sym" and text == "{":
+            self.pos += 1
+            return "{" + self.latex("}") + "}"
+        if kind == "cmd":
+            self.pos += 1
+            return "{\\" + _LATEX_RENAMES.get(text, text) + "}"
+        return "{" + self._take_first_digit() + "}"
+
+    # -- SymPy string -------------------------------------------------------
+    def sympy(self, stop=None) -> str:
+        out, prev = [], None
+        while self.pos < len(self.tokens):
+            kind, text = self._peek()
+            if kind == "sym" and text == stop:
+                self.pos += 1
+                break
+            piece, cur = self._sympy_atom()
+            if piece is None:
+                continue
+            if cur == "postfix":
+                # ^ and _ attach to what came before
+                out.append(piece)
+                prev = "close" if piece.startswith("**") else prev
+                continue
+            if self._implicit_product(prev, cur):
+                out.append("*")
+            out.append(piece)
+            prev = "close" if cur in ("group", "closeparen") else cur
+        return "".join(out)
+
+    @staticmethod
+    def _implicit_product(prev, cur):
+        """
+        Whether juxtaposition means multiplication. Letter runs and letters
+        followed by digits stay together (x2, xy) as in the old converter.
+        """
+        if cur in ("op", "closeparen") or prev in (None, "op", "func", "open"):
+            return False
+        if prev == "num":
+            return cur != "num"
+        if prev == "var":
+            return cur in ("name", "open", "func", "group")
+        # prev is a constant name (pi, oo) or a closed group
+        return cur in ("num", "var", "name", "open", "func", "group")
+
+    def _sympy_arg(self) -> str:
+        kind, text = self._peek()
+        if kind is None:
+            return ""
+        if kind == "sym" and text == "{":
+            self.pos += 1
+            return self.sympy("}")
+        if kind == "num":
+            return self._take_first_digit()
+        piece, _ = self._sympy_atom()
+        return piece or ""
+
+    def _sympy_atom(self):
+        """(text, kind) for the next atom; text None means nothing to emit"""
+        kind, text = self._peek()
+        self.pos += 1
+        if kind in ("num", "var"):
+            return text, kind
+        if kind == "sym":
+            if text in "([":
+                return "(", "open"
+            if text in ")]":
+                return ")", "closeparen"
+            if text == "{":
+                return "(" + self.sympy("}") + ")", "group"
+            if text == "}":
+                return None, None
+            if text == "^":
+                return "**(" + self._sympy_arg() + ")", "postfix"
+            if text == "_":
+                return "_" + self._sympy_arg(), "postfix"
+            return text, "op"
+        # commands
+        if text in _LATEX_SPACING or text in ("left", "right", "\\"):
+            if text in ("left", "right") and self._peek() == ("sym", "."):
+                self.pos += 1   # \left. / \right. are invisible delimiters
+            return None, None
+        if text in ("{", "}"):
+            return ("(", "open") if text == "{" else (")", "closeparen")
+        if text in _LATEX_FRACS:
+            num = self._sympy_arg()
+            den = self._sympy_arg()
+            return f"({num})/({den})", "group"
+        if text == "sqrt":
+            index = None
+            if self._peek() == ("sym", "["):
+                self.pos += 1
+                index = self.sympy("]")
+            radicand = self._sympy_arg()
+            if index:
+                return f"({radicand})**(1/({index}))", "group"
+            return f"sqrt({radicand})", "group"
+        if text in _LATEX_OPERATORS:
+            return _LATEX_OPERATORS[text], "op"
+        if text in _LATEX_CONSTANTS:
+            return _LATEX_CONSTANTS[text], "name"
+        if text in _LATEX_TEXT:
+            return self._sympy_arg(), "var"
+        if text in _LATEX_FUNCTIONS:
+            if self._peek() in (("sym", "("), ("cmd", "left")):
+                return text, "func"
+            return f"{text}({self._sympy_arg()})", "group"
+        return text, "name"
+# ---- end single-pass LaTeX transcription ----
+
 def preprocess_latex_for_rationals(latex: str) -> str:
     """
-    Normalization to make latex2sympy2 happier.
+    Normalization to make latex2sympy2 happier: OCR artifacts removed,
+    $ delimiters, spacing commands and zero-width characters dropped,
+    \\dfrac/\\tfrac → \\frac, \\times → \\cdot and brace-less fraction
+    arguments braced (\\frac12 → \\frac{1}{2}).
     """
     if not isinstance(latex, str):
         return latex
-
-    s = latex.strip()
-    # clean obvious OCR artifacts first
-    s = clean_ocr_artifacts(s)
-
-    # remove surrounding $ ... $
-    if s.startswith("$$") and s.endswith("$$"):
-        s = s[2:-2].strip()
-    elif s.startswith("$") and s.endswith("$"):
-        s = s[1:-1].strip()
-
-    s = s.replace("\\dfrac", "\\frac").replace("\\tfrac", "\\frac")
-    s = s.replace("−", "-")
-    s = s.replace("\\times", "\\cdot")
-    s = s.replace("\\,", "")
-    s = s.replace("\\;", "")
-    s = s.replace("\\!","")
-    s = re.sub(r'[\u200B-\u200D\uFEFF\u00A0]', '', s)
-    s = re.sub(r'\\frac\s*([^{\\\s]+)\s*([^{\\\s]+)', r'\\frac{\1}{\2}', s)
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
-
-# ---- nested-fraction helpers (unchanged from earlier) ----
-def _extract_braced(s: str, start_idx: int):
-    if start_idx >= len(s) or s[start_idx] != '{':
-        raise ValueError("extract_braced expects a '{' at start_idx")
-    i = start_idx + 1
-    depth = 1
-    while i < len(s):
-        ch = s[i]
-        if ch == '{':
-            depth += 1
-        elif ch == '}':
-            depth -= 1
-            if depth == 0:
-                return s[start_idx+1:i], i + 1
-        i += 1
-    raise ValueError("No matching closing '}' found")
-
-def replace_nested_fracs(latex: str) -> str:
-    s = latex
-    while True:
-        idx = s.find(r'\frac')
-        if idx == -1:
-            break
-        i = idx + len(r'\frac')
-        while i < len(s) and s[i].isspace():
-            i += 1
-        if i >= len(s) or s[i] != '{':
-            break
-        try:
-            num, next_pos = _extract_braced(s, i)
-        except ValueError:
-            break
-        j = next_pos
-        while j < len(s) and s[j].isspace():
-            j += 1
-        if j >= len(s) or s[j] != '{':
-            break
-        try:
-            den, after_den = _extract_braced(s, j)
-        except ValueError:
-            break
-        replacement = f'({num})/({den})'
-        s = s[:idx] + replacement + s[after_den:]
-    return s
-# ---- end nested fraction helpers ----
+    return _LatexTranscriber(clean_ocr_artifacts(latex.strip())).latex()
 
 def fallback_latex_to_sympy_string(latex: str) -> str:
-    s = latex.strip()
-    if s.startswith("$$") and s.endswith("$$"):
-        s = s[2:-2]
-    elif s.startswith("$") and s.endswith("$"):
-        s = s[1:-1]
-    s = s.replace("\\cdot", "*").replace("\\times", "*")
-    s = s.replace("\\,", "").replace("\\;", "").replace("\\!","")
-    s = s.replace("\\left", "").replace("\\right", "")
-    s = s.strip()
-
-    # robust nested fractions
-    try:
-        s = replace_nested_fracs(s)
-    except Exception:
-        pass
-
-    # remaining simple fraction pattern
-    frac_pattern = re.compile(r'\\frac\s*{([^{}]+)}\s*{([^{}]+)}')
-    while True:
-        m = frac_pattern.search(s)
-        if not m:
-            break
-        num = m.group(1); den = m.group(2)
-        s = s[:m.start()] + f'({num})/({den})' + s[m.end():]
-
-    s = re.sub(r'\\sqrt\{([^{}]+)\}', r'sqrt(\1)', s)
-    s = re.sub(r'([A-Za-z0-9\)\]])\^\{([^{}]+)\}', r'\1**(\2)', s)
-    s = re.sub(r'([A-Za-z0-9\)\]])\^([A-Za-z0-9])', r'\1**(\2)', s)
-    s = s.replace("\\displaystyle", "").replace("$", "")
-    s = re.sub(r'\s+', ' ', s).strip()
-    s = re.sub(r'(\d|\w|\))\s*\(', r'\1*(', s)
-    s = re.sub(r'\)\s*(\d|\w|\()', r')*\1', s)
-    s = re.sub(r'(\d)\s*([A-Za-z])', r'\1*\2', s)
-    s = s.replace(" ", "")
-    return s
+    """
+    SymPy-ready string for the LaTeX subset SimpleTex returns (\\frac and
+    nested fractions, \\left/\\right, \\cdot, ^{...}, \\sqrt, spacing),
+    with implicit multiplication made explicit: 2\\frac{x}{3}(x+1) →
+    2*(x)/(3)*(x+1). Single pass over the tokens.
+    """
+    return _LatexTranscriber(latex.strip()).sympy()
 
 def format_solutions(sols: Any) -> str:
     """Friendly formatter for various solution output shapes."""
@@ -207,66 +1064,197 @@ def format_solutions(sols: Any) -> str:
     except Exception:
         return repr(sols)
 
+def _to_sympy(value):
+    return sp.sympify(value) if isinstance(value, str) else sp.sympify(str(value))
+
+def _convert_equation_split(latex_norm: str) -> Any:
+    lhs_raw, rhs_raw = latex_norm.split('=', 1)
+    lhs_like = latex2sympy(lhs_raw)
+    rhs_like = latex2sympy(rhs_raw)
+    print("[DEBUG] latex2sympy2 lhs output:", repr(lhs_like))
+    print("[DEBUG] latex2sympy2 rhs output:", repr(rhs_like))
+    return Eq(_to_sympy(lhs_like), _to_sympy(rhs_like))
+
+def _convert_full(latex_norm: str) -> Any:
+    sympy_like = latex2sympy(latex_norm)
+    print("[DEBUG] latex2sympy2 output:", repr(sympy_like))
+    # If latex2sympy returned a list (common when it solves an equation and returns Eq-list), return it directly
+    if isinstance(sympy_like, list):
+        return sympy_like
+    if sympy_like is None or (isinstance(sympy_like, str) and sympy_like.strip() == ""):
+        raise RuntimeError("latex2sympy2 returned empty/None")
+    return _to_sympy(sympy_like)
+
+def _convert_fallback(latex_norm: str) -> Any:
+    fallback_str = fallback_latex_to_sympy_string(latex_norm)
+    print("[DEBUG] Fallback sympy string:", fallback_str)
+    return sp.sympify(fallback_str)
+
+def _convert_fallback_split(latex_norm: str) -> Any:
+    lhs_raw, rhs_raw = latex_norm.split('=', 1)
+    return Eq(sp.sympify(fallback_latex_to_sympy_string(lhs_raw)),
+              sp.sympify(fallback_latex_to_sympy_string(rhs_raw)))
+
+LATEX_CACHE_SIZE = 1024
+
+class LatexToSympyConverter:
+    """
+    Memoised LaTeX → SymPy conversion with per-strategy telemetry.
+    Strategies (in default order): latex2sympy2 on each side of a single
+    '=', latex2sympy2 on the whole string, the fallback string converter,
+    and the fallback converter per side. Results and failures are cached by
+    normalised LaTeX; for each input shape the strategy that has succeeded
+    most often is tried first among neighbouring strategies of the same
+    kind. The kinds are not interchangeable ("full" solves an equation into
+    a list, the split strategies return Eq(lhs, rhs)), so history never
+    moves one kind ahead of another and the result type does not depend on
+    what the process converted before.
+    """
+
+    # (name, converter, applies to, kind of result)
+    DEFAULT_STRATEGIES = (
+        ("equation_split", _convert_equation_split, lambda s: s.count('=') == 1, "equation"),
+        ("full", _convert_full, lambda s: True, "whole"),
+        ("fallback", _convert_fallback, lambda s: True, "whole"),
+        ("fallback_split", _convert_fallback_split, lambda s: '=' in s, "equation"),
+    )
+
+    def __init__(self, maxsize=LATEX_CACHE_SIZE, strategies=None):
+        self.maxsize = maxsize
+        # The kind is optional; strategies without one may all be reordered
+        self.strategies = tuple((name, fn, applies, rest[0] if rest else None)
+                                for name, fn, applies, *rest in (strategies or self.DEFAULT_STRATEGIES))
+        self._memo = OrderedDict()   # latex_norm -> (ok, result or error message)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.paths = {name: {"attempts": 0, "successes": 0, "failures": 0,
+                             "success_ms": 0.0, "failure_ms": 0.0}
+                      for name, _, _, _ in self.strategies}
+        self.wins_by_shape = {}      # shape -> {strategy: successes}
+
+    @staticmethod
+    def shape(latex_norm: str) -> str:
+        """Coarse input class used to pick the strategy order"""
+        parts = ["equation" if latex_norm.count('=') == 1 else "expression"]
+        for marker, name in (("\\frac", "frac"), ("\\sqrt", "sqrt"), ("\\left", "delims"),
+                             ("^", "power")):
+            if marker in latex_norm:
+                parts.append(name)
+        return "+".join(parts)
+
+    def _ordered(self, latex_norm, shape):
+        with self._lock:
+            wins = dict(self.wins_by_shape.get(shape, {}))
+        # Runs of consecutive strategies of one kind keep their place; wins
+        # only reorder strategies within a run
+        applicable = []
+        run = 0
+        for i, (name, fn, applies, kind) in enumerate(self.strategies):
+            if i and kind != self.strategies[i - 1][3]:
+                run += 1
+            if applies(latex_norm):
+                applicable.append((run, -wins.get(name, 0), i, name, fn))
+        applicable.sort(key=lambda item: item[:3])
+        return [(name, fn) for _, _, _, name, fn in applicable]
+
+    def _record(self, name, shape, ok, elapsed):
+        with self._lock:
+            path = self.paths[name]
+            path["attempts"] += 1
+            if ok:
+                path["successes"] += 1
+                path["success_ms"] += elapsed * 1000
+                shape_wins = self.wins_by_shape.setdefault(shape, {})
+                shape_wins[name] = shape_wins.get(name, 0) + 1
+            else:
+                path["failures"] += 1
+                path["failure_ms"] += elapsed * 1000
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memo[key] = entry
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.maxsize:
+                self._memo.popitem(last=False)
+
+    def convert(self, latex: str) -> Any:
+        latex_norm = preprocess_latex_for_rationals(latex)
+        print("[DEBUG] LaTeX after preprocessing:", latex_norm)
+
+        with self._lock:
+            entry = self._memo.get(latex_norm)
+            if entry is not None:
+                self._memo.move_to_end(latex_norm)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            ok, value = entry
+            if not ok:
+                raise RuntimeError(value)
+            return list(value) if isinstance(value, tuple) else value
+
+        shape = self.shape(latex_norm)
+        last_error = None
+        for name, fn in self._ordered(latex_norm, shape):
+            start = time.perf_counter()
+            try:
+                result = fn(latex_norm)
+            except Exception as e:
+                self._record(name, shape, False, time.perf_counter() - start)
+                print(f"[DEBUG] conversion path '{name}' failed:", e)
+                last_error = e
+                continue
+            self._record(name, shape, True, time.perf_counter() - start)
+            self._remember(latex_norm, (True, tuple(result) if isinstance(result, list) else result))
+            return result
+
+        message = ("Unable to convert LaTeX to SymPy (primary and fallback failed). "
+                   f"Last error: {last_error}")
+        self._remember(latex_norm, (False, message))
+        raise RuntimeError(message) from last_error
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            paths = {}
+            for name, path in self.paths.items():
+                paths[name] = {
+                    "attempts": path["attempts"],
+                    "successes": path["successes"],
+                    "failures": path["failures"],
+                    "avg_success_ms": round(path["success_ms"] / path["successes"], 2)
+                    if path["successes"] else None,
+                    "failure_ms_total": round(path["failure_ms"], 2),
+                }
+            return {
+                "size": len(self._memo),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "paths": paths,
+                "wins_by_shape": {shape: dict(wins) for shape, wins in self.wins_by_shape.items()},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            self.hits = self.misses = 0
+
+latex_converter = LatexToSympyConverter()
+
 def latex_to_sympy_via_latex2sympy(latex: str) -> Any:
     """
     Try latex2sympy2 then fallback. Returns:
       - a SymPy expr (sp.Basic or sp.Equality), OR
       - a list (e.g. list of Eq(...) results from latex2sympy2) which will be interpreted as solutions.
+    Conversions are memoised by normalised LaTeX (see LatexToSympyConverter).
     """
     if not isinstance(latex, str):
         raise RuntimeError("Expected LaTeX string input")
-
-    latex_norm = preprocess_latex_for_rationals(latex)
-    print("[DEBUG] LaTeX after preprocessing:", latex_norm)
-
-    # if single '=' sign, try parsing both sides
-    if '=' in latex_norm and latex_norm.count('=') == 1:
-        lhs_raw, rhs_raw = latex_norm.split('=', 1)
-        try:
-            lhs_like = latex2sympy(lhs_raw)
-            rhs_like = latex2sympy(rhs_raw)
-            print("[DEBUG] latex2sympy2 lhs output:", repr(lhs_like))
-            print("[DEBUG] latex2sympy2 rhs output:", repr(rhs_like))
-            lhs = sp.sympify(lhs_like) if isinstance(lhs_like, str) else sp.sympify(str(lhs_like))
-            rhs = sp.sympify(rhs_like) if isinstance(rhs_like, str) else sp.sympify(str(rhs_like))
-            return Eq(lhs, rhs)
-        except Exception as e:
-            print("[DEBUG] primary latex2sympy2 equation path failed:", e)
-
-    # primary attempt: full expression
-    try:
-        sympy_like = latex2sympy(latex_norm)
-        print("[DEBUG] latex2sympy2 output:", repr(sympy_like))
-        # If latex2sympy returned a list (common when it solves an equation and returns Eq-list), return it directly
-        if isinstance(sympy_like, list):
-            return sympy_like
-        if sympy_like is None or (isinstance(sympy_like, str) and sympy_like.strip() == ""):
-            raise RuntimeError("latex2sympy2 returned empty/None")
-        expr = sp.sympify(sympy_like) if isinstance(sympy_like, str) else sp.sympify(str(sympy_like))
-        return expr
-    except Exception as e:
-        print("[DEBUG] latex2sympy2 primary parse failed or sympify failed:", e)
-
-    # fallback string converter
-    fallback_str = fallback_latex_to_sympy_string(latex_norm)
-    print("[DEBUG] Fallback sympy string:", fallback_str)
-    try:
-        expr = sp.sympify(fallback_str)
-        print("[DEBUG] sympify succeeded on fallback string.")
-        return expr
-    except Exception as e:
-        # final attempt if '=' present: parse LHS/RHS with fallback
-        if '=' in latex_norm:
-            try:
-                lhs_raw, rhs_raw = latex_norm.split('=', 1)
-                lhs_fb = fallback_latex_to_sympy_string(lhs_raw)
-                rhs_fb = fallback_latex_to_sympy_string(rhs_raw)
-                lhs = sp.sympify(lhs_fb)
-                rhs = sp.sympify(rhs_fb)
-                return Eq(lhs, rhs)
-            except Exception as e2:
-                print("[DEBUG] fallback equation attempt failed:", e2)
-        raise RuntimeError(f"Unable to convert LaTeX to SymPy (primary and fallback failed). Last error: {e}") from e
+    return latex_converter.convert(latex)
 
 def solve_sympy_expr(expr: sp.Expr):
     if expr is None:
@@ -356,11 +1344,125 @@ def main(image_path):
 # =========================
 # NEW WRAPPER FOR CALCULATOR USE
 # =========================
-def process_image(image_path: str) -> dict:
+class OCRQueueFull(RuntimeError):
+    """Raised by OCRJobQueue.submit when too many jobs are waiting"""
+
+class OCRJobQueue:
+    """
+    Background OCR jobs on a bounded worker pool.
+    submit() returns a job id at once; get() polls it, optionally blocking
+    until the job finishes (long-poll). Finished jobs are kept for `ttl`
+    seconds. The pool size is the cap on concurrent SimpleTex requests.
+    """
+
+    def __init__(self, workers=OCR_JOB_WORKERS, max_pending=OCR_JOB_MAX_PENDING, ttl=OCR_JOB_TTL,
+                 process=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._process = process or (lambda image: process_image(image))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-job")
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _evict_expired(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] and now - job["finished_at"] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _depth(self):
+        queued = sum(1 for job in self._jobs.values() if job["status"] == "queued")
+        running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+        return queued, running
+
+    def submit(self, image):
+        """Queue an image (anything process_image accepts); returns the job id"""
+        now = time.time()
+        with self._cond:
+            self._evict_expired(now)
+            queued, running = self._depth()
+            if queued + running >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise OCRQueueFull(f"OCR queue full ({queued + running} jobs pending)")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"status": "queued", "submitted_at": now, "started_at": None,
+                                  "finished_at": None, "result": None}
+            self.counters["submitted"] += 1
+        self._executor.submit(self._run, job_id, image)
+        return job_id
+
+    def _run(self, job_id, image):
+        with self._cond:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+        try:
+            result = self._process(image)
+        except Exception as e:
+            result = {"latex_raw": None, "sympy_out": None, "solutions": None,
+                      "pretty": None, "error": str(e)}
+        with self._cond:
+            job["finished_at"] = time.time()
+            job["result"] = result
+            job["status"] = "done"
+            failed = bool(result.get("error")) and not result.get("latex_raw")
+            self.counters["failed" if failed else "completed"] += 1
+            self._wait_total += job["started_at"] - job["submitted_at"]
+            self._run_total += job["finished_at"] - job["started_at"]
+            self._cond.notify_all()
+
+    def get(self, job_id, wait=0):
+        """Snapshot of a job, blocking up to `wait` seconds for it to finish; None if unknown"""
+        deadline = time.time() + wait
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                remaining = deadline - time.time()
+                if job["status"] == "done" or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            snapshot = {"job_id": job_id, "status": job["status"]}
+            if job["started_at"]:
+                snapshot["queue_ms"] = round((job["started_at"] - job["submitted_at"]) * 1000, 1)
+            if job["finished_at"]:
+                snapshot["run_ms"] = round((job["finished_at"] - job["started_at"]) * 1000, 1)
+                snapshot["result"] = dict(job["result"])
+            return snapshot
+
+    def stats(self):
+        with self._cond:
+            queued, running = self._depth()
+            finished = self.counters["completed"] + self.counters["failed"]
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": queued,
+                "running": running,
+                **self.counters,
+                "avg_queue_ms": round(self._wait_total / finished * 1000, 1) if finished else None,
+                "avg_run_ms": round(self._run_total / finished * 1000, 1) if finished else None,
+            }
+
+ocr_jobs = OCRJobQueue()
+
+def process_image(image, preprocess: bool = True, use_cache: bool = True) -> dict:
     """
     Wrapper around main() that returns structured results
     instead of just printing to console.
     Useful for integration into GUI or calculator systems.
+    `image` may be a file path, encoded bytes, a binary file-like object
+    (e.g. a Flask upload) or a PIL image; nothing is written to disk.
+    With preprocess=True the image is cropped, normalised and re-encoded
+    before upload (see preprocess_image_for_ocr); its stats are returned
+    under "preprocess". Preprocessed images are looked up in ocr_cache first
+    and "cache" reports exact/near/db-*/miss, or "coalesced" when an identical
+    upload already in flight supplied the result.
     """
     result = {
         "latex_raw": None,
@@ -370,7 +1472,24 @@ def process_image(image_path: str) -> dict:
         "error": None
     }
     try:
-        latex_raw = send_to_simpletex(image_path, SIMPLETEX_UAT)
+        # Read streams/paths once; PIL images are preprocessed directly
+        source = image if isinstance(image, Image.Image) else read_image_source(image)
+        upload = source
+        if preprocess:
+            try:
+                upload, result["preprocess"] = preprocess_image_for_ocr(source)
+                print(f"[DEBUG] Preprocessed image: {result['preprocess']}")
+            except OSError as prep_error:
+                # Unreadable by PIL: let SimpleTex have the original bytes
+                print(f"[DEBUG] Preprocessing skipped: {prep_error}")
+                upload = source
+
+        if use_cache and "preprocess" in result:
+            latex_raw, result["cache"] = ocr_cache.fetch(
+                upload, perceptual_hash(upload), result["preprocess"]["size"],
+                lambda: send_to_simpletex(upload, SIMPLETEX_UAT))
+        else:
+            latex_raw = send_to_simpletex(upload, SIMPLETEX_UAT)
         result["latex_raw"] = latex_raw
         
         sympy_out = latex_to_sympy_via_latex2sympy(latex_raw)
@@ -394,12 +1513,51 @@ def process_image(image_path: str) -> dict:
         except Exception:
             result["pretty"] = str(sympy_out)
             
+    except OCRUnavailable as e:
+        # Fail fast while SimpleTex is known to be down
+        result["error"] = str(e)
+        result["ocr_unavailable"] = True
+        result["retry_after"] = round(e.retry_after, 1)
     except Exception as e:
         result["error"] = str(e)
         print(f"[DEBUG] process_image error: {e}")
     
     return result
 
+def process_lines(image=None, strokes=None, workers=OCR_LINE_WORKERS, **options) -> dict:
+    """
+    OCR a multi-line drawing (image or stroke payload) one line at a time.
+    The drawing is segmented with segment_lines / segment_strokes and the
+    lines go through process_image concurrently, so a whole worked solution
+    takes about as long as its slowest line. Returns {"lines": [...], "count",
+    "ms", "error"}; each line is a process_image result plus its "index" and
+    "bbox" (top, bottom) in drawing coordinates, in reading order.
+    """
+    start = time.perf_counter()
+    result = {"lines": [], "count": 0, "ms": None, "error": None}
+    try:
+        if strokes is not None:
+            segments = [(rasterize_strokes(line), bbox) for line, bbox in segment_strokes(strokes)]
+        else:
+            segments = segment_lines(image)
+    except (ValueError, OSError) as e:
+        result["error"] = str(e)
+        return result
+    if not segments:
+        result["error"] = "No ink found in image"
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(segments)))) as pool:
+        ocr_results = list(pool.map(lambda seg: process_image(seg[0], **options), segments))
+    for index, ((_, bbox), line) in enumerate(zip(segments, ocr_results)):
+        line.update({"index": index, "bbox": bbox})
+        result["lines"].append(line)
+    result["count"] = len(result["lines"])
+    result["ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if any(line.get("ocr_unavailable") for line in result["lines"]):
+        result["ocr_unavailable"] = True
+    return result
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         SIMPLETEX_UAT = sys.argv[1]
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the SimpleTex /api/latex_ocr endpoint.
+
+Answers multipart uploads with the same JSON shape as SimpleTex, using
+recorded fixtures keyed by the SHA-256 of the uploaded image bytes, so the
+OCR pipeline can be tested and benchmarked without spending quota.
+Latency (log-normal around a median) and error rate are configurable.
+
+Usage:
+    python simpletex_standin.py --port 5090 --fixtures fixtures.json \
+        --latency-ms 300 --latency-sigma 0.4 --error-rate 0.05
+    SIMPLETEX_API_URL=http://127.0.0.1:5090/api/latex_ocr python api/drawing_solver_api.py
+
+fixtures.json maps image SHA-256 (hex) to LaTeX: {"3f2a...": "x^2-4=0"}.
+Use --print-hash on an image to get the key the pipeline will upload.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def image_key(data: bytes) -> str:
+    """Fixture key for uploaded image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _uploaded_file(content_type: str, body: bytes):
+    """Bytes of the 'file' field of a multipart/form-data body, or None"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        return None
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True)
+    return None
+
+
+class SimpleTexStandIn:
+    """
+    Threaded HTTP server mimicking POST /api/latex_ocr.
+    - fixtures: {sha256: latex}; unknown images get default_latex, or an
+      API error ({"status": false}) when default_latex is None
+    - latency_ms / latency_sigma: log-normal latency with that median
+    - error_rate: fraction of requests answered with error_status
+      (503 by default; 200 gives a {"status": false} API error)
+    """
+
+    def __init__(self, fixtures=None, default_latex=None, latency_ms=0.0, latency_sigma=0.0,
+                 error_rate=0.0, error_status=503, host="127.0.0.1", port=0, seed=None):
+        self.fixtures = dict(fixtures or {})
+        self.default_latex = default_latex
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "fixture_hits": 0, "fixture_misses": 0,
+                         "injected_errors": 0, "bad_requests": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/latex_ocr"
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _draw(self):
+        """(latency seconds, inject error?) for one request"""
+        with self._lock:
+            latency = 0.0
+            if self.latency_ms > 0:
+                latency = self.latency_ms / 1000 * self._random.lognormvariate(0, self.latency_sigma)
+            return latency, self._random.random() < self.error_rate
+
+    def respond(self, image_bytes):
+        """(status, payload) for an upload; also used directly by tests"""
+        self._count("requests")
+        latency, fail = self._draw()
+        if latency:
+            time.sleep(latency)
+        request_id = uuid.uuid4().hex
+        if fail:
+            self._count("injected_errors")
+            return self.error_status, {"status": False, "err_info": {"err_msg": "injected error"},
+                                       "request_id": request_id}
+        latex = self.fixtures.get(image_key(image_bytes))
+        if latex is None:
+            self._count("fixture_misses")
+            latex = self.default_latex
+        else:
+            self._count("fixture_hits")
+        if latex is None:
+            return 200, {"status": False, "err_info": {"err_msg": "no fixture for image"},
+                         "request_id": request_id}
+        return 200, {"status": True, "res": {"latex": latex, "conf": 0.99},
+                     "request_id": request_id}
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.split("?")[0] != "/api/latex_ocr":
+                    self._send(404, {"status": False, "err_info": {"err_msg": "not found"}})
+                    return
+                image = _uploaded_file(self.headers.get("Content-Type", ""), body)
+                if not self.headers.get("token") or image is None:
+                    standin._count("bad_requests")
+                    self._send(400, {"status": False,
+                                     "err_info": {"err_msg": "token and file are required"}})
+                    return
+                self._send(*standin.respond(image))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve in a background thread; returns the endpoint URL"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+def load_fixtures(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SimpleTex /api/latex_ocr stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5090)
+    parser.add_argument("--fixtures", help="JSON file mapping image SHA-256 to LaTeX")
+    parser.add_argument("--default-latex", help="LaTeX returned for images without a fixture")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="log-normal spread")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--print-hash", metavar="IMAGE",
+                        help="print the fixture key the OCR pipeline would upload for IMAGE")
+    args = parser.parse_args()
+
+    if args.print_hash:
+        import lcd
+        png_bytes, _ = lcd.preprocess_image_for_ocr(args.print_hash)
+        print(image_key(png_bytes))
+        return
+
+    standin = SimpleTexStandIn(
+        fixtures=load_fixtures(args.fixtures) if args.fixtures else None,
+        default_latex=args.default_latex, latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+        error_status=args.error_status, host=args.host, port=args.port, seed=args.seed)
+    print(f"SimpleTex stand-in listening on {standin.url}")
+    print(f"Fixtures: {len(standin.fixtures)}, latency {args.latency_ms} ms "
+          f"(sigma {args.latency_sigma}), error rate {args.error_rate}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
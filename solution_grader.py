@@ -0,0 +1,1427 @@
+#!/usr/bin/env python3
+"""
+Headless grading of rational-equation solutions.
+
+The checks are the ones check_solution_correctness in step_ocr_checker.py
+applies in the Tkinter app, returned as structured data instead of one
+feedback string, so whole classes can be graded through
+/api/grade and /api/grade/batch (api/drawing_solver_api.py) or from scripts.
+
+A submission is (equation, solution lines, optional final answer):
+
+    grade_submission("(x+2)/(x-1)=2", ["x+2 = 2(x-1)", "x = 4"], "x = 4")
+    grade_batch([{"student_id": "s1", "equation": ..., "lines": [...]}, ...])
+
+Line-by-line scanning uses a GradingSession (or grading_sessions, the
+server-side store behind /api/grade/sessions), which keeps the reference
+and per-line state so each new line costs only its own analysis.
+"""
+
+import os
+import re
+import time
+import uuid
+import random
+import threading
+from collections import Counter, OrderedDict
+from fractions import Fraction
+from functools import lru_cache
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+import sympy as sp
+from sympy.parsing.sympy_parser import (
+    parse_expr,
+    standard_transformations,
+    implicit_multiplication_application,
+    convert_xor,
+)
+
+x = sp.symbols('x')
+
+# Criteria reported for every submission, in feedback order
+CRITERIA = [
+    'denominators',
+    'restrictions',
+    'lcd',
+    'simplified_equation',
+    'verification',
+    'steps',
+    'final_answer',
+]
+
+MAX_BATCH_SUBMISSIONS = 1000
+
+# Grading text arrives from unauthenticated HTTP requests and parse_expr
+# evaluates Python, so only numbers, x, arithmetic, parentheses, '=' and
+# these names are let through, and parsing sees no builtins. Powers are
+# checked on the unevaluated parse first: a tower such as 9**9**9**9 would
+# otherwise tie up the worker computing it.
+MATH_NAMES = {'sqrt': sp.sqrt, 'abs': sp.Abs, 'Abs': sp.Abs, 'pi': sp.pi}
+MAX_MATH_TEXT = 500             # characters per line, equation or answer
+MAX_EXPONENT = 64               # product of the numeric exponents around any term
+_MATH_TEXT_RE = re.compile(r'(?:\d|\.|x|\s|[-+*/^()=]|' + '|'.join(MATH_NAMES) + r')*')
+_SAFE_GLOBALS = {'__builtins__': {}, 'Integer': sp.Integer, 'Float': sp.Float,
+                 'Rational': sp.Rational, 'Symbol': sp.Symbol,
+                 'Add': sp.Add, 'Mul': sp.Mul, 'Pow': sp.Pow, **MATH_NAMES}
+_MATH_TRANSFORMATIONS = standard_transformations + (convert_xor,)
+
+
+def is_math_text(text):
+    """True if `text` only uses the math tokens parse_math() accepts"""
+    return len(text) <= MAX_MATH_TEXT and _MATH_TEXT_RE.fullmatch(text) is not None
+
+
+def _check_powers(expr, scale=1):
+    """Raise ValueError unless every exponent in the unevaluated `expr` is a small number"""
+    if expr.is_Pow:
+        if expr.exp.free_symbols:
+            raise ValueError(f"Exponent {expr.exp} is not a number")
+        # A constant exponent such as 1/2 is itself bounded before it is evaluated
+        _check_powers(expr.exp, scale)
+        exponent = expr.exp.doit()
+        if not exponent.is_Number:
+            raise ValueError(f"Exponent {exponent} is not a number")
+        scale *= max(1, abs(exponent))
+        if scale > MAX_EXPONENT:
+            raise ValueError(f"Exponent too large (limit {MAX_EXPONENT})")
+        _check_powers(expr.base, scale)
+        return
+    for arg in expr.args:
+        _check_powers(arg, scale)
+
+
+def parse_math(text, transformations=_MATH_TRANSFORMATIONS):
+    """
+    SymPy value of a math-only string such as "(x+2)/(x-1)". Raises
+    ValueError for anything outside the math-token whitelist or for an
+    exponent beyond MAX_EXPONENT; this replaces sp.sympify for all grading
+    input.
+    """
+    if not is_math_text(text):
+        raise ValueError(f"Unsupported characters or names in {text.strip()[:60]!r}")
+    text = text.strip()
+    _check_powers(parse_expr(text, local_dict={'x': x}, global_dict=dict(_SAFE_GLOBALS),
+                             transformations=transformations, evaluate=False))
+    return parse_expr(text, local_dict={'x': x}, global_dict=dict(_SAFE_GLOBALS),
+                      transformations=transformations)
+
+
+def normalize_math_expression(expr_str):
+    """Normalize mathematical expressions for SymPy parsing"""
+    normalized = expr_str
+
+    # Replace √n with sqrt(n)
+    normalized = re.sub(r'√(\w+)', r'sqrt(\1)', normalized)
+
+    # Handle ± symbol more intelligently
+    if '±' in normalized:
+        normalized = normalized.replace('±', '+')
+
+    # Replace ^ with **
+    normalized = normalized.replace('^', '**')
+
+    # Handle comma-separated answers like "(a+sqrt(b))/c, (a-sqrt(b))/c"
+    if ',' in normalized:
+        normalized = normalized.split(',')[0].strip()
+
+    # Clean up any extra spaces around operators
+    normalized = re.sub(r'\s*([+\-*/])\s*', r'\1', normalized)
+
+    # Handle brackets consistently
+    normalized = normalized.replace('[', '(').replace(']', ')')
+
+    return normalized
+
+
+def _parse_final_answer(answer):
+    """SymPy value of a stated final answer such as 'x = 4' or '(5 ± √13)/2', or None"""
+    clean_answer = answer.strip().replace('X', 'x')
+    if clean_answer.startswith("x = "):
+        clean_answer = clean_answer[4:]
+    elif clean_answer.startswith("x="):
+        clean_answer = clean_answer[2:]
+    candidates = ([clean_answer.replace("±", "+"), clean_answer.replace("±", "-")]
+                  if "±" in clean_answer else [clean_answer])
+    for candidate in candidates:
+        try:
+            return parse_math(normalize_math_expression(candidate))
+        except Exception:
+            continue
+    return None
+
+
+def _answer_from_lines(student_solution):
+    """Last parseable 'x = ...' line of the solution, or None"""
+    for line in reversed(student_solution):  # Check from last line first
+        if "x =" in line or "x=" in line:
+            try:
+                if "x =" in line:
+                    math_part = line.split("x =", 1)[1].strip()
+                else:
+                    math_part = line.split("x=", 1)[1].strip()
+                math_part = normalize_math_expression(math_part)
+                return parse_math(math_part)
+            except Exception:
+                continue
+    return None
+
+
+# Keyword classes, matched as substrings of the lower-cased line the way the
+# checkers' `any(word in line_lower for word in [...])` tests did
+KEYWORD_CLASSES = {
+    'kw_denominator': ("denominator", "denominators", "denom", "lcd", "least common denominator"),
+    'kw_restriction': ("restriction", "restrictions", "excluded", "cannot", "≠", "!=", "not equal",
+                       "not equal to"),
+    'kw_restriction_context': ("restriction", "restrictions", "excluded", "cannot", "≠", "!=",
+                               "not equal", "not equal to", "undefined", "domain", "not allowed"),
+    'kw_lcd': ("multiply both sides by", "multiply by", "lcd", "least common denominator"),
+    'kw_multiply': ("multiply", "times"),
+    'kw_verification': ("verify", "verification", "check", "substitute", "substitution", "test",
+                        "testing", "plug in", "plugging in", "lhs", "rhs", "left side", "right side",
+                        "both sides", "balance", "balanced"),
+    'kw_verification_work': ("check", "verify", "test", "substitute", "lhs", "rhs"),
+    'kw_verification_follow': ("check", "verify", "test", "substitute", "lhs", "rhs", "left", "right"),
+    'kw_verification_strict': ("check", "verify", "test", "substitute"),
+    'kw_check_label': ("check:", "verify:", "test:"),
+    'kw_side_values': ("lhs =", "rhs =", "left side =", "right side =", "left=", "right="),
+    'kw_side_calculation': ("lhs =", "rhs =", "left side =", "right side ="),
+    'kw_when_x': ("when x =",),
+    'kw_x_equals': ("x =",),
+}
+
+# Character and pattern features of the line as written
+LINE_FEATURES = [
+    'digit',            # any digit (str.isdigit, so "x²" counts)
+    'ascii_digit',      # any of 0-9
+    'x',                # lower-case x
+    'x_any',            # x or X
+    'equals', 'slash', 'star', 'colon', 'approx', 'neq', 'bang_eq', 'divide', 'not',
+    'parens',           # both "(" and ")"
+    'paren_or_slash',   # any of "(", ")", "/"
+    'operator',         # any of + - * / =
+    'assigns_x',        # "x =" or "x=" as written
+    'long',             # more than 5 characters
+    'restriction_pattern',  # "x ≠ 3", "x not equal to 3", "x cannot be 3"
+]
+
+FEATURE_NAMES = list(KEYWORD_CLASSES) + LINE_FEATURES
+FEATURE_BITS = {name: 1 << i for i, name in enumerate(FEATURE_NAMES)}
+
+# One alternation over every keyword, longest first. A match also implies
+# every keyword contained in it ("balanced" → "balance", "lhs =" → "lhs"),
+# so non-overlapping matching still finds every class present.
+_KEYWORD_CLASS_BITS = {}
+for _name, _words in KEYWORD_CLASSES.items():
+    for _word in _words:
+        _KEYWORD_CLASS_BITS[_word] = _KEYWORD_CLASS_BITS.get(_word, 0) | FEATURE_BITS[_name]
+_KEYWORD_BITS = {word: 0 for word in _KEYWORD_CLASS_BITS}
+for _word in _KEYWORD_BITS:
+    for _other, _bits in _KEYWORD_CLASS_BITS.items():
+        if _other in _word:
+            _KEYWORD_BITS[_word] |= _bits
+_KEYWORD_RE = re.compile("|".join(re.escape(word) for word in
+                                  sorted(_KEYWORD_BITS, key=len, reverse=True)))
+
+_RESTRICTION_RE = re.compile(r'x\s*[≠!]\s*\d+|x\s+not\s+equal\s+to\s+\d+|x\s+cannot\s+be\s+\d+')
+
+_CHAR_BITS = {
+    '=': FEATURE_BITS['equals'] | FEATURE_BITS['operator'],
+    '/': FEATURE_BITS['slash'] | FEATURE_BITS['paren_or_slash'] | FEATURE_BITS['operator'],
+    '*': FEATURE_BITS['star'] | FEATURE_BITS['operator'],
+    '+': FEATURE_BITS['operator'],
+    '-': FEATURE_BITS['operator'],
+    ':': FEATURE_BITS['colon'],
+    '≈': FEATURE_BITS['approx'],
+    '≠': FEATURE_BITS['neq'],
+    '÷': FEATURE_BITS['divide'],
+    '(': FEATURE_BITS['paren_or_slash'],
+    ')': FEATURE_BITS['paren_or_slash'],
+    'x': FEATURE_BITS['x'] | FEATURE_BITS['x_any'],
+    'X': FEATURE_BITS['x_any'],
+}
+_CHAR_BITS.update({digit: FEATURE_BITS['digit'] | FEATURE_BITS['ascii_digit'] for digit in "0123456789"})
+
+
+@lru_cache(maxsize=None)
+def feature_mask(names):
+    """Bitmask for a tuple of feature names"""
+    bits = 0
+    for name in names:
+        bits |= FEATURE_BITS[name]
+    return bits
+
+
+class LineFeatures(NamedTuple):
+    """Compact per-line feature vector: FEATURE_NAMES packed into `flags`"""
+    index: int
+    text: str
+    compact: str    # text without spaces, for matching denominators
+    flags: int
+
+    def has(self, *names):
+        """True if every named feature is present"""
+        bits = feature_mask(names)
+        return self.flags & bits == bits
+
+    def any_of(self, *names):
+        return bool(self.flags & feature_mask(names))
+
+    @property
+    def is_answer(self):
+        """States a value for x, e.g. "x = 4" """
+        return self.has('assigns_x', 'digit')
+
+    def names(self):
+        return [name for name in FEATURE_NAMES if self.flags & FEATURE_BITS[name]]
+
+
+def line_features(line, index=0):
+    """Feature vector of one line: one pass over its characters and one keyword scan"""
+    flags = 0
+    chars = set(line)
+    for char in chars:
+        bits = _CHAR_BITS.get(char)
+        if bits is not None:
+            flags |= bits
+        elif char.isdigit():
+            flags |= FEATURE_BITS['digit']
+    if '(' in chars and ')' in chars:
+        flags |= FEATURE_BITS['parens']
+    lower = line.lower()
+    for match in _KEYWORD_RE.finditer(lower):
+        flags |= _KEYWORD_BITS[match.group()]
+    if "!=" in line:
+        flags |= FEATURE_BITS['bang_eq']
+    if "not" in line:
+        flags |= FEATURE_BITS['not']
+    if "x =" in line or "x=" in line:
+        flags |= FEATURE_BITS['assigns_x']
+    if len(line) > 5:
+        flags |= FEATURE_BITS['long']
+    # Implicit restriction statements like "x ≠ 3"
+    if ((flags & (FEATURE_BITS['neq'] | FEATURE_BITS['bang_eq'])
+         or flags & FEATURE_BITS['x'] and flags & FEATURE_BITS['not'])
+            and _RESTRICTION_RE.search(lower)):
+        flags |= FEATURE_BITS['restriction_pattern']
+    return LineFeatures(index, line, line.replace(" ", ""), flags)
+
+
+def extract_features(lines):
+    """Feature vectors for a whole solution, indexed by line position"""
+    return [line_features(line, index) for index, line in enumerate(lines)]
+
+
+MENTION_FLAGS = [
+    'mentions_denominators',
+    'mentions_restrictions',
+    'mentions_lcd',
+    'shows_simplified_equation',
+    'mentions_verification',
+    'shows_verification_work',
+]
+
+
+def _update_mentions(flags, features, i, reference):
+    """
+    Fold line i into the criteria flags. Only lines up to i are read, so
+    lines can be added one at a time: checks that look at the line after
+    another are applied to line i - 1 once line i arrives.
+    """
+    f = features[i]
+    previous = features[i - 1] if i > 0 else None
+    # "x = 5" followed by substitution; "check:" followed by calculations
+    if previous is not None:
+        if previous.has('assigns_x') and f.has('kw_verification_follow'):
+            flags['shows_verification_work'] = True
+        if previous.has('kw_check_label') and f.has('digit') and f.any_of('equals', 'paren_or_slash'):
+            flags['shows_verification_work'] = True
+
+    # Explicit or implicit denominator / restriction / LCD mentions
+    if f.has('kw_denominator') or f.has('parens', 'slash', 'x'):
+        flags['mentions_denominators'] = True
+    if f.has('kw_restriction') or f.has('restriction_pattern'):
+        flags['mentions_restrictions'] = True
+    if f.has('kw_lcd') or f.has('star', 'parens', 'slash'):
+        flags['mentions_lcd'] = True
+        flags['mentions_denominators'] = True  # If they use LCD, they're working with denominators
+    # Simplified equation (no fractions, just x terms)
+    if f.has('equals', 'x_any', 'long') and not f.any_of('slash', 'divide'):
+        flags['shows_simplified_equation'] = True
+
+    if f.has('kw_verification'):
+        flags['mentions_verification'] = True
+    # Verification calculations: a value with verification language
+    if f.any_of('equals', 'approx', 'neq') and f.has('x_any', 'digit', 'kw_verification_work'):
+        flags['shows_verification_work'] = True
+    # Fraction calculations that look like verification
+    if f.has('slash', 'digit', 'kw_verification_strict') and f.any_of('equals', 'approx'):
+        flags['shows_verification_work'] = True
+    # "LHS = ..." and "RHS = ..." patterns
+    if f.has('kw_side_values'):
+        flags['shows_verification_work'] = True
+    # Substitution with specific values, e.g. "when x = 3: (3+2)/(3-1) = 5/2"
+    if (f.has('kw_when_x') or f.has('kw_x_equals', 'colon')) and f.has('paren_or_slash', 'digit'):
+        flags['shows_verification_work'] = True
+    # Fraction work within three lines after "x = [number]"
+    if f.has('slash', 'digit') and any(prev.is_answer for prev in features[max(0, i - 3):i]):
+        flags['shows_verification_work'] = True
+
+    # AUTO-DETECT: If student shows work with denominators, they implicitly know about them
+    if reference.denominators:
+        if any(denom_str in f.text or compact in f.compact
+               for denom_str, compact in zip(reference.denominator_strs, reference.compact_denominator_strs)):
+            flags['mentions_denominators'] = True
+        # Restriction values only count next to restriction language
+        if f.has('kw_restriction_context') and any(restriction_str in f.text
+                                                   for restriction_str in reference.restriction_strs):
+            flags['mentions_restrictions'] = True
+        # Multiplication by a denominator, e.g. "(x-1)*[...]" or "multiply by (x-1)"
+        if f.any_of('star', 'kw_multiply') and any(denom_str in f.text
+                                                   for denom_str in reference.denominator_strs):
+            flags['mentions_lcd'] = True
+
+
+def _mentions(features, reference):
+    """Which solution criteria the student's lines address (keyword and pattern based)"""
+    flags = dict.fromkeys(MENTION_FLAGS, False)
+    for i in range(len(features)):
+        _update_mentions(flags, features, i, reference)
+    return flags
+
+
+def analyze_verification_context(features):
+    """
+    Verification score and details from the structure of the solution:
+    verification language, LHS/RHS calculations and substitution work after
+    the answer line. `features` come from extract_features.
+    """
+    verification_score = 0
+    verification_details = []
+    answer_found = False
+    verification_after_answer = False
+
+    for f in features:
+        i = f.index
+        if f.is_answer:
+            answer_found = True
+            verification_details.append(f"Final answer found on line {i+1}: {f.text}")
+            # Look at next few lines for verification
+            for follow in features[i + 1:i + 4]:
+                if follow.has('kw_verification_follow'):
+                    verification_after_answer = True
+                    verification_details.append(f"Verification found on line {follow.index+1}: {follow.text}")
+                    verification_score += 2
+                    break
+
+        if f.has('kw_verification_strict'):
+            verification_score += 1
+            verification_details.append(f"Verification keyword on line {i+1}: {f.text}")
+
+        if f.has('kw_side_calculation'):
+            verification_score += 2
+            verification_details.append(f"Side-by-side verification on line {i+1}: {f.text}")
+
+        # Substitution work (fraction calculations) shortly after the answer
+        if f.has('slash', 'digit') and any(prev.is_answer for prev in features[max(0, i - 3):i]):
+            verification_score += 2
+            verification_details.append(f"Substitution verification on line {i+1}: {f.text}")
+
+    if answer_found and verification_after_answer:
+        verification_score += 1
+        verification_details.append("Bonus: Verification follows the answer logically")
+
+    return verification_score, verification_details
+
+
+def get_detailed_verification_analysis(features):
+    """Lines describing the answer line and the substitution work detected after it"""
+    analysis = []
+    answer = next((f for f in features if f.is_answer), None)
+    if answer is not None:
+        analysis.append(f"📝 Final answer found on line {answer.index + 1}: {answer.text}")
+        verification_lines = [f"Line {f.index + 1}: {f.text}"
+                              for f in features[answer.index + 1:] if f.has('slash', 'digit')]
+        if verification_lines:
+            analysis.append("🔍 Verification work detected after the answer:")
+            for v_line in verification_lines:
+                analysis.append(f"   {v_line}")
+            analysis.append("✅ This shows you're checking your work by substitution!")
+        else:
+            analysis.append("💡 No verification work detected after the answer")
+    return analysis
+
+
+# Typical wrong turns, replayed once per equation (build_mistake_index) so a
+# wrong final answer is diagnosed by a dict lookup at grading time
+MISTAKES = {
+    'kept_excluded_root': "kept x = {value}, which makes a denominator zero",
+    'sign_error': "sign error distributing the LCD over {term}",
+    'unmultiplied_term': "forgot to multiply {term} by the LCD",
+    'dropped_denominator': "dropped the denominator of {term}",
+}
+
+
+def answer_key(value):
+    """Hash key for a (real) answer value, equal for numerically equal answers"""
+    try:
+        return round(float(sp.N(value, 15)), 9) + 0.0
+    except (TypeError, ValueError):
+        return None
+
+
+def _side_terms(expr):
+    return list(expr.args) if expr.is_Add else [expr]
+
+
+def _mistaken_equations(reference):
+    """(mistake, term, residual) for every perturbed way of clearing the fractions"""
+    lcd = reference.lcd
+    sides = [(1, _side_terms(reference.lhs)), (-1, _side_terms(reference.rhs))]
+    cleared = [[sp.expand(sp.cancel(term * lcd)) for term in terms] for _, terms in sides]
+    total = sum(sign * sum(parts) for (sign, _), parts in zip(sides, cleared))
+
+    for (sign, terms), parts in zip(sides, cleared):
+        for term, part in zip(terms, parts):
+            num, den = sp.fraction(sp.together(term))
+            if x not in den.free_symbols:
+                # The term is left as it was while the fractions are cleared
+                if reference.denominators:
+                    yield 'unmultiplied_term', term, total - sign * (part - term)
+                continue
+            # The denominator simply disappears; any other fractions are still cleared
+            dropped = reference.lhs - reference.rhs + sign * (num - term)
+            yield 'dropped_denominator', term, sp.fraction(sp.together(dropped))[0]
+            # "- (a + b)" written as "- a + b" once multiplied out
+            if term.could_extract_minus_sign():
+                negated = sp.expand(-part)
+                if negated.is_Add:
+                    first = negated.as_ordered_terms()[0]
+                    rest = negated - first
+                    yield 'sign_error', term, total - sign * (part - (-first + rest))
+
+
+def build_mistake_index(reference):
+    """
+    {answer_key: [{'mistake', 'description'}, ...]} of the answers the
+    MISTAKES produce for `reference`, excluding the true solutions.
+    """
+    index = {}
+    correct = {answer_key(sol) for sol in reference.solutions}
+
+    def add(root, mistake, **fields):
+        key = answer_key(root)
+        if key is None or key in correct:
+            return
+        entry = {'mistake': mistake, 'description': MISTAKES[mistake].format(**fields)}
+        if entry not in index.setdefault(key, []):
+            index[key].append(entry)
+
+    for sol in reference.extraneous_solutions:
+        add(sol, 'kept_excluded_root', value=sp.sstr(sol))
+    for mistake, term, residual in _mistaken_equations(reference):
+        residual = sp.expand(residual)
+        if residual == 0 or not residual.is_polynomial(x):
+            continue
+        try:
+            roots = sp.solve(residual, x)
+        except Exception:
+            continue
+        for root in roots:
+            if root.is_real:
+                add(root, mistake, term=sp.sstr(term))
+    return index
+
+
+class EquationReference:
+    """
+    Everything the checkers need to know about one equation, computed once:
+    parsed sides, denominators (and their sstr forms), restrictions, LCD,
+    the equation cleared of fractions, its roots, the true solutions
+    (roots that do not make a denominator zero) and its values at the
+    step-check points. Build it with
+    get_reference() so every submission on the same equation shares it.
+    """
+
+    def __init__(self, equation):
+        if "=" not in equation:
+            raise ValueError("Invalid equation format. Missing '='.")
+        self.equation = equation
+        lhs_str, rhs_str = equation.split("=", 1)
+        self.lhs, self.rhs = map(parse_math, [lhs_str, rhs_str])
+
+        self.denominators = []
+        restrictions = set()
+        for expr in [self.lhs, self.rhs]:
+            for arg in (expr.args if expr.is_Add else [expr]):
+                num, den = sp.fraction(sp.together(arg))
+                if den != 1:
+                    self.denominators.append(den)
+                    try:
+                        sols = sp.solve(den, x)
+                        if sols and hasattr(sols, '__iter__') and not isinstance(sols, bool):
+                            restrictions.update(sols)
+                    except Exception:
+                        pass
+        self.restrictions = sorted(restrictions, key=sp.default_sort_key)
+        self.denominator_strs = [sp.sstr(d) for d in self.denominators]
+        self.compact_denominator_strs = [d.replace(" ", "") for d in self.denominator_strs]
+        self.restriction_strs = [sp.sstr(r) for r in self.restrictions]
+
+        self.lcd = sp.lcm([sp.factor(d) for d in self.denominators]) if self.denominators else sp.Integer(1)
+        if self.denominators:
+            self.simplified_lhs = sp.expand(sp.simplify(self.lhs * self.lcd))
+            self.simplified_rhs = sp.expand(sp.simplify(self.rhs * self.lcd))
+        else:
+            self.simplified_lhs, self.simplified_rhs = self.lhs, self.rhs
+        self.standard_form = sp.expand(self.simplified_lhs - self.simplified_rhs)
+        self.candidate_solutions = sp.solve(self.standard_form, x)
+        self.solutions = [sol for sol in self.candidate_solutions
+                          if not any(sp.simplify(den.subs(x, sol)) == 0 for den in self.denominators)]
+        self.extraneous_solutions = [sol for sol in self.candidate_solutions if sol not in self.solutions]
+        # Exact values at the step-check points, for check_steps()
+        self.residual_values = exact_values(self.lhs - self.rhs)
+        self.residual_numerator = residual_numerator(self.lhs - self.rhs)
+        self.multiplier_values = step_multipliers(self.lcd)
+        self.mistakes = build_mistake_index(self)
+        self.step_graph = build_step_graph(self)
+        self._info = None
+
+    def matches_solution(self, value):
+        """True if value is (numerically) one of the true solutions"""
+        return any(abs(sp.N(value - sol, 8)) < 1e-8 for sol in self.solutions)
+
+    def diagnose(self, value):
+        """Catalogued mistakes that lead to the (wrong) answer `value`, or []"""
+        return [dict(entry) for entry in self.mistakes.get(answer_key(value), [])]
+
+    def info(self):
+        """JSON-friendly summary (formatted once, copied per call)"""
+        if self._info is None:
+            self._info = {
+                'equation': f"{sp.sstr(self.lhs)} = {sp.sstr(self.rhs)}",
+                'denominators': list(self.denominator_strs),
+                'restrictions': list(self.restriction_strs),
+                'lcd': sp.sstr(sp.factor(self.lcd)),
+                'simplified_equation': f"{sp.sstr(self.simplified_lhs)} = {sp.sstr(self.simplified_rhs)}",
+                'solutions': [sp.sstr(sol) for sol in self.solutions],
+                'extraneous_solutions': [sp.sstr(sol) for sol in self.extraneous_solutions],
+            }
+        return {key: list(value) if isinstance(value, list) else value for key, value in self._info.items()}
+
+
+REFERENCE_CACHE_SIZE = 256
+
+
+class EquationReferenceCache:
+    """LRU of EquationReference objects keyed by the equation without whitespace"""
+
+    def __init__(self, maxsize=REFERENCE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._references = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(equation):
+        return re.sub(r'\s+', '', equation.replace('X', 'x'))
+
+    def get(self, equation):
+        key = self.key(equation)
+        with self._lock:
+            reference = self._references.get(key)
+            if reference is not None:
+                self._references.move_to_end(key)
+                self.hits += 1
+                return reference
+            self.misses += 1
+        # Built outside the lock; a concurrent duplicate build is harmless
+        reference = EquationReference(key)
+        with self._lock:
+            self._references[key] = reference
+            self._references.move_to_end(key)
+            while len(self._references) > self.maxsize:
+                self._references.popitem(last=False)
+        return reference
+
+    def clear(self):
+        with self._lock:
+            self._references.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._references), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / total, 3) if total else 0.0}
+
+
+reference_cache = EquationReferenceCache()
+
+
+def get_reference(equation):
+    """Shared EquationReference for `equation`; raises ValueError/SyntaxError if it does not parse"""
+    if isinstance(equation, EquationReference):
+        return equation
+    return reference_cache.get(equation)
+
+
+# Step checking: every parsed step is evaluated at the same random rational
+# points with exact Fraction arithmetic; two steps are equivalent when their
+# residuals (lhs - rhs) are proportional, optionally after multiplying by the
+# LCD or one of its factors. Symbolic simplify() per line is far too slow.
+STEP_CHECK_POINTS = 6
+STEP_CHECK_MIN_POINTS = 3
+STEP_CHECK_SEED = 20240607
+_STEP_RNG = random.Random(STEP_CHECK_SEED)
+STEP_POINTS = tuple(Fraction(_STEP_RNG.randint(-997, 997) or 1, _STEP_RNG.randint(2, 97))
+                    for _ in range(STEP_CHECK_POINTS))
+
+_STEP_TRANSFORMATIONS = standard_transformations + (implicit_multiplication_application, convert_xor)
+_STEP_LABEL_RE = re.compile(r'^\s*[A-Za-z][A-Za-z ]*\d*\s*:\s*')
+_STEP_REPLACEMENTS = str.maketrans({'−': '-', '–': '-', '×': '*', '·': '*', '÷': '/',
+                                    '²': '^2', '³': '^3', 'X': 'x', '[': '(', ']': ')'})
+
+
+def _exact_value(expr, point):
+    """expr at x = point in exact rational arithmetic; ZeroDivisionError at a pole"""
+    if expr.is_Symbol:
+        return point
+    if expr.is_Rational:
+        return Fraction(int(expr.p), int(expr.q))
+    if expr.is_Float:
+        return Fraction(str(expr))
+    if expr.is_Add:
+        return sum((_exact_value(arg, point) for arg in expr.args), Fraction(0))
+    if expr.is_Mul:
+        value = Fraction(1)
+        for arg in expr.args:
+            value *= _exact_value(arg, point)
+        return value
+    if expr.is_Pow and expr.exp.is_Integer:
+        return _exact_value(expr.base, point) ** int(expr.exp)
+    raise ValueError(f"Cannot evaluate {expr} exactly")
+
+
+def exact_values(expr):
+    """expr at every STEP_POINTS point (None at a pole), or None if expr is not rational in x"""
+    values = []
+    for point in STEP_POINTS:
+        try:
+            values.append(_exact_value(expr, point))
+        except ZeroDivisionError:
+            values.append(None)
+        except ValueError:
+            return None
+    return tuple(values)
+
+
+@lru_cache(maxsize=4096)
+def parse_step(line):
+    """
+    (lhs, rhs) of a solution line such as "2x + 4 = 3(x - 1)", or None if
+    the line is not a single equation in x (labels, restrictions, numeric
+    verification such as "LHS = 6/3 = 2", ...).
+    """
+    text = _STEP_LABEL_RE.sub('', line).translate(_STEP_REPLACEMENTS)
+    if text.count('=') != 1 or 'x' not in text or not is_math_text(text):
+        return None
+    try:
+        lhs, rhs = (parse_math(side, _STEP_TRANSFORMATIONS) for side in text.split('='))
+    except Exception:
+        return None
+    if not all(isinstance(side, sp.Expr) and side.free_symbols <= {x} for side in (lhs, rhs)):
+        return None
+    return lhs, rhs
+
+
+def residual_numerator(expr):
+    """
+    Numerator of `expr` in lowest terms as a Poly in x, or None if not a
+    polynomial. Cancelling matters: a denominator factor left in the
+    numerator would count as a zero-product branch.
+    """
+    try:
+        return sp.Poly(sp.fraction(sp.cancel(sp.together(expr)))[0], x)
+    except sp.PolynomialError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def step_numerator(line):
+    """residual_numerator() of lhs - rhs for a solution line, or None"""
+    sides = parse_step(line)
+    return None if sides is None else residual_numerator(sides[0] - sides[1])
+
+
+def _factor_of(line, numerator, restrictions=()):
+    """
+    True if `line` sets a proper factor of `numerator` (a Poly in x) to
+    zero: its zero set is part of the zero set of `numerator`, as in
+    "x - 2 = 0" after "(x - 2)(x - 3) = 0". A factor that vanishes at one
+    of the equation's `restrictions` is never a valid branch.
+    """
+    if numerator is None:
+        return False
+    factor = step_numerator(line)
+    if factor is None or not 0 < factor.degree() < numerator.degree():
+        return False
+    if any(sp.simplify(factor.eval(point)) == 0 for point in restrictions):
+        return False
+    return numerator.rem(factor).is_zero
+
+
+@lru_cache(maxsize=4096)
+def step_values(line):
+    """
+    ('answer' | 'equation', residual values at STEP_POINTS) for a solution
+    line, or None if it is not a checkable equation. "x = value" lines are
+    answers: the final-answer criterion judges them, not the step check.
+    """
+    sides = parse_step(line)
+    if sides is None:
+        return None
+    lhs, rhs = sides
+    values = exact_values(lhs - rhs)
+    if values is None:
+        return None
+    is_answer = (lhs == x and x not in rhs.free_symbols) or (rhs == x and x not in lhs.free_symbols)
+    return ('answer' if is_answer else 'equation'), values
+
+
+def _proportional(values, base, multipliers):
+    """values == c * base * m for one multiplier vector m and a constant c != 0"""
+    for multiplier in multipliers:
+        ratio = None
+        usable = 0
+        for value, base_value, m in zip(values, base, multiplier):
+            if value is None or base_value is None or m is None:
+                continue
+            scaled = base_value * m
+            if scaled == 0:
+                if value != 0:
+                    break
+                continue
+            if ratio is None:
+                ratio = value / scaled
+                if ratio == 0:
+                    break
+            elif value / scaled != ratio:
+                break
+            usable += 1
+        else:
+            if ratio is not None and usable >= STEP_CHECK_MIN_POINTS:
+                return True
+    return False
+
+
+def step_multipliers(lcd):
+    """1, the LCD, each factor of the LCD, and their reciprocals, as value vectors"""
+    factors = [sp.Integer(1), lcd] + [base**power for base, power in sp.factor_list(lcd)[1]]
+    multipliers = []
+    for factor in factors:
+        values = exact_values(factor)
+        if values is None or values in multipliers:
+            continue
+        multipliers.append(values)
+        multipliers.append(tuple(None if v in (None, 0) else 1 / v for v in values))
+    return multipliers
+
+
+class CheckedStep(NamedTuple):
+    """The last checked step, carried from line to line by check_steps()"""
+    values: tuple           # residual values at STEP_POINTS
+    line: str
+    parent: object          # the CheckedStep a branch line is a factor of, else None
+
+
+def _check_step(index, line, previous, reference):
+    """
+    Status of one line given the last checked step (a CheckedStep or None).
+    Returns (step, checked); checked is None unless the line was checked.
+
+    A line that sets one factor of the previous step (or of the original
+    equation) to zero is a branch of the zero-product rule: it 'follows'
+    as 'branch', and the next branch is checked against the same parent.
+    """
+    step = {'index': index, 'line': line, 'status': 'skipped', 'follows': None}
+    parsed = step_values(line)
+    if parsed is None:
+        return step, None
+    kind, values = parsed
+    if kind == 'answer':
+        step['status'] = 'answer'
+        return step, None
+    original = reference.residual_values
+    multipliers = reference.multiplier_values
+    parent = None
+    if previous is not None and _proportional(values, previous.values, multipliers):
+        step.update(status='ok', follows='previous')
+    elif original is not None and _proportional(values, original, multipliers):
+        step.update(status='ok', follows='original')
+    else:
+        for candidate in (previous, previous and previous.parent):
+            if candidate is not None and _factor_of(line, step_numerator(candidate.line),
+                                                    reference.restrictions):
+                parent = candidate
+                break
+        if parent is not None or _factor_of(line, reference.residual_numerator, reference.restrictions):
+            step.update(status='ok', follows='branch')
+        else:
+            step['status'] = 'broken'
+    return step, CheckedStep(values, line, parent)
+
+
+def check_steps(lines, reference):
+    """
+    Check each parsed step against the previous one and against the
+    original equation (modulo multiplication by the LCD); "factor = 0"
+    lines after a factored step are accepted as branches.
+
+    Returns {'steps': [{'index', 'line', 'status', 'follows'}], 'checked',
+    'first_error' (index of the first broken line or None), 'ms'}; status is
+    'ok', 'broken', 'answer' (x = value lines) or 'skipped' (not an equation).
+    """
+    start = time.perf_counter()
+    reference = get_reference(reference)
+    steps = []
+    previous = None
+    first_error = None
+    checked = 0
+    for index, line in enumerate(lines):
+        step, checked_step = _check_step(index, line, previous, reference)
+        steps.append(step)
+        if checked_step is None:
+            continue
+        checked += 1
+        if step['status'] == 'broken' and first_error is None:
+            first_error = index
+        previous = checked_step
+    return {'steps': steps, 'checked': checked, 'first_error': first_error,
+            'ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+# Next-step hints: build_step_graph() lays out the worked solution of an
+# equation as a chain of forms; next_step_hint() places a student's latest
+# line on the nearest form and returns the step after it
+STEP_GRAPH_NODES = [
+    ('equation', "Original equation"),
+    ('denominators_factored', "Denominators factored"),
+    ('lcd_identified', "LCD identified"),
+    ('terms_multiplied', "Each term multiplied by the LCD"),
+    ('cleared_polynomial', "Cleared polynomial"),
+    ('factored', "Factored form"),
+    ('roots', "Roots"),
+    ('verified_roots', "Verified roots"),
+]
+
+
+class StepNode(NamedTuple):
+    """One intermediate form of the worked solution"""
+    id: str
+    title: str
+    instruction: str        # how to get here from the previous node
+    form: str
+    signature: tuple        # _form_signature of `form`, for equation nodes
+
+    def as_dict(self):
+        return {'id': self.id, 'title': self.title, 'instruction': self.instruction, 'form': self.form}
+
+
+def _form_signature(lhs, rhs):
+    """(has x in a denominator, multiplied out, one side zero, product of factors) of an equation"""
+    has_fraction = any(power.exp.is_negative and x in power.base.free_symbols
+                       for side in (lhs, rhs) for power in side.atoms(sp.Pow))
+    expanded = not has_fraction and all(sp.expand(side) == side for side in (lhs, rhs))
+    zero_side = lhs == 0 or rhs == 0
+    other = rhs if lhs == 0 else lhs
+    product = zero_side and other.is_Mul and sum(1 for arg in other.args if x in arg.free_symbols) >= 2
+    return has_fraction, expanded, zero_side, bool(product)
+
+
+def _list_values(values):
+    return ", ".join(f"x = {sp.sstr(value)}" for value in values) or "no values"
+
+
+def build_step_graph(reference):
+    """The StepNodes of `reference`'s worked solution, in order; skips steps that do not apply"""
+    nodes = []
+
+    def add(node_id, instruction, form, sides=None):
+        title = dict(STEP_GRAPH_NODES)[node_id]
+        nodes.append(StepNode(node_id, title, instruction, form,
+                              _form_signature(*sides) if sides is not None else ()))
+
+    add('equation', "Start from the equation", f"{sp.sstr(reference.lhs)} = {sp.sstr(reference.rhs)}",
+        (reference.lhs, reference.rhs))
+    if reference.denominators:
+        factored = list(dict.fromkeys(sp.sstr(sp.factor(den)) for den in reference.denominators
+                                      if x in den.free_symbols))
+        add('denominators_factored',
+            f"Factor each denominator ({', '.join(factored)}) and note the restrictions "
+            f"x ≠ {', '.join(reference.restriction_strs)}",
+            "Denominators: " + ", ".join(factored))
+        lcd = sp.sstr(sp.factor(reference.lcd))
+        add('lcd_identified', f"Find the LCD of the denominators: {lcd}", f"LCD = {lcd}")
+        multiplied = [sp.Add(*[sp.factor(sp.cancel(term * reference.lcd)) for term in _side_terms(side)])
+                      for side in (reference.lhs, reference.rhs)]
+        add('terms_multiplied', f"Multiply every term on both sides by {lcd} and cancel",
+            f"{sp.sstr(multiplied[0])} = {sp.sstr(multiplied[1])}", multiplied)
+    standard = reference.standard_form
+    if standard.is_polynomial(x) and standard != 0 and sp.Poly(standard, x).LC() < 0:
+        standard = -standard    # leading coefficient positive, as it would be written
+    add('cleared_polynomial', "Multiply out and collect every term on one side",
+        f"{sp.sstr(standard)} = 0", (standard, sp.Integer(0)))
+    factored_form = sp.factor(standard)
+    factored = factored_form.is_Mul and sum(1 for arg in factored_form.args if x in arg.free_symbols) >= 2
+    if factored:
+        add('factored', "Factor the polynomial", f"{sp.sstr(factored_form)} = 0",
+            (factored_form, sp.Integer(0)))
+    # What solving the cleared equation leaves, from the reference rather than a fixed recipe
+    if x not in standard.free_symbols:
+        solve = (f"The x terms cancel, leaving {sp.sstr(standard)} = 0, which is never true, "
+                 f"so the equation has no solution" if standard != 0 else
+                 "Both sides agree for every x, so every value except the restrictions is a solution")
+    else:
+        solve = ("Set each factor to zero and solve for x" if factored
+                 else f"Solve {sp.sstr(standard)} = 0 for x")
+        if reference.candidate_solutions and not reference.solutions:
+            solve += (f"; {_list_values(reference.extraneous_solutions)} makes a denominator zero, "
+                      f"so the equation has no solution")
+    add('roots', solve, _list_values(reference.candidate_solutions))
+    if not reference.candidate_solutions:
+        verify = "There are no roots to check - the equation has no solution"
+    elif reference.extraneous_solutions:
+        verify = (f"Check the roots against the restrictions: {_list_values(reference.extraneous_solutions)} "
+                  f"makes a denominator zero, so reject it")
+    else:
+        verify = "Substitute each root into the original equation to verify it"
+    add('verified_roots', verify,
+        f"Solution: {_list_values(reference.solutions)}" if reference.solutions else "No solution")
+    return nodes
+
+
+def _match_step_node(reference, line):
+    """(node index or None, status) for one solution line; status is 'skipped' if it says nothing"""
+    nodes = reference.step_graph
+    ids = [node.id for node in nodes]
+    features = line_features(line)
+    parsed = step_values(line)
+    if parsed is not None and parsed[0] == 'answer':
+        value = _answer_from_lines([line])
+        if value is None:
+            return None, 'skipped'
+        if not any(answer_key(value) == answer_key(sol) for sol in reference.candidate_solutions):
+            return None, 'off_track'
+        last = 'verified_roots' if features.any_of('kw_verification', 'kw_side_values') else 'roots'
+        return ids.index(last), 'on_track'
+    if features.any_of('kw_verification', 'kw_side_values', 'kw_check_label'):
+        return ids.index('verified_roots'), 'on_track'
+    if parsed is not None:
+        values = parsed[1]
+        original = reference.residual_values
+        if original is None or not _proportional(values, original, reference.multiplier_values):
+            if _factor_of(line, reference.residual_numerator, reference.restrictions):
+                # "x - 2 = 0": one branch of the factored form, roots still to solve
+                return ids.index('factored' if 'factored' in ids else 'roots'), 'on_track'
+            return None, 'off_track'
+        signature = _form_signature(*parse_step(line))
+        candidates = [i for i, node in enumerate(nodes) if node.signature]
+        # Nearest form; ties go to the later node (the student is further along)
+        return min(candidates, key=lambda i: (sum(a != b for a, b in zip(nodes[i].signature, signature)),
+                                              -i)), 'on_track'
+    for keywords, node_id in ((('kw_lcd',), 'lcd_identified'),
+                              (('kw_denominator', 'kw_restriction'), 'denominators_factored')):
+        if features.any_of(*keywords) and node_id in ids:
+            return ids.index(node_id), 'on_track'
+    if features.has('restriction_pattern') and 'denominators_factored' in ids:
+        return ids.index('denominators_factored'), 'on_track'
+    return None, 'skipped'
+
+
+def next_step_hint(reference, lines):
+    """
+    Hint for the step after the student's latest recognised line.
+
+    Returns {'status' ('start', 'on_track', 'off_track' or 'done'), 'line'
+    (the line that was matched), 'matched' and 'next' (StepNode dicts or
+    None), 'hint' (text), 'ms'}.
+    """
+    start = time.perf_counter()
+    reference = get_reference(reference)
+    nodes = reference.step_graph
+    matched, status, line = 0, 'start', None
+    for candidate in reversed(lines):
+        index, line_status = _match_step_node(reference, candidate)
+        if line_status != 'skipped':
+            matched, status, line = index, line_status, candidate
+            break
+
+    if status == 'off_track':
+        diagnosis = []
+        value = _answer_from_lines([line])
+        if value is not None:
+            diagnosis = reference.diagnose(value)
+        if diagnosis:
+            hint = f"That value does not solve the equation - likely {diagnosis[0]['description']}"
+        elif value is not None:
+            hint = "That value does not solve the equation - substitute it back to find the slip"
+        else:
+            hint = "This line does not follow from the equation - recheck your last step"
+        result = {'matched': None, 'next': None, 'hint': hint}
+    elif matched == len(nodes) - 1:
+        status = 'done'
+        result = {'matched': nodes[matched].as_dict(), 'next': None,
+                  'hint': "You're done - the solution is verified"}
+    else:
+        following = nodes[matched + 1]
+        result = {'matched': nodes[matched].as_dict(), 'next': following.as_dict(),
+                  'hint': following.instruction}
+    result.update({'status': status, 'line': line, 'ms': round((time.perf_counter() - start) * 1000, 2)})
+    return result
+
+
+def _criterion(required, met, message_met, message_missing, **extra):
+    return {'required': required, 'met': met,
+            'feedback': message_met if met or not required else message_missing, **extra}
+
+
+def _empty_result():
+    return {'correct': False, 'final_answer': None, 'criteria': {}, 'steps': [], 'feedback': [],
+            'message': '', 'equation_info': None, 'error': None, 'ms': None}
+
+
+class GradingSession:
+    """
+    One student's solution graded line by line. The equation is analysed
+    once (the shared EquationReference); add_line() costs only the new
+    line's feature pass, step check and contribution to the criteria
+    flags, and result() summarises that accumulated state without
+    revisiting earlier lines.
+    """
+
+    def __init__(self, equation, session_id=None):
+        self.reference = get_reference(equation)
+        self.equation = equation if isinstance(equation, str) else self.reference.equation
+        self.session_id = session_id
+        self.lines = []
+        self.features = []
+        self.steps = []
+        self.flags = dict.fromkeys(MENTION_FLAGS, False)
+        self.answer = None          # last parseable "x = ..." line
+        self.checked = 0
+        self.first_error = None
+        self._previous = None       # last CheckedStep
+        self.created_at = self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def add_line(self, line):
+        """Analyse one new solution line; returns its features, step status and cost"""
+        start = time.perf_counter()
+        line = str(line)
+        with self._lock:
+            index = len(self.lines)
+            features = line_features(line, index)
+            self.lines.append(line)
+            self.features.append(features)
+            _update_mentions(self.flags, self.features, index, self.reference)
+
+            step, checked_step = _check_step(index, line, self._previous, self.reference)
+            self.steps.append(step)
+            if checked_step is not None:
+                self.checked += 1
+                if step['status'] == 'broken' and self.first_error is None:
+                    self.first_error = index
+                self._previous = checked_step
+
+            answer = _answer_from_lines([line])
+            if answer is not None:
+                self.answer = answer
+            self.updated_at = time.time()
+        return {'index': index, 'line': line, 'features': features.names(), 'step': dict(step),
+                'ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.add_line(line)
+        return self
+
+    def hint(self):
+        """next_step_hint() for the lines so far"""
+        with self._lock:
+            lines = list(self.lines)
+        return next_step_hint(self.reference, lines)
+
+    def result(self, final_answer=None):
+        """
+        Grade of the lines so far, shaped like grade_submission(); built
+        from the accumulated flags and step state.
+        """
+        start = time.perf_counter()
+        result = _empty_result()
+        try:
+            with self._lock:
+                reference = self.reference
+                denominators, restrictions = reference.denominators, reference.restrictions
+                flags = self.flags
+                first_error = self.first_error
+
+                student_x = _parse_final_answer(final_answer) if final_answer else None
+                if student_x is None:
+                    student_x = self.answer
+                answer_correct = student_x is not None and reference.matches_solution(student_x)
+                # Wrong answers are looked up in the equation's mistake catalogue
+                diagnosis = reference.diagnose(student_x) if student_x is not None and not answer_correct else []
+
+                verification_met = flags['shows_verification_work']
+                criteria = {
+                    'denominators': _criterion(
+                        bool(denominators), flags['mentions_denominators'],
+                        "✅ Denominators identified and mentioned" if denominators else "✅ No denominators to handle",
+                        "⚠️ Denominators present but not explicitly mentioned"),
+                    'restrictions': _criterion(
+                        bool(restrictions), flags['mentions_restrictions'],
+                        "✅ Restrictions/excluded values mentioned" if restrictions else "✅ No restrictions to consider",
+                        "⚠️ Restrictions present but not mentioned"),
+                    'lcd': _criterion(
+                        bool(denominators), flags['mentions_lcd'],
+                        "✅ LCD multiplication used" if denominators else None,
+                        "⚠️ LCD multiplication not explicitly mentioned"),
+                    'simplified_equation': _criterion(
+                        True, flags['shows_simplified_equation'],
+                        "✅ Simplified equation shown", "⚠️ Simplified equation not clearly shown"),
+                    'verification': _criterion(
+                        True, verification_met, "✅ Verification work shown",
+                        "⚠️ Verification mentioned but not shown" if flags['mentions_verification']
+                        else "⚠️ Verification not attempted",
+                        mentioned=flags['mentions_verification'] or verification_met),
+                    'steps': _criterion(
+                        self.checked > 0, first_error is None,
+                        "✅ Every algebraic step follows from the previous one" if self.checked else None,
+                        None if first_error is None
+                        else f"❌ Line {first_error + 1} does not follow from the previous step: "
+                             f"{self.lines[first_error]}",
+                        first_error=first_error),
+                    'final_answer': _criterion(
+                        True, answer_correct, "✅ Final answer is correct",
+                        "❌ No final answer found" if student_x is None
+                        else "❌ Final answer is incorrect" + (f" - likely {diagnosis[0]['description']}"
+                                                               if diagnosis else ""),
+                        found=student_x is not None, diagnosis=diagnosis),
+                }
+
+                result.update({
+                    'correct': bool(answer_correct),
+                    'final_answer': None if student_x is None else sp.sstr(student_x),
+                    'criteria': criteria,
+                    'steps': [dict(step) for step in self.steps],
+                    'feedback': [c['feedback'] for c in criteria.values() if c['feedback']],
+                    'equation_info': reference.info(),
+                })
+                result['message'] = " | ".join(result['feedback'])
+        except Exception as e:
+            result['error'] = str(e)
+            result['message'] = f"Error checking solution: {str(e)}"
+        finally:
+            result['ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+
+def grade_submission(equation, lines, final_answer=None, reference=None):
+    """
+    Grade one student's solution of `equation` (a string, or pass the
+    prebuilt EquationReference as `reference`).
+
+    `lines` are the solution steps as typed or OCRed; `final_answer` (e.g.
+    "x = 4") takes precedence over the last "x = ..." line when it parses.
+    Returns a JSON-friendly dict: 'correct', 'criteria' (one entry per name
+    in CRITERIA with 'required', 'met' and 'feedback'), 'steps' (per-line
+    check_steps() status), 'feedback' (list),
+    'message' (the ' | '-joined feedback the Tkinter checker shows),
+    'equation_info' (EquationReference.info()), 'error' and 'ms'.
+    """
+    start = time.perf_counter()
+    if reference is None and "=" not in equation:
+        result = _empty_result()
+        result['error'] = result['message'] = "Invalid equation format. Missing '='."
+    else:
+        try:
+            session = GradingSession(reference if reference is not None else equation)
+            session.add_lines(lines or [])
+            result = session.result(final_answer)
+        except Exception as e:
+            result = _empty_result()
+            result['error'] = str(e)
+            result['message'] = f"Error checking solution: {str(e)}"
+    result['ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+GRADING_SESSION_TTL = 1800      # seconds an idle session is kept
+GRADING_SESSION_MAX = 1000
+
+
+class GradingSessionStore:
+    """
+    Server-side GradingSessions keyed by session id, for scanning a
+    solution one line at a time. Sessions idle for more than `ttl` seconds
+    are evicted on the next access, and the least recently used ones once
+    there are more than `maxsize`.
+    """
+
+    def __init__(self, ttl=GRADING_SESSION_TTL, maxsize=GRADING_SESSION_MAX, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._sessions = OrderedDict()      # session id -> [session, last used], LRU first
+        self._lock = threading.Lock()
+        self.counters = {'created': 0, 'expired': 0, 'evicted': 0, 'closed': 0}
+
+    def _evict_expired(self, now):
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.counters['expired'] += 1
+
+    def create(self, equation):
+        """New session for `equation`; raises ValueError/SyntaxError if it does not parse"""
+        session = GradingSession(equation, session_id=uuid.uuid4().hex)
+        with self._lock:
+            now = self._clock()
+            self._evict_expired(now)
+            self._sessions[session.session_id] = [session, now]
+            self.counters['created'] += 1
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+                self.counters['evicted'] += 1
+        return session
+
+    def get(self, session_id):
+        """The live session for `session_id` (refreshing its TTL), or None"""
+        with self._lock:
+            now = self._clock()
+            self._evict_expired(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def close(self, session_id):
+        """Drop a session; returns it, or None if it was unknown or expired"""
+        with self._lock:
+            self._evict_expired(self._clock())
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            self.counters['closed'] += 1
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            self._evict_expired(self._clock())
+            return {'active': len(self._sessions), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    **self.counters}
+
+
+grading_sessions = GradingSessionStore()
+
+
+def summarize_grades(results):
+    """Class-level aggregates for a list of grade_submission results"""
+    graded = [r for r in results if not r.get('error')]
+    summary = {
+        'students': len(results),
+        'graded': len(graded),
+        'errors': len(results) - len(graded),
+        'correct': sum(1 for r in graded if r['correct']),
+        'accuracy': round(sum(1 for r in graded if r['correct']) / len(graded), 4) if graded else None,
+        'criteria': {},
+        'common_wrong_answers': [],
+        'common_mistakes': [],
+        'mean_ms': round(sum(r['ms'] for r in results) / len(results), 2) if results else None,
+    }
+    for name in CRITERIA:
+        applicable = [r['criteria'][name] for r in graded if r['criteria'][name]['required']]
+        met = sum(1 for c in applicable if c['met'])
+        summary['criteria'][name] = {
+            'applicable': len(applicable),
+            'met': met,
+            'rate': round(met / len(applicable), 4) if applicable else None,
+        }
+    wrong = Counter(r['final_answer'] for r in graded if not r['correct'] and r['final_answer'])
+    summary['common_wrong_answers'] = [{'answer': answer, 'students': count}
+                                       for answer, count in wrong.most_common(5)]
+    mistakes = Counter(entry['mistake'] for r in graded
+                       for entry in r['criteria']['final_answer'].get('diagnosis', [])[:1])
+    summary['common_mistakes'] = [{'mistake': mistake, 'students': count}
+                                  for mistake, count in mistakes.most_common()]
+    return summary
+
+
+_grading_executor = None
+_grading_executor_lock = threading.Lock()
+
+
+def get_grading_executor():
+    """Process pool shared by all batch grading requests, created on first use"""
+    global _grading_executor
+    with _grading_executor_lock:
+        if _grading_executor is None:
+            _grading_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _grading_executor
+
+
+def _grade_item(submission):
+    """Grade one batch item in a worker"""
+    return grade_submission(submission['equation'], submission.get('lines'),
+                            submission.get('final_answer'), reference=submission.get('reference'))
+
+
+def grade_batch(submissions, equation=None, executor=None):
+    """
+    Grade many submissions in parallel across processes.
+
+    Each submission is a dict with 'lines' and optionally 'student_id',
+    'equation' (defaults to `equation`, for a whole class on one problem)
+    and 'final_answer'. Returns {'results': [...], 'summary': {...}} with one
+    result per submission in input order, each carrying its 'index' and
+    'student_id'.
+    """
+    start = time.perf_counter()
+    # Each distinct equation is analysed once here and shipped to the workers
+    references = {}
+    items = []
+    for submission in submissions:
+        item_equation = str(submission.get('equation') or equation or '')
+        key = EquationReferenceCache.key(item_equation)
+        if key not in references and "=" in item_equation:
+            try:
+                references[key] = get_reference(item_equation)
+            except Exception:
+                references[key] = None   # graded (and reported) per submission
+        items.append({
+            'equation': item_equation,
+            'lines': submission.get('lines') or [],
+            'final_answer': submission.get('final_answer'),
+            'reference': references.get(key),
+        })
+
+    executor = executor or get_grading_executor()
+    chunksize = max(1, len(items) // (4 * (os.cpu_count() or 1)))
+    graded = executor.map(_grade_item, items, chunksize=chunksize)
+
+    results = []
+    for index, (submission, result) in enumerate(zip(submissions, graded)):
+        results.append({'index': index, 'student_id': submission.get('student_id'), **result})
+    summary = summarize_grades(results)
+    summary['wall_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return {'results': results, 'summary': summary}
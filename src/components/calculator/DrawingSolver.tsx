@@ -133,11 +133,25 @@ export const DrawingSolver: React.FC<DrawingSolverProps> = ({ className }) => {
     setCurrentPath([]);
   };
 
-  const getCanvasImage = (): string | null => {
-    const canvas = canvasRef.current;
-    if (!canvas) return null;
-    
-    return canvas.toDataURL('image/png');
+  // Compact stroke payload: [x0, y0, dx1, dy1, ...] per stroke, integers only.
+  // A few KB instead of a full canvas PNG; the API rasterises it for OCR.
+  const encodeStrokes = (): number[][] => {
+    const paths = currentPath.length > 0 ? [...drawingHistory, currentPath] : drawingHistory;
+    return paths
+      .filter(path => path.length > 0)
+      .map(path => {
+        const encoded: number[] = [];
+        let prevX = 0;
+        let prevY = 0;
+        path.forEach((point, i) => {
+          const x = Math.round(point.x);
+          const y = Math.round(point.y);
+          encoded.push(i === 0 ? x : x - prevX, i === 0 ? y : y - prevY);
+          prevX = x;
+          prevY = y;
+        });
+        return encoded;
+      });
   };
 
   const processDrawing = async () => {
@@ -151,24 +165,17 @@ export const DrawingSolver: React.FC<DrawingSolverProps> = ({ className }) => {
     setOcrResult(null);
 
     try {
-      const imageData = getCanvasImage();
-      if (!imageData) {
+      const strokes = encodeStrokes();
+      if (strokes.length === 0) {
         setError('Failed to capture drawing');
         return;
       }
 
-      // Convert base64 to blob
-      const response = await fetch(imageData);
-      const blob = await response.blob();
-
-      // Create FormData for the API
-      const formData = new FormData();
-      formData.append('image', blob, 'drawing.png');
-
-      // Call the OCR API
+      // Call the OCR API with the stroke vectors
       const ocrResponse = await fetch('http://localhost:5001/api/ocr/process', {
         method: 'POST',
-        body: formData
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ strokes })
       });
 
       if (!ocrResponse.ok) {
@@ -7,10 +7,11 @@ Complete interface with drawing canvas, OCR processing, and real-time solution c
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import os
-import tempfile
 import re
 import datetime
 from PIL import Image, ImageDraw
+import solution_grader
+from solution_grader import GradingSession, grade_submission, get_reference, extract_features
 
 # Try to import required modules
 try:
@@ -228,87 +229,21 @@ def analyze_verification_context(student_solution, student_answer):
     """
     Advanced verification detection that looks at the context and structure of the solution
     """
-    verification_score = 0
-    verification_details = []
-    
-    # Look for answer followed by verification pattern
-    answer_found = False
-    verification_after_answer = False
-    
-    for i, line in enumerate(student_solution):
-        line_lower = line.lower()
-        
-        # Check if this line contains the final answer
-        if ("x =" in line or "x=" in line) and any(char.isdigit() for char in line):
-            answer_found = True
-            verification_details.append(f"Final answer found on line {i+1}: {line}")
-            
-            # Look at next few lines for verification
-            for j in range(i+1, min(i+4, len(student_solution))):
-                next_line = student_solution[j].lower()
-                if any(word in next_line for word in ["check", "verify", "test", "substitute", "substitute", "lhs", "rhs", "left", "right"]):
-                    verification_after_answer = True
-                    verification_details.append(f"Verification found on line {j+1}: {student_solution[j]}")
-                    verification_score += 2
-                    break
-        
-        # Check for verification keywords in context
-        if any(word in line_lower for word in ["check", "verify", "test", "substitute"]):
-            verification_score += 1
-            verification_details.append(f"Verification keyword on line {i+1}: {line}")
-        
-        # Check for LHS/RHS calculations
-        if any(phrase in line_lower for phrase in ["lhs =", "rhs =", "left side =", "right side ="]):
-            verification_score += 2
-            verification_details.append(f"Side-by-side verification on line {i+1}: {line}")
-        
-        # Check for substitution work after finding the answer (fraction calculations)
-        if any(char in line for char in ["=", "/"]) and any(char.isdigit() for char in line) and "/" in line:
-            # Check if this line comes after a line with "x = [number]"
-            for prev_idx in range(max(0, i-3), i):
-                prev_line = student_solution[prev_idx]
-                if ("x =" in prev_line or "x=" in prev_line) and any(char.isdigit() for char in prev_line):
-                    # This looks like verification by substitution
-                    verification_score += 2
-                    verification_details.append(f"Substitution verification on line {i+1}: {line}")
-                    break
-    
-    # Bonus for having verification after the answer
-    if answer_found and verification_after_answer:
-        verification_score += 1
-        verification_details.append("Bonus: Verification follows the answer logically")
-    
-    return verification_score, verification_details
+    return solution_grader.analyze_verification_context(extract_features(student_solution))
 
-def get_verification_examples(equation_str):
+def get_verification_examples(equation_str, reference=None):
     """
     Provides specific verification examples based on the equation type
     """
     try:
-        import sympy as sp
-        x = sp.symbols('x')
-        
         # Parse the equation to understand its structure
-        if "=" not in equation_str:
-            return ["Example: Substitute your answer back into the original equation"]
-        
-        lhs_str, rhs_str = equation_str.split("=", 1)
-        lhs, rhs = map(sp.sympify, [lhs_str, rhs_str])
+        if reference is None:
+            if "=" not in equation_str:
+                return ["Example: Substitute your answer back into the original equation"]
+            reference = get_reference(equation_str)
         
         # Check if it's a rational equation
-        denominators = []
-        for expr in [lhs, rhs]:
-            if expr.is_Add:
-                for arg in expr.args:
-                    num, den = sp.fraction(sp.together(arg))
-                    if den != 1:
-                        denominators.append(den)
-            else:
-                num, den = sp.fraction(sp.together(arg))
-                if den != 1:
-                    denominators.append(den)
-        
-        if denominators:
+        if reference.denominators:
             # Rational equation example
             return [
                 "Example for rational equation:",
@@ -335,35 +270,7 @@ def get_detailed_verification_analysis(student_solution, student_answer):
     """
     Provides detailed analysis of what verification work was detected
     """
-    analysis = []
-    
-    # Look for the answer line
-    answer_line = None
-    for i, line in enumerate(student_solution):
-        if ("x =" in line or "x=" in line) and any(char.isdigit() for char in line):
-            answer_line = i
-            break
-    
-    if answer_line is not None:
-        analysis.append(f"📝 Final answer found on line {answer_line + 1}: {student_solution[answer_line]}")
-        
-        # Look for verification work after the answer
-        verification_lines = []
-        for i in range(answer_line + 1, len(student_solution)):
-            line = student_solution[i]
-            if any(char in line for char in ["=", "/"]) and any(char.isdigit() for char in line):
-                if "/" in line:  # Fraction work
-                    verification_lines.append(f"Line {i + 1}: {line}")
-        
-        if verification_lines:
-            analysis.append("🔍 Verification work detected after the answer:")
-            for v_line in verification_lines:
-                analysis.append(f"   {v_line}")
-            analysis.append("✅ This shows you're checking your work by substitution!")
-        else:
-            analysis.append("💡 No verification work detected after the answer")
-    
-    return analysis
+    return solution_grader.get_detailed_verification_analysis(extract_features(student_solution))
 
 def stepwise_rational_solution_with_explanations(equation_str):
     """
@@ -680,311 +587,15 @@ def stepwise_rational_solution_with_explanations(equation_str):
     
     return '\n'.join(result)
 
-def check_solution_correctness(student_solution, original_equation):
+def check_solution_correctness(student_solution, original_equation, reference=None):
     """
     Comprehensive Content-Based Rational Equation Solution Checker
     Grades purely on mathematical correctness, ignoring labels/keywords
+    (see solution_grader.grade_submission for the structured result).
+    Pass the equation's EquationReference to skip re-analysing it.
     """
-    try:
-        import sympy as sp
-        x = sp.symbols('x')
-        
-        # Parse original equation
-        if "=" not in original_equation:
-            return False, "Invalid equation format. Missing '='."
-        
-        lhs_str, rhs_str = original_equation.split("=", 1)
-        lhs, rhs = map(sp.sympify, [lhs_str, rhs_str])
-        
-        # Extract denominators and compute restrictions
-        denominators = []
-        restrictions = set()
-        
-        for expr in [lhs, rhs]:
-            if expr.is_Add:
-                for arg in expr.args:
-                    num, den = sp.fraction(sp.together(arg))
-                    if den != 1:
-                        denominators.append(den)
-                        try:
-                            sols = sp.solve(den, x)
-                            # Check if sols is a list/iterable and not empty
-                            if sols and hasattr(sols, '__iter__') and not isinstance(sols, bool):
-                                restrictions.update(sols)
-                        except:
-                            pass
-            else:
-                num, den = sp.fraction(sp.together(expr))
-                if den != 1:
-                    denominators.append(den)
-                    try:
-                        sols = sp.solve(den, x)
-                        # Check if sols is a list/iterable and not empty
-                        if sols and hasattr(sols, '__iter__') and not isinstance(sols, bool):
-                            restrictions.update(sols)
-                    except:
-                        pass
-        
-        # Check what the student actually mentioned
-        student_mentions_denominators = False
-        student_mentions_restrictions = False
-        student_mentions_lcd = False
-        student_shows_simplified_equation = False
-        student_mentions_verification = False
-        student_shows_verification_work = False
-        
-        for line in student_solution:
-            line_lower = line.lower()
-            # Check for explicit denominator mentions
-            if any(word in line_lower for word in ["denominator", "denominators", "denom", "lcd", "least common denominator"]):
-                student_mentions_denominators = True
-            # Check for explicit restriction mentions
-            if any(word in line_lower for word in ["restriction", "restrictions", "excluded", "cannot", "≠", "!=", "not equal", "not equal to"]):
-                student_mentions_restrictions = True
-            # Check for implicit restriction mentions (like "x ≠ 3")
-            if "≠" in line or "!=" in line or "x" in line and any(char in line for char in ["≠", "!=", "not"]):
-                # Look for patterns like "x ≠ 3", "x != 3", "x not equal to 3"
-                import re
-                restriction_patterns = [
-                    r'x\s*[≠!]\s*\d+',  # x ≠ 3, x != 3
-                    r'x\s+not\s+equal\s+to\s+\d+',  # x not equal to 3
-                    r'x\s+cannot\s+be\s+\d+',  # x cannot be 3
-                    r'x\s+≠\s+\d+',  # x ≠ 3
-                ]
-                for pattern in restriction_patterns:
-                    if re.search(pattern, line_lower):
-                        student_mentions_restrictions = True
-                        break
-            # Check for implicit denominator identification (like showing the equation with fractions)
-            if "(" in line and ")" in line and "/" in line and "x" in line:
-                # This looks like a rational equation with denominators
-                student_mentions_denominators = True
-            # Check for LCD usage in multiplication steps - more comprehensive detection
-            if any(word in line_lower for word in ["multiply both sides by", "multiply by", "lcd", "least common denominator"]):
-                student_mentions_lcd = True
-                student_mentions_denominators = True  # If they use LCD, they're working with denominators
-            # Check for implicit LCD usage (like "(x-3)*[...]")
-            if "*" in line and "(" in line and ")" in line and "/" in line:
-                # This looks like LCD multiplication
-                student_mentions_lcd = True
-                student_mentions_denominators = True
-            # Check for simplified equation (no fractions, just x terms)
-            if "=" in line and not any(char in line for char in ["/", "÷"]) and any(char in line for char in ["x", "X"]) and len(line) > 5:
-                # This looks like a simplified equation without fractions
-                student_shows_simplified_equation = True
-            
-            # Check for verification mentions and work
-            line_lower = line.lower()
-            if any(word in line_lower for word in ["verify", "verification", "check", "substitute", "substitution", "test", "testing", "plug in", "plugging in", "lhs", "rhs", "left side", "right side", "both sides", "balance", "balanced"]):
-                student_mentions_verification = True
-            # Check for actual verification work (substituting values back)
-            if any(char in line for char in ["=", "≈", "≠"]) and any(char in line for char in ["x", "X"]) and any(char.isdigit() for char in line):
-                # This looks like they're showing verification calculations
-                if any(word in line_lower for word in ["check", "verify", "test", "substitute", "lhs", "rhs"]):
-                    student_shows_verification_work = True
-            
-            # Enhanced verification detection - look for substitution patterns
-            # Pattern 1: "x = 5" followed by substitution
-            if "x =" in line or "x=" in line:
-                # Check if next few lines contain substitution work
-                line_idx = student_solution.index(line)
-                if line_idx + 1 < len(student_solution):
-                    next_line = student_solution[line_idx + 1].lower()
-                    if any(word in next_line for word in ["check", "verify", "test", "substitute", "lhs", "rhs", "left", "right"]):
-                        student_shows_verification_work = True
-            
-            # Pattern 2: Look for fraction calculations that look like verification
-            if "/" in line and any(char.isdigit() for char in line) and any(char in line for char in ["=", "≈"]):
-                # This might be showing verification calculations
-                if any(word in line_lower for word in ["check", "verify", "test", "substitute"]):
-                    student_shows_verification_work = True
-            
-            # Pattern 3: Look for "LHS = ..." and "RHS = ..." patterns
-            if any(phrase in line_lower for phrase in ["lhs =", "rhs =", "left side =", "right side =", "left=", "right="]):
-                student_shows_verification_work = True
-            
-            # Pattern 4: Look for substitution with specific values
-            # This catches lines like "when x = 3: (3+2)/(3-1) = 5/2"
-            if "when x =" in line_lower or "x =" in line_lower and ":" in line:
-                if any(char in line for char in ["(", ")", "/"]) and any(char.isdigit() for char in line):
-                    student_shows_verification_work = True
-            
-            # Pattern 5: Look for "check" or "verify" followed by calculations
-            if any(word in line_lower for word in ["check:", "verify:", "test:"]):
-                # Check if next line contains actual calculations
-                line_idx = student_solution.index(line)
-                if line_idx + 1 < len(student_solution):
-                    next_line = student_solution[line_idx + 1]
-                    if any(char in next_line for char in ["=", "/", "(", ")"]) and any(char.isdigit() for char in next_line):
-                        student_shows_verification_work = True
-            
-            # Pattern 6: Look for substitution work after finding the answer
-            # This catches cases where students substitute their answer back without explicit keywords
-            if any(char in line for char in ["=", "/"]) and any(char.isdigit() for char in line) and "/" in line:
-                # Check if this line comes after a line with "x = [number]"
-                line_idx = student_solution.index(line)
-                for prev_idx in range(max(0, line_idx-3), line_idx):
-                    prev_line = student_solution[prev_idx]
-                    if ("x =" in prev_line or "x=" in prev_line) and any(char.isdigit() for char in prev_line):
-                        # This looks like verification by substitution
-                        student_shows_verification_work = True
-                        break
-            
-            # Pattern 7: Look for working with original equation structure after finding answer
-            # This catches cases where students work with fractions that match the original equation
-            if "/" in line and any(char.isdigit() for char in line) and "=" in line:
-                # Check if this looks like working with the original equation structure
-                if any(char in line for char in ["+", "-"]) and "/" in line:
-                    # This might be verification work with the original equation
-                    line_idx = student_solution.index(line)
-                    for prev_idx in range(max(0, line_idx-3), line_idx):
-                        prev_line = student_solution[prev_idx]
-                        if ("x =" in prev_line or "x=" in prev_line) and any(char.isdigit() for char in prev_line):
-                            # This looks like verification by working with original equation
-                            student_shows_verification_work = True
-                            break
-        
-        # AUTO-DETECT: If student shows work with denominators, they implicitly know about them
-        if denominators and isinstance(denominators, (list, tuple)):
-            # Check if any line contains the actual denominator expression
-            for line in student_solution:
-                for denom in denominators:
-                    denom_str = sp.sstr(denom)
-                    if denom_str in line or denom_str.replace(" ", "") in line.replace(" ", ""):
-                        student_mentions_denominators = True
-                        break
-                if student_mentions_denominators:
-                    break
-            
-            # Check if any line contains the actual restriction value - ONLY if they explicitly mention restrictions
-            # Don't auto-detect restrictions just because they work with denominators
-            for line in student_solution:
-                line_lower = line.lower()
-                # Only count as restriction if they use restriction-related language
-                if any(word in line_lower for word in ["restriction", "restrictions", "excluded", "cannot", "≠", "!=", "not equal", "not equal to", "undefined", "domain", "not allowed"]):
-                    if restrictions and isinstance(restrictions, (list, tuple, set)):
-                        for restriction in restrictions:
-                            restriction_str = sp.sstr(restriction)
-                            if restriction_str in line or f"x ≠ {restriction_str}" in line or f"x!={restriction_str}" in line:
-                                student_mentions_restrictions = True
-                                break
-                        if student_mentions_restrictions:
-                            break
-            
-            # Check if any line shows multiplication by the LCD
-            for line in student_solution:
-                for denom in denominators:
-                    denom_str = sp.sstr(denom)
-                    # Look for patterns like "(x-1)*[...]" or "multiply by (x-1)"
-                    if (denom_str in line and "*" in line) or (denom_str in line and any(word in line.lower() for word in ["multiply", "times"])):
-                        student_mentions_lcd = True
-                        break
-                if student_mentions_lcd:
-                    break
-        
-        # Calculate LCD
-        if denominators and isinstance(denominators, (list, tuple)):
-            lcd = sp.lcm([sp.factor(d) for d in denominators])
-        else:
-            lcd = 1
-        
-        # Look for final answer in student solution
-        final_answer = None
-        for line in reversed(student_solution):  # Check from last line first
-            line_lower = line.lower()
-            if "x =" in line or "x=" in line:
-                try:
-                    if "x =" in line:
-                        math_part = line.split("x =", 1)[1].strip()
-                    elif "x=" in line:
-                        math_part = line.split("x=", 1)[1].strip()
-                    else:
-                        continue
-                    
-                    math_part = normalize_math_expression(math_part)
-                    final_answer = sp.sympify(math_part)
-                    break
-                except:
-                    continue
-        
-        # Check if answer is correct
-        answer_correct = False
-        if final_answer is not None:
-            # Find the actual solution
-            if denominators and isinstance(denominators, (list, tuple)):
-                simplified_lhs = sp.expand(sp.simplify(lhs * lcd))
-                simplified_rhs = sp.expand(sp.simplify(rhs * lcd))
-            else:
-                simplified_lhs = lhs
-                simplified_rhs = rhs
-            
-            standard_form = sp.expand(simplified_lhs - simplified_rhs)
-            actual_solutions = sp.solve(standard_form, x)
-            
-            # Check if student's answer matches any of the actual solutions
-            for actual_sol in actual_solutions:
-                if abs(sp.N(final_answer - actual_sol, 8)) < 1e-8:
-                    answer_correct = True
-                    break
-        
-        # Build comprehensive feedback message
-        feedback_parts = []
-        
-        # Denominators feedback
-        if denominators and isinstance(denominators, (list, tuple)):
-            if student_mentions_denominators:
-                feedback_parts.append("✅ Denominators identified and mentioned")
-            else:
-                feedback_parts.append("⚠️ Denominators present but not explicitly mentioned")
-        else:
-            feedback_parts.append("✅ No denominators to handle")
-        
-        # Restrictions feedback
-        if restrictions and isinstance(restrictions, (list, tuple, set)):
-            if student_mentions_restrictions:
-                feedback_parts.append("✅ Restrictions/excluded values mentioned")
-            else:
-                feedback_parts.append("⚠️ Restrictions present but not mentioned")
-        else:
-            feedback_parts.append("✅ No restrictions to consider")
-        
-        # LCD feedback
-        if denominators and isinstance(denominators, (list, tuple)):
-            if student_mentions_lcd:
-                feedback_parts.append("✅ LCD multiplication used")
-            else:
-                feedback_parts.append("⚠️ LCD multiplication not explicitly mentioned")
-        
-        # Simplified equation feedback
-        if student_shows_simplified_equation:
-            feedback_parts.append("✅ Simplified equation shown")
-        else:
-            feedback_parts.append("⚠️ Simplified equation not clearly shown")
-        
-        # Verification feedback
-        if student_mentions_verification or student_shows_verification_work:
-            if student_shows_verification_work:
-                feedback_parts.append("✅ Verification work shown")
-            else:
-                feedback_parts.append("⚠️ Verification mentioned but not shown")
-        else:
-            feedback_parts.append("⚠️ Verification not attempted")
-        
-        # Final answer feedback
-        if final_answer is None:
-            feedback_parts.append("❌ No final answer found")
-        elif answer_correct:
-            feedback_parts.append("✅ Final answer is correct")
-        else:
-            feedback_parts.append("❌ Final answer is incorrect")
-        
-        # Combine feedback
-        feedback_message = " | ".join(feedback_parts)
-        
-        return answer_correct, feedback_message
-        
-    except Exception as e:
-        return False, f"Error checking solution: {str(e)}"
+    result = grade_submission(original_equation, student_solution, reference=reference)
+    return result['correct'], result['message']
 
 class OCRIntegratedDrawingSolverApp:
     def __init__(self, root):
@@ -1044,6 +655,11 @@ class OCRIntegratedDrawingSolverApp:
                                    command=self.scan_new_line)
         self.ocr_btn.pack(side=tk.LEFT, padx=5)
         
+        # Whole-page Button: every drawn line is OCRed at once
+        self.scan_page_btn = ttk.Button(button_frame, text="📄 Scan Whole Page", 
+                                        command=self.scan_all_lines)
+        self.scan_page_btn.pack(side=tk.LEFT, padx=5)
+        
         # Test Conversion Button
         self.test_btn = tk.Button(button_frame, text="🧪 Test Conversion", 
                                  command=self.test_conversion)
@@ -1155,6 +771,7 @@ class OCRIntegratedDrawingSolverApp:
         # Store current data
         self._current_equation = ""  # No default equation - user draws it
         self.solution_lines = []
+        self.grading_session = None  # Per-equation grading state, one line analysed at a time
         self.line_number = 1  # This will be used for solution steps, not the equation
         self.last_ocr_result = None  # Store last OCR result for raw output analysis
         
@@ -1169,6 +786,18 @@ class OCRIntegratedDrawingSolverApp:
     def current_equation(self, value):
         print(f"DEBUG: current_equation being set to: '{value}'")
         self._current_equation = value
+        self.grading_session = None
+
+    def get_grading_session(self, equation):
+        """
+        GradingSession for `equation` holding every solution line so far.
+        Only lines it has not seen yet are analysed.
+        """
+        session = self.grading_session
+        if session is None or session.equation != equation or len(session.lines) > len(self.solution_lines):
+            session = self.grading_session = GradingSession(equation)
+        session.add_lines(self.solution_lines[len(session.lines):])
+        return session
     
     def initialize_example(self):
         """Initialize with instructions for the new workflow"""
@@ -1231,15 +860,10 @@ class OCRIntegratedDrawingSolverApp:
                     self.status_var.set("Draw your equation more clearly!")
                 return
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
-            # Process through OCR (simulate if not available)
-            if OCR_AVAILABLE:
+            # Process through OCR (simulate if not available or while the SimpleTex breaker is open)
+            if OCR_AVAILABLE and not lcd.ocr_breaker.is_open():
                 try:
-                    result = lcd.process_image(temp_file.name)
+                    result = lcd.process_image(img)
                     # Store raw result for potential display
                     self.last_ocr_result = result
                     
@@ -1292,12 +916,9 @@ class OCRIntegratedDrawingSolverApp:
                     processed_ocr_text = self.simulate_ocr_with_latex()
                 else:
                     processed_ocr_text = self.simulate_ocr()
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
+                if OCR_AVAILABLE:
+                    retry_after = lcd.ocr_breaker.retry_after()
+                    self.status_var.set(f"⚠ OCR service unavailable - using Demo Mode (retrying in {retry_after:.0f}s)")
             
             # Process the OCR text
             # Check if this is the first line (equation to solve)
@@ -1356,6 +977,50 @@ class OCRIntegratedDrawingSolverApp:
             messagebox.showerror("Error", error_msg)
             self.status_var.set("Error scanning line")
     
+    def scan_all_lines(self):
+        """Scan a whole worked solution: every drawn line is OCRed concurrently and added in order"""
+        try:
+            if not self.drawing_area.lines:
+                messagebox.showwarning("Warning", "Please draw your equation and solution steps first!")
+                return
+            if not OCR_AVAILABLE or lcd.ocr_breaker.is_open():
+                messagebox.showinfo("OCR Unavailable", "Whole-page scanning needs the OCR service.\n\nUse '🔍 Scan New Line' to continue in Demo Mode.")
+                return
+            
+            self.status_var.set("Scanning all lines...")
+            self.root.update()
+            
+            result = lcd.process_lines(strokes=lcd.encode_strokes(self.drawing_area.lines))
+            self.last_ocr_result = result
+            if result.get("error"):
+                raise RuntimeError(result["error"])
+            
+            added, failed = 0, 0
+            for line in result["lines"]:
+                raw_latex = line.get("latex_raw")
+                if not isinstance(raw_latex, str):
+                    failed += 1
+                    continue
+                ocr_text = self.clean_raw_format(self.convert_latex_to_raw_format(raw_latex))
+                if not self.current_equation:
+                    processed_text = self.process_line_text(ocr_text, is_equation=True)
+                    self.current_equation = processed_text
+                    self.add_solution_line(processed_text, is_equation=True)
+                else:
+                    processed_text = self.process_line_text(ocr_text, is_equation=False)
+                    self.add_solution_line(processed_text, is_equation=False)
+                added += 1
+            
+            self.drawing_area.clear_canvas()
+            message = f"✅ Scanned {added} line(s) in {result['ms'] / 1000:.1f}s"
+            if failed:
+                message += f" - {failed} line(s) could not be read, redraw them with '🔍 Scan New Line'"
+            self.status_var.set(message)
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to scan page: {str(e)}")
+            self.status_var.set("Error scanning page")
+    
     def test_conversion(self):
         """Test the conversion function with examples"""
         try:
@@ -1642,111 +1307,67 @@ class OCRIntegratedDrawingSolverApp:
     def analyze_solution_line(self, line_text):
         """Analyze a single solution line and provide enhanced feedback using backend analysis"""
         try:
-            import sympy as sp
-            x = sp.symbols('x')
-            
             # Get current equation
             equation = self.current_equation
             if not equation:
                 return
             
-            # Parse equation to get denominators and restrictions
-            lhs_str, rhs_str = equation.split("=", 1)
-            lhs, rhs = map(sp.sympify, [lhs_str, rhs_str])
-            
-            # Extract denominators and compute restrictions
-            denominators = []
-            restrictions = set()
-            
-            for expr in [lhs, rhs]:
-                if expr.is_Add:
-                    for arg in expr.args:
-                        num, den = sp.fraction(sp.together(arg))
-                        if den != 1:
-                            denominators.append(den)
-                            try:
-                                sols = sp.solve(den, x)
-                                # Check if sols is a list/iterable and not empty
-                                if sols and hasattr(sols, '__iter__') and not isinstance(sols, bool):
-                                    restrictions.update(sols)
-                            except:
-                                pass
-                else:
-                    num, den = sp.fraction(sp.together(expr))
-                    if den != 1:
-                        denominators.append(den)
-                        try:
-                            sols = sp.solve(den, x)
-                            # Check if sols is a list/iterable and not empty
-                            if sols and hasattr(sols, '__iter__') and not isinstance(sols, bool):
-                                restrictions.update(sols)
-                        except:
-                            pass
-            
-            # Calculate LCD
-            if denominators and isinstance(denominators, (list, tuple)):
-                lcd = sp.lcm([sp.factor(d) for d in denominators])
-            else:
-                lcd = 1
+            # The session analysed the equation once; only this line is new
+            session = self.get_grading_session(equation)
+            reference = session.reference
+            denominators = reference.denominators
+            restrictions = reference.restrictions
+            lcd = reference.lcd
             
-            # Enhanced analysis using backend logic
+            # Enhanced analysis using backend logic: the line's feature vector
             feedback = []
             line_lower = line_text.lower()
+            features = session.features[-1]
             
-            # Check for explicit denominator mentions
-            if any(word in line_lower for word in ["denominator", "denominators", "denom", "lcd", "least common denominator"]):
+            # Explicit mentions of denominators and restrictions
+            if features.has('kw_denominator'):
                 feedback.append("✅ Excellent! You mentioned denominators explicitly")
-            
-            # Check for explicit restriction mentions
-            if any(word in line_lower for word in ["restriction", "restrictions", "excluded", "cannot", "≠", "!=", "not equal", "not equal to"]):
+            if features.has('kw_restriction'):
                 feedback.append("✅ Great! You mentioned restrictions explicitly")
-            
-            # Check for implicit restriction mentions with enhanced patterns
-            if "≠" in line_text or "!=" in line_text or "x" in line_text and any(char in line_text for char in ["≠", "!=", "not"]):
-                restriction_patterns = [
-                    r'x\s*[≠!]\s*\d+',  # x ≠ 3, x != 3
-                    r'x\s+not\s+equal\s+to\s+\d+',  # x not equal to 3
-                    r'x\s+cannot\s+be\s+\d+',  # x cannot be 3
-                    r'x\s+≠\s+\d+',  # x ≠ 3
-                ]
-                for pattern in restriction_patterns:
-                    if re.search(pattern, line_lower):
-                        feedback.append("✅ Good! You mentioned restrictions")
-                        break
-            
-            # Check for implicit denominator identification
-            if "(" in line_text and ")" in line_text and "/" in line_text and "x" in line_text:
+            # Implicit restriction statements like "x ≠ 3"
+            if features.has('restriction_pattern'):
+                feedback.append("✅ Good! You mentioned restrictions")
+            # Implicit denominator identification
+            if features.has('parens', 'slash', 'x'):
                 feedback.append("✅ Good! You're working with denominators")
-            
-            # Check for LCD usage with enhanced detection
-            if any(word in line_lower for word in ["multiply both sides by", "multiply by", "lcd", "least common denominator"]):
+            # LCD usage, explicit or like "(x-3)*[...]"
+            if features.has('kw_lcd'):
                 feedback.append("✅ Excellent! You're using LCD multiplication")
-            
-            # Check for implicit LCD usage (like "(x-3)*[...]")
-            if "*" in line_text and "(" in line_text and ")" in line_text and "/" in line_text:
+            if features.has('star', 'parens', 'slash'):
                 feedback.append("✅ Good! You're multiplying by denominators")
-            
-            # Check for simplified equation
-            if "=" in line_text and not any(char in line_text for char in ["/", "÷"]) and any(char in line_text for char in ["x", "X"]) and len(line_text) > 5:
+            # Simplified equation
+            if features.has('equals', 'x_any', 'long') and not features.any_of('slash', 'divide'):
                 feedback.append("✅ Good! You're showing simplified equations")
-            
-            # Check for mathematical operations
-            if any(char in line_text for char in ["+", "-", "*", "/", "="]):
+            # Mathematical operations and content
+            if features.has('operator'):
                 feedback.append("✅ Mathematical operations detected")
-            
-            # Check for specific mathematical content
-            if "x" in line_text and any(char in line_text for char in ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]):
+            if features.has('x', 'ascii_digit'):
                 feedback.append("✅ Algebraic work detected")
-            
-            # Check for verification work
-            if any(word in line_lower for word in ["verify", "verification", "check", "substitute", "substitution", "test", "testing", "plug in", "plugging in", "lhs", "rhs", "left side", "right side", "both sides", "balance", "balanced"]):
+            # Verification language and calculations
+            if features.has('kw_verification'):
                 feedback.append("✅ Great! You're including verification")
-            
-            # Check for actual verification calculations
-            if any(char in line_text for char in ["=", "≈", "≠"]) and any(char in line_text for char in ["x", "X"]) and any(char.isdigit() for char in line_text):
-                if any(word in line_lower for word in ["check", "verify", "test", "substitute", "lhs", "rhs"]):
-                    feedback.append("✅ Excellent! You're showing verification calculations")
-            
+            if features.any_of('equals', 'approx', 'neq') and features.has('x_any', 'digit', 'kw_verification_work'):
+                feedback.append("✅ Excellent! You're showing verification calculations")
+
+            # Step equivalence: exact checks at random rational points (cheap per line)
+            step = session.steps[-1]
+            if step['status'] == 'ok':
+                feedback.append({'previous': "✅ This step follows from the previous one",
+                                 'branch': "✅ Good - setting one factor equal to zero"}.get(
+                                    step['follows'], "✅ This step is equivalent to the original equation"))
+            elif step['status'] == 'broken':
+                feedback.append("❌ This step does not follow from the previous one - check your algebra")
+
+            # Where this line sits in the worked solution, and what comes next
+            hint = session.hint()
+            if hint['status'] in ('on_track', 'off_track'):
+                feedback.append(f"💡 Next step: {hint['hint']}")
+
             # If no specific feedback, provide general encouragement
             if not feedback:
                 feedback.append("📝 Line recorded - continue with your solution")
@@ -1785,10 +1406,10 @@ class OCRIntegratedDrawingSolverApp:
                         break
             
             # Add specific guidance based on what's missing
-            if denominators and isinstance(denominators, (list, tuple)) and not any("denominator" in line_lower or "lcd" in line_lower):
+            if denominators and isinstance(denominators, (list, tuple)) and not ("denominator" in line_lower or "lcd" in line_lower):
                 self.line_feedback.insert(tk.END, "  💡 Tip: Consider mentioning denominators or LCD\n")
             
-            if restrictions and isinstance(restrictions, (list, tuple, set)) and not any("restriction" in line_lower or "≠" in line_text or "!=" in line_text):
+            if restrictions and isinstance(restrictions, (list, tuple, set)) and not ("restriction" in line_lower or "≠" in line_text or "!=" in line_text):
                 self.line_feedback.insert(tk.END, "  💡 Tip: Remember to mention excluded values\n")
             
             self.line_feedback.insert(tk.END, "\n")
@@ -1832,9 +1453,6 @@ class OCRIntegratedDrawingSolverApp:
             try:
                 print(f"DEBUG: Attempting to use comprehensive backend checker")
                 
-                # Import the backend functions
-                from solving_real_copy import check_solution_correctness, analyze_verification_context, get_verification_feedback, get_verification_examples, get_detailed_verification_analysis
-                
                 # Convert raw format equation to standard format for backend processing
                 processed_equation = equation
                 if '[' in equation and ']' in equation:
@@ -1851,13 +1469,17 @@ class OCRIntegratedDrawingSolverApp:
                 
                 # Call the comprehensive backend checker
                 print(f"DEBUG: Calling comprehensive backend checker with equation: {processed_equation}")
-                backend_result = check_solution_correctness(processed_equation, solution_steps)
+                # Every line was already analysed as it was scanned: summarise the session
+                session = self.get_grading_session(processed_equation)
+                reference = session.reference
+                grade = session.result()
+                backend_result = (grade['correct'], grade['message'])
                 
-                # Get additional analysis
-                verification_score, verification_details = analyze_verification_context(solution_steps, "")
+                # Get additional analysis from the stored line features
+                verification_score, verification_details = solution_grader.analyze_verification_context(session.features)
                 verification_feedback = get_verification_feedback(verification_score > 0, verification_details)
-                verification_examples = get_verification_examples(processed_equation)
-                detailed_analysis = get_detailed_verification_analysis(solution_steps, "")
+                verification_examples = get_verification_examples(processed_equation, reference=reference)
+                detailed_analysis = solution_grader.get_detailed_verification_analysis(session.features)
                 
                 # Extract correctness from backend result
                 if isinstance(backend_result, dict):
@@ -2153,15 +1775,10 @@ class OCRIntegratedDrawingSolverApp:
                 messagebox.showwarning("Warning", "Please draw something first!")
                 return
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
             if OCR_AVAILABLE:
                 try:
                     # Get raw OCR output
-                    result = lcd.process_image(temp_file.name)
+                    result = lcd.process_image(img)
                     
                     # Create a detailed output dialog
                     self.show_raw_sympy_dialog(result)
@@ -2170,12 +1787,6 @@ class OCRIntegratedDrawingSolverApp:
                     messagebox.showerror("Error", f"OCR processing failed: {str(ocr_error)}")
             else:
                 messagebox.showwarning("Warning", "OCR module not available!")
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to get raw SymPy output: {str(e)}")
@@ -2362,15 +1973,10 @@ class OCRIntegratedDrawingSolverApp:
                 messagebox.showwarning("Warning", "Please draw something first!")
                 return
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
             if OCR_AVAILABLE:
                 try:
                     # Get completely raw OCR output
-                    result = lcd.process_image(temp_file.name)
+                    result = lcd.process_image(img)
                     
                     # Create a dialog showing the raw output exactly as received
                     self.show_completely_raw_dialog(result)
@@ -2379,12 +1985,6 @@ class OCRIntegratedDrawingSolverApp:
                     messagebox.showerror("Error", f"OCR processing failed: {str(ocr_error)}")
             else:
                 messagebox.showwarning("Warning", "OCR module not available!")
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to get completely raw output: {str(e)}")
@@ -2478,15 +2078,10 @@ class OCRIntegratedDrawingSolverApp:
                 messagebox.showwarning("Warning", "Please draw something first!")
                 return
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
             if OCR_AVAILABLE:
                 try:
                     # Get raw OCR output
-                    result = lcd.process_image(temp_file.name)
+                    result = lcd.process_image(img)
                     
                     # Convert LaTeX to raw format without solving
                     if "latex_raw" in result:
@@ -2520,12 +2115,6 @@ class OCRIntegratedDrawingSolverApp:
                     messagebox.showerror("Error", f"OCR processing failed: {str(ocr_error)}")
             else:
                 messagebox.showwarning("Warning", "OCR module not available!")
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to get raw format output: {str(e)}")
@@ -2991,15 +2580,10 @@ class OCRIntegratedDrawingSolverApp:
                 messagebox.showwarning("Warning", "Please draw something first!")
                 return
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file.close()
-            img.save(temp_file.name, 'PNG')
-            
             if OCR_AVAILABLE:
                 try:
                     # Get raw OCR output
-                    result = lcd.process_image(temp_file.name)
+                    result = lcd.process_image(img)
                     
                     # Convert LaTeX to raw format without solving
                     if "latex_raw" in result:
@@ -3029,12 +2613,6 @@ class OCRIntegratedDrawingSolverApp:
                     messagebox.showerror("Error", f"OCR processing failed: {str(ocr_error)}")
             else:
                 messagebox.showwarning("Warning", "OCR module not available!")
-            
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to add raw format: {str(e)}")
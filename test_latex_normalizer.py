@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Differential test for the single-pass LaTeX normaliser in lcd.py.
+
+RECORDED holds SimpleTex outputs seen by the app together with what the
+previous regex-based preprocess_latex_for_rationals and
+fallback_latex_to_sympy_string produced for them (captured before the
+rewrite). The new transcriber must agree with those outputs wherever the
+old converter produced something SymPy could parse, and must parse the
+cases the old one got wrong.
+"""
+
+import sys
+import os
+import time
+import sympy as sp
+
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import lcd
+
+# (raw OCR LaTeX, old preprocess output, old fallback output per '=' side)
+RECORDED = [
+    ('\\frac{2x}{x+1}=4', '\\frac{2x}{x+1}=4', ['(2*x)/(x+1)', '4']),
+    ('x+1[\\frac{2x}{x+1}=4]x+1', 'x+1x+1', ['x+1*x+1']),
+    ('2x-1[\\frac{3x+1}{2x-1}=5]2x-1', '2x-12x-1', ['2*x-12*x-1']),
+    ('\\frac{1}{x}+\\frac{1}{x+2}=\\frac{3}{4}', '\\frac{1}{x}+\\frac{1}{x+2}=\\frac{3}{4}', ['(1)/(x)+(1)/(x+2)', '(3)/(4)']),
+    ('\\dfrac{x^{2}-4}{x-2}=x+2', '\\frac{x^{2}-4}{x-2}=x+2', ['(x**(2)-4)/(x-2)', 'x+2']),
+    ('\\frac{x+3}{x-1}-\\frac{2}{x+1}=1', '\\frac{x+3}{x-1}-\\frac{2}{x+1}=1', ['(x+3)/(x-1)-(2)/(x+1)', '1']),
+    ('$\\frac{5}{x-3}=\\frac{2}{x+1}$', '\\frac{5}{x-3}=\\frac{2}{x+1}', ['(5)/(x-3)', '(2)/(x+1)']),
+    ('\\frac{\\frac{1}{x}+1}{x-1}=2', '\\frac{\\frac{1}{x}+1}{x-1}=2', ['((1)/(x)+1)/(x-1)', '2']),
+    ('\\left(x+1\\right)\\left(x-2\\right)=0', '\\left(x+1\\right)\\left(x-2\\right)=0', ['(x+1)*(x-2)', '0']),
+    ('2\\left(x-3\\right)=\\frac{x}{2}', '2\\left(x-3\\right)=\\frac{x}{2}', ['2*(x-3)', '(x)/(2)']),
+    ('x^{2}-5x+6=0', 'x^{2}-5x+6=0', ['x**(2)-5*x+6', '0']),
+    ('x^2+3x=0', 'x^2+3x=0', ['x**(2)+3*x', '0']),
+    ('\\frac{3}{x}=\\frac{x}{3}', '\\frac{3}{x}=\\frac{x}{3}', ['(3)/(x)', '(x)/(3)']),
+    ('\\sqrt{x+4}=3', '\\sqrt{x+4}=3', ['sqrt*(x+4)', '3']),  # old converter could not parse
+    ('3\\cdot(x-1)=2x', '3\\cdot(x-1)=2x', ['3*(x-1)', '2*x']),
+    ('4\\times x=12', '4\\cdot x=12', ['4*x', '12']),
+    ('\\frac{x}{x-2}+\\frac{3}{x+2}=\\frac{8}{x^{2}-4}', '\\frac{x}{x-2}+\\frac{3}{x+2}=\\frac{8}{x^{2}-4}', ['(x)/(x-2)+(3)/(x+2)', '(8)/(x**(2)-4)']),
+    ('\\frac12 x=3', '\\frac{12}{x=3}', ['\\frac{12}{x', '3}']),  # old converter could not parse
+    ('\\frac{2}{x-1}\\,=\\,\\frac{4}{x+1}', '\\frac{2}{x-1}=\\frac{4}{x+1}', ['(2)/(x-1)', '(4)/(x+1)']),
+    ('\\frac{x-1}{x+3}=\\frac{x}{x-3}\\\\ x\\neq 3', '\\frac{x-1}{x+3}=\\frac{x}{x-3}', ['(x-1)/(x+3)', '(x)/(x-3)']),
+    ('−\\frac{1}{x}=2', '-\\frac{1}{x}=2', ['-(1)/(x)', '2']),
+    ('\\frac { 6 } { x ^ { 2 } - 9 } = 1', '\\frac { 6 } { x ^ { 2 } - 9 } = 1', ['(6)/(x^{2}-9)', '1']),  # old converter could not parse
+    ('\\frac{x^{2}+2x}{x^{2}-4}=\\frac{x}{x-2}', '\\frac{x^{2}+2x}{x^{2}-4}=\\frac{x}{x-2}', ['(x**(2)+2*x)/(x**(2)-4)', '(x)/(x-2)']),
+    ('(x+1)(x-1)=3', '(x+1)(x-1)=3', ['(x+1)*(x-1)', '3']),
+    ('\\frac{1}{2}(x+4)=x', '\\frac{1}{2}(x+4)=x', ['(1)/(2)*(x+4)', 'x']),
+    ('2(x+1)=\\frac{x}{3}', '2(x+1)=\\frac{x}{3}', ['2*(x+1)', '(x)/(3)']),
+    ('x^{-1}=2', 'x^{-1}=2', ['x**(-1)', '2']),
+    ('\\frac{x+1}{x}=\\frac{3}{2}', '\\frac{x+1}{x}=\\frac{3}{2}', ['(x+1)/(x)', '(3)/(2)']),
+    ('\\tfrac{3}{x+1}\\;+\\;1=\\frac{x}{x+1}', '\\frac{3}{x+1}+1=\\frac{x}{x+1}', ['(3)/(x+1)+1', '(x)/(x+1)']),
+    ('\\frac{4}{x^2-1}-\\frac{2}{x-1}=\\frac{1}{x+1}', '\\frac{4}{x^2-1}-\\frac{2}{x-1}=\\frac{1}{x+1}', ['(4)/(x**(2)-1)-(2)/(x-1)', '(1)/(x+1)']),
+    ('\\left(\\frac{x}{2}\\right)^{2}=4', '\\left(\\frac{x}{2}\\right)^{2}=4', ['((x)/(2))**(2)', '4']),
+    ('\\frac{x}{3}+\\frac{x}{4}=7', '\\frac{x}{3}+\\frac{x}{4}=7', ['(x)/(3)+(x)/(4)', '7']),
+    ('\\frac{10}{x}-\\frac{10}{x+1}=\\frac{1}{6}', '\\frac{10}{x}-\\frac{10}{x+1}=\\frac{1}{6}', ['(10)/(x)-(10)/(x+1)', '(1)/(6)']),
+    ('\\frac{\\sqrt{x}}{2}=3', '\\frac{\\sqrt{x}}{2}=3', ['(sqrt*(x))/(2)', '3']),  # old converter could not parse
+    ('x+\\frac{6}{x}=5', 'x+\\frac{6}{x}=5', ['x+(6)/(x)', '5']),
+    ('\\frac{2x+1}{x-3}=\\frac{2x-1}{x+3}', '\\frac{2x+1}{x-3}=\\frac{2x-1}{x+3}', ['(2*x+1)/(x-3)', '(2*x-1)/(x+3)']),
+    ('\\frac{1}{x}=\\frac{1}{3}+\\frac{1}{6}', '\\frac{1}{x}=\\frac{1}{3}+\\frac{1}{6}', ['(1)/(x)', '(1)/(3)+(1)/(6)']),
+    ('3x=\\frac{x+10}{2}', '3x=\\frac{x+10}{2}', ['3*x', '(x+10)/(2)']),
+
+]
+
+# What the inputs the old converter could not parse actually mean
+EXPECTED_FIXES = {
+    r"\sqrt{x+4}=3": ["sqrt(x+4)", "3"],
+    r"\frac12 x=3": ["x/2", "3"],
+    r"\frac { 6 } { x ^ { 2 } - 9 } = 1": ["6/(x**2-9)", "1"],
+    r"\frac{\sqrt{x}}{2}=3": ["sqrt(x)/2", "3"],
+}
+
+
+def _new_sides(raw):
+    normalized = lcd.preprocess_latex_for_rationals(raw)
+    return normalized, [lcd.fallback_latex_to_sympy_string(side) for side in normalized.split("=")]
+
+
+def test_matches_previous_converter():
+    """Same SymPy expressions as the regex chain on every input it handled"""
+    compared = 0
+    for raw, old_latex, old_sides in RECORDED:
+        if raw in EXPECTED_FIXES:
+            continue
+        normalized, new_sides = _new_sides(raw)
+        assert normalized.replace(" ", "") == old_latex.replace(" ", ""), (raw, normalized)
+        assert len(new_sides) == len(old_sides), (raw, new_sides)
+        for old, new in zip(old_sides, new_sides):
+            assert sp.simplify(sp.sympify(old) - sp.sympify(new)) == 0, (raw, old, new)
+        compared += 1
+    assert compared == len(RECORDED) - len(EXPECTED_FIXES)
+    print(f"✅ {compared} recorded OCR outputs convert identically")
+
+
+def test_fixes_previous_failures():
+    """\\sqrt, brace-less \\frac and spaced exponents now parse"""
+    for raw, expected in EXPECTED_FIXES.items():
+        _, new_sides = _new_sides(raw)
+        assert [sp.sympify(side) for side in new_sides] == [sp.sympify(e) for e in expected], \
+            (raw, new_sides)
+    print("✅ Inputs the regex chain mangled now convert")
+
+
+def test_nested_and_implicit_products():
+    """Nested fractions, \\left/\\right and juxtaposition become explicit SymPy"""
+    convert = lcd.fallback_latex_to_sympy_string
+    assert convert(r"\frac{\frac{1}{x}}{\frac{2}{x+1}}") == "((1)/(x))/((2)/(x+1))"
+    assert convert(r"2\frac{x}{3}\left(x+1\right)") == "2*(x)/(3)*(x+1)"
+    assert convert(r"x^23") == "x**(2)*3"
+    assert convert(r"3\pi x") == "3*pi*x"
+    assert convert(r"\sqrt[3]{x+1}") == "(x+1)**(1/(3))"
+    print("✅ Nested fractions and implicit products handled")
+
+
+def test_linear_time_on_long_input():
+    """Doubling the input roughly doubles the work (the old loop was quadratic)"""
+    def timed(n):
+        latex = "+".join(r"\frac{1}{x+%d}" % i for i in range(n))
+        start = time.perf_counter()
+        lcd.fallback_latex_to_sympy_string(lcd.preprocess_latex_for_rationals(latex))
+        return time.perf_counter() - start
+
+    small, large = min(timed(2000) for _ in range(3)), min(timed(8000) for _ in range(3))
+    assert large < small * 8, (small, large)
+    print(f"✅ 4x input took {large / small:.1f}x the time")
+
+
+def test_conversion_is_memoised():
+    """Identical LaTeX (after normalisation) is converted once"""
+    converter = lcd.LatexToSympyConverter()
+    first = converter.convert(r"\frac{2x}{x+1}=4")
+    second = converter.convert(r"\dfrac{2x}{x+1} = 4")
+    assert first == second == sp.Eq(2 * sp.Symbol("x") / (sp.Symbol("x") + 1), 4)
+    stats = converter.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["paths"]["equation_split"]["successes"] == 1
+
+    for _ in range(2):
+        try:
+            converter.convert(r"3x+=2")
+        except RuntimeError as e:
+            assert "Unable to convert" in str(e)
+        else:
+            raise AssertionError("malformed LaTeX should fail")
+    stats = converter.stats()
+    assert stats["hits"] == 2
+    assert stats["paths"]["fallback_split"]["failures"] == 1
+    print("✅ Conversions and failures memoised")
+
+
+def test_conversion_prefers_historically_successful_path():
+    """After a strategy keeps winning for a shape it is tried first"""
+    calls = []
+
+    def failing(latex):
+        calls.append("slow")
+        raise ValueError("unsupported")
+
+    def working(latex):
+        calls.append("fast")
+        return sp.sympify(lcd.fallback_latex_to_sympy_string(latex))
+
+    converter = lcd.LatexToSympyConverter(strategies=[
+        ("slow", failing, lambda s: True),
+        ("fast", working, lambda s: True),
+    ])
+    converter.convert(r"\frac{1}{x}+1")
+    assert calls == ["slow", "fast"]
+    calls.clear()
+    converter.convert(r"\frac{2}{x}+3")
+    assert calls == ["fast"]
+    stats = converter.stats()
+    assert stats["wins_by_shape"] == {"expression+frac": {"fast": 2}}
+    assert stats["paths"]["slow"]["failures"] == 1
+    print("✅ Historically successful path tried first")
+
+
+def test_history_never_changes_the_result_kind():
+    """Wins for "full" on one equation must not turn the next one into a solution list"""
+    def solved(latex):
+        lhs, rhs = latex.split('=')
+        return sp.solve(sp.Eq(sp.sympify(lhs), sp.sympify(rhs)), list=True)
+
+    def split(latex):
+        lhs, rhs = latex.split('=')
+        if "+3" in lhs:
+            raise ValueError("unsupported")
+        return sp.Eq(sp.sympify(lhs), sp.sympify(rhs))
+
+    converter = lcd.LatexToSympyConverter(strategies=[
+        ("equation_split", split, lambda s: '=' in s, "equation"),
+        ("full", solved, lambda s: True, "whole"),
+    ])
+    # "full" wins this shape a few times while the split strategy fails
+    for k in range(3):
+        assert isinstance(converter.convert(f"x+3={k}"), list)
+    assert converter.stats()["wins_by_shape"]["equation"] == {"full": 3}
+    assert converter.convert("x+1=3") == sp.Eq(sp.Symbol("x") + 1, 3)
+
+    # The default strategies, warmed on "full"
+    converter = lcd.LatexToSympyConverter()
+    converter.wins_by_shape["equation"] = {"full": 50}
+    assert isinstance(converter.convert("x+2=5"), sp.Equality)
+    print("✅ Strategy history only reorders strategies of one result kind")
+
+
+if __name__ == "__main__":
+    test_matches_previous_converter()
+    test_fixes_previous_failures()
+    test_nested_and_implicit_products()
+    test_linear_time_on_long_input()
+    test_conversion_is_memoised()
+    test_conversion_prefers_historically_successful_path()
+    test_history_never_changes_the_result_kind()
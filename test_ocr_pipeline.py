@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+"""
+Test script for the OCR pipeline in lcd.py (no SimpleTex calls)
+"""
+
+import io
+import sys
+import os
+import json
+import time
+import tempfile
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image, ImageDraw
+
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import lcd
+
+
+def make_canvas(strokes, size=(600, 400), width=3):
+    """Draw strokes the way DrawingArea.get_drawing_as_image does"""
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for line in strokes:
+        for (x1, y1), (x2, y2) in zip(line, line[1:]):
+            draw.line([x1, y1, x2, y2], fill="black", width=width)
+    return img
+
+
+FRACTION_STROKES = [
+    [(250, 150), (270, 120), (270, 180)],            # "1"
+    [(230, 200), (330, 200)],                        # fraction bar
+    [(240, 220), (260, 260), (280, 220)],            # "x"-ish
+    [(350, 190), (380, 190)], [(350, 210), (380, 210)],  # "="
+]
+
+
+def test_preprocess_crops_and_shrinks():
+    """The upload is cropped to the ink, 1-bit and smaller than the canvas"""
+    png_bytes, stats = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    processed = Image.open(io.BytesIO(png_bytes))
+    assert processed.mode == "1"
+    assert processed.size == stats["size"]
+    assert processed.size[0] < 600 and processed.size[1] < 400
+    assert processed.size[1] == lcd.OCR_TARGET_INK_HEIGHT + 2 * lcd.OCR_MARGIN
+    assert stats["processed_bytes"] == len(png_bytes)
+    assert stats["bytes_saved"] > 0
+    assert stats["ms"] >= 0
+    print(f"✅ Canvas reduced {stats['original_bytes']} → {stats['processed_bytes']} bytes")
+
+
+def test_preprocess_keeps_margin():
+    """Ink sits inside a white border of OCR_MARGIN pixels"""
+    png_bytes, _ = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    processed = Image.open(io.BytesIO(png_bytes)).convert("L")
+    w, h = processed.size
+    m = lcd.OCR_MARGIN
+    assert processed.crop((0, 0, w, m - 1)).getextrema() == (255, 255)
+    assert processed.crop((0, 0, m - 1, h)).getextrema() == (255, 255)
+    assert processed.crop((m, m, w - m, h - m)).getextrema()[0] == 0
+    print("✅ Margin preserved around ink")
+
+
+def test_preprocess_normalizes_stroke_width():
+    """Thin and thick pens end up with comparable stroke widths"""
+    _, thin = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES, width=1))
+    _, thick = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES, width=9))
+    assert thin["stroke_width"] < thick["stroke_width"]
+    for png_bytes, _ in (lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES, width=w))
+                         for w in (1, 3, 9)):
+        img = Image.open(io.BytesIO(png_bytes)).convert("L")
+        ink = np.asarray(img) < lcd.OCR_INK_THRESHOLD
+        width = lcd._estimate_stroke_width(ink)
+        assert 1.5 <= width <= 2 * lcd.OCR_TARGET_STROKE + 2, width
+    print("✅ Stroke widths normalized")
+
+
+def test_preprocess_rejects_blank_canvas():
+    """A blank canvas never reaches the OCR service"""
+    try:
+        lcd.preprocess_image_for_ocr(make_canvas([]))
+    except ValueError as e:
+        assert "No ink" in str(e)
+    else:
+        raise AssertionError("blank canvas should be rejected")
+    print("✅ Blank canvas rejected")
+
+
+def test_ocr_cache_exact_and_near_hits():
+    """Duplicates are served from memory, other formulas are not"""
+    cache = lcd.OCRResultCache(maxsize=2, threshold=2)
+    png_a, stats_a = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    phash_a = lcd.perceptual_hash(png_a)
+    assert cache.get(png_a, phash_a, stats_a["size"]) == (None, None)
+    cache.put(png_a, phash_a, stats_a["size"], r"\frac{1}{x}=")
+    assert cache.get(png_a, phash_a, stats_a["size"]) == (r"\frac{1}{x}=", "exact")
+
+    # The same drawing elsewhere on the canvas preprocesses to the same bytes
+    moved = [[(x + 40, y + 30) for x, y in line] for line in FRACTION_STROKES]
+    png_b, stats_b = lcd.preprocess_image_for_ocr(make_canvas(moved))
+    assert cache.get(png_b, lcd.perceptual_hash(png_b), stats_b["size"])[1] == "exact"
+
+    # A stray speck changes the bytes but not the perceptual hash
+    speck = Image.open(io.BytesIO(png_a)).convert("L")
+    speck.putpixel((speck.size[0] // 2, speck.size[1] // 2), 0)
+    buf = io.BytesIO()
+    speck.convert("1").save(buf, format="PNG")
+    png_s = buf.getvalue()
+    assert png_s != png_a
+    assert cache.get(png_s, lcd.perceptual_hash(png_s), speck.size) == (r"\frac{1}{x}=", "near")
+
+    # ...but near matching is opt-in: by default only identical bytes hit,
+    # since "x = 1.7" and "x = 17" can hash as closely as a speck does
+    exact_only = lcd.OCRResultCache()
+    assert exact_only.threshold == 0
+    exact_only.put(png_a, phash_a, stats_a["size"], r"\frac{1}{x}=")
+    assert exact_only.get(png_s, lcd.perceptual_hash(png_s), speck.size) == (None, None)
+    assert exact_only.get(png_a, phash_a, stats_a["size"])[1] == "exact"
+
+    other = FRACTION_STROKES[:2] + [[(240, 220), (280, 220), (240, 260), (280, 260)]]
+    png_c, stats_c = lcd.preprocess_image_for_ocr(make_canvas(other))
+    assert cache.get(png_c, lcd.perceptual_hash(png_c), stats_c["size"]) == (None, None)
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["near_hits"], stats["misses"]) == (2, 1, 2)
+    print("✅ OCR cache hits duplicates and misses new formulas")
+
+
+def test_ocr_cache_sqlite_tier():
+    """Results survive a fresh cache instance when a database is configured"""
+    png, stats = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    phash = lcd.perceptual_hash(png)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "ocr_cache.db")
+        lcd.OCRResultCache(db_path=db_path).put(png, phash, stats["size"], "x=1")
+        fresh = lcd.OCRResultCache(db_path=db_path)
+        assert fresh.get(png, phash, stats["size"]) == ("x=1", "db-exact")
+        assert fresh.get(png, phash, stats["size"]) == ("x=1", "exact")
+        assert fresh.stats()["db_hits"] == 1
+    print("✅ SQLite tier serves results after restart")
+
+
+def test_process_image_skips_upload_on_cache_hit():
+    """A repeated drawing never leaves the server"""
+    calls = []
+    original_send = lcd.send_to_simpletex
+    lcd.send_to_simpletex = lambda image, token, **kw: calls.append(image) or "x+1=2"
+    lcd.ocr_cache.clear()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "canvas.png")
+            make_canvas(FRACTION_STROKES).save(path)
+            first = lcd.process_image(path)
+            second = lcd.process_image(path)
+    finally:
+        lcd.send_to_simpletex = original_send
+        lcd.ocr_cache.clear()
+    assert len(calls) == 1
+    assert first["cache"] == "miss" and second["cache"] == "exact"
+    assert second["latex_raw"] == "x+1=2" and second["solutions"] == first["solutions"]
+    print("✅ Cached OCR result reused")
+
+
+def test_ocr_cache_coalesces_concurrent_uploads():
+    """A double-clicked upload calls SimpleTex once; both callers get its answer"""
+    cache = lcd.OCRResultCache()
+    png, stats = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    phash = lcd.perceptual_hash(png)
+    calls, release = [], threading.Event()
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "x=2"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch(png, phash, stats["size"], load)))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while cache.stats()["coalesced"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [("x=2", "coalesced"), ("x=2", "coalesced"), ("x=2", "miss")]
+    assert cache.fetch(png, phash, stats["size"], load) == ("x=2", "exact")
+
+    # A failed upload is shared too, and is not cached
+    def fail():
+        release.wait(5)
+        raise lcd.OCRUnavailable(3.0)
+
+    release.clear()
+    errors = []
+
+    def failing_fetch():
+        try:
+            cache.fetch(b"other", phash, stats["size"], fail)
+        except lcd.OCRUnavailable as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=failing_fetch) for _ in range(2)]
+    for t in threads:
+        t.start()
+    while cache.stats()["coalesced"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert cache.get(b"other", phash, stats["size"]) == (None, None)
+    print("✅ Concurrent identical uploads share one SimpleTex call")
+
+
+def test_process_image_accepts_in_memory_sources():
+    """Paths, bytes, streams and PIL images all give the same upload"""
+    uploads = []
+    original_send = lcd.send_to_simpletex
+    lcd.send_to_simpletex = lambda image, token, **kw: uploads.append(image) or "x=1"
+    img = make_canvas(FRACTION_STROKES)
+    png = lcd.read_image_source(img)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "canvas.png")
+            img.save(path)
+            for source in (path, png, io.BytesIO(png), img):
+                result = lcd.process_image(source, use_cache=False)
+                assert result["latex_raw"] == "x=1", result
+    finally:
+        lcd.send_to_simpletex = original_send
+    assert len(uploads) == 4 and all(u == uploads[0] for u in uploads)
+    print("✅ Path, bytes, stream and PIL inputs processed identically")
+
+
+def test_ocr_endpoint_streams_upload():
+    """/api/ocr/process hands the upload stream to lcd without a temp file"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+    original_send = lcd.send_to_simpletex
+    original_tempfile = tempfile.NamedTemporaryFile
+    lcd.send_to_simpletex = lambda image, token, **kw: "x+1=2"
+
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("temp file created")
+    tempfile.NamedTemporaryFile = no_temp_files
+    try:
+        client = drawing_solver_api.app.test_client()
+        png = lcd.read_image_source(make_canvas(FRACTION_STROKES))
+        resp = client.post("/api/ocr/process", data={"image": (io.BytesIO(png), "drawing.png")},
+                           content_type="multipart/form-data")
+    finally:
+        lcd.send_to_simpletex = original_send
+        tempfile.NamedTemporaryFile = original_tempfile
+    assert resp.status_code == 200, resp.get_json()
+    assert resp.get_json()["latex_raw"] == "x+1=2"
+    print("✅ OCR endpoint processed upload in memory")
+
+
+def test_stroke_payload_round_trip_and_rasterize():
+    """Delta-encoded strokes decode exactly and rasterise like the canvas"""
+    strokes = lcd.encode_strokes(FRACTION_STROKES)
+    assert strokes[1] == [230, 200, 100, 0]
+    assert lcd.decode_strokes(strokes) == [list(line) for line in FRACTION_STROKES]
+
+    from_strokes, stats_s = lcd.preprocess_image_for_ocr(lcd.rasterize_strokes(strokes))
+    from_canvas, stats_c = lcd.preprocess_image_for_ocr(make_canvas(FRACTION_STROKES))
+    assert stats_s["size"] == stats_c["size"]
+    distance = lcd.hamming_distance(lcd.perceptual_hash(from_strokes),
+                                    lcd.perceptual_hash(from_canvas))
+    assert distance <= 8, distance
+
+    for bad in ([[1, 2, 3]], [[1.5, 2]], "1,2", [[1, 2]] * (lcd.OCR_MAX_STROKE_POINTS + 1)):
+        try:
+            lcd.decode_strokes(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"accepted malformed payload {bad!r:.40}")
+    print("✅ Stroke payload decoded and rasterised")
+
+
+def test_ocr_endpoint_accepts_strokes():
+    """/api/ocr/process takes JSON strokes and rejects malformed ones"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+    uploads = []
+    original_send = lcd.send_to_simpletex
+    lcd.send_to_simpletex = lambda image, token, **kw: uploads.append(image) or "x+1=2"
+    lcd.ocr_cache.clear()
+    try:
+        client = drawing_solver_api.app.test_client()
+        ok = client.post("/api/ocr/process", json={"strokes": lcd.encode_strokes(FRACTION_STROKES)})
+        bad = client.post("/api/ocr/process", json={"strokes": [[1, 2, 3]]})
+    finally:
+        lcd.send_to_simpletex = original_send
+    assert ok.status_code == 200 and ok.get_json()["latex_raw"] == "x+1=2"
+    assert bad.status_code == 400
+    assert Image.open(io.BytesIO(uploads[0])).mode == "1"
+    print("✅ OCR endpoint accepted stroke payload")
+
+
+def test_job_queue_caps_concurrency_and_long_polls():
+    """Jobs run at most `workers` at a time and get() can block until done"""
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow_process(image):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {"latex_raw": image, "error": None}
+
+    queue = lcd.OCRJobQueue(workers=2, max_pending=6, process=slow_process)
+    job_ids = [queue.submit(f"x={i}") for i in range(6)]
+    try:
+        queue.submit("overflow")
+    except lcd.OCRQueueFull:
+        pass
+    else:
+        raise AssertionError("queue should reject submissions beyond max_pending")
+
+    results = [queue.get(job_id, wait=5) for job_id in job_ids]
+    assert [r["result"]["latex_raw"] for r in results] == [f"x={i}" for i in range(6)]
+    assert all(r["status"] == "done" for r in results)
+    assert peak[0] == 2
+    stats = queue.stats()
+    assert (stats["completed"], stats["rejected"], stats["queued"]) == (6, 1, 0)
+    assert queue.get("missing") is None
+    print("✅ Job queue bounded, ordered and pollable")
+
+
+def test_ocr_job_endpoints():
+    """POST /api/ocr/jobs returns 202 and the job can be long-polled"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+    original_send = lcd.send_to_simpletex
+    lcd.send_to_simpletex = lambda image, token, **kw: "x+1=2"
+    lcd.ocr_cache.clear()
+    try:
+        client = drawing_solver_api.app.test_client()
+        png = lcd.read_image_source(make_canvas(FRACTION_STROKES))
+        submitted = client.post("/api/ocr/jobs", data={"image": (io.BytesIO(png), "drawing.png")},
+                                content_type="multipart/form-data")
+        assert submitted.status_code == 202
+        job_id = submitted.get_json()["job_id"]
+        polled = client.get(f"/api/ocr/jobs/{job_id}?wait=5").get_json()
+        missing = client.get("/api/ocr/jobs/nope")
+        stats = client.get("/api/ocr/jobs").get_json()
+    finally:
+        lcd.send_to_simpletex = original_send
+    assert polled["status"] == "done" and polled["result"]["latex_raw"] == "x+1=2"
+    assert polled["result_status"] == 200
+    assert missing.status_code == 404
+    assert stats["submitted"] >= 1 and "queued" in stats
+    print("✅ OCR job endpoints queue and return results")
+
+
+class _ScriptedSimpleTex:
+    """Local stand-in for /api/latex_ocr answering from a list of (delay, status)"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+        lock = threading.Lock()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with lock:
+                    index = owner.calls
+                    owner.calls += 1
+                delay, status = owner.script[min(index, len(owner.script) - 1)]
+                time.sleep(delay)
+                body = json.dumps({"status": True, "res": {"latex": f"x={index}"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/latex_ocr"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_client_retries_transient_errors():
+    """503s are retried with backoff; a 400 fails immediately"""
+    server = _ScriptedSimpleTex([(0, 503), (0, 503), (0, 200)])
+    try:
+        client = lcd.SimpleTexClient(retries=2, backoff=0.01)
+        assert lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client) == "x=2"
+        assert client.stats()["retries"] == 2
+
+        server.script, server.calls = [(0, 400)], 0
+        try:
+            lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("4xx should not be retried")
+        assert server.calls == 1
+    finally:
+        server.close()
+    print("✅ Transient failures retried, client errors surfaced")
+
+
+def test_client_hedges_slow_requests():
+    """A request slower than p95 is hedged and the faster copy wins"""
+    server = _ScriptedSimpleTex([(0, 200)] * 5 + [(1.0, 200), (0, 200)])
+    try:
+        client = lcd.SimpleTexClient(hedge=True, hedge_min_samples=5)
+        for _ in range(5):
+            lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client)
+        start = time.perf_counter()
+        latex = lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.close()
+    assert latex == "x=6"
+    assert elapsed < 0.9
+    stats = client.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    print(f"✅ Hedged request answered in {elapsed * 1000:.0f} ms")
+
+
+def test_standin_serves_fixtures_through_pipeline():
+    """process_image against the local stand-in returns the recorded LaTeX"""
+    from simpletex_standin import SimpleTexStandIn, image_key
+    img = make_canvas(FRACTION_STROKES)
+    png, _ = lcd.preprocess_image_for_ocr(img)
+    standin = SimpleTexStandIn(fixtures={image_key(png): "x+1=2"})
+    original_url = lcd.SIMPLETEX_API_URL
+    lcd.SIMPLETEX_API_URL = standin.start()
+    try:
+        result = lcd.process_image(img, use_cache=False)
+        other = lcd.process_image(make_canvas(FRACTION_STROKES[:2]), use_cache=False)
+        standin.error_rate, standin.error_status = 1.0, 200
+        failed = lcd.process_image(img, use_cache=False)
+    finally:
+        lcd.SIMPLETEX_API_URL = original_url
+        standin.stop()
+    assert result["latex_raw"] == "x+1=2" and result["error"] is None
+    assert other["latex_raw"] is None and "no fixture" in other["error"]
+    assert failed["latex_raw"] is None and "injected error" in failed["error"]
+    assert standin.stats()["fixture_hits"] == 1
+    print("✅ Stand-in answers with recorded fixtures and injected errors")
+
+
+def test_benchmark_reports_percentiles_and_outcomes():
+    """A short in-process benchmark run produces a complete report"""
+    import bench_ocr_pipeline
+    from simpletex_standin import SimpleTexStandIn
+    corpus = bench_ocr_pipeline.synthetic_corpus(3)
+    standin = SimpleTexStandIn(fixtures=bench_ocr_pipeline.standin_fixtures(corpus),
+                               latency_ms=5)
+    original_url = lcd.SIMPLETEX_API_URL
+    lcd.SIMPLETEX_API_URL = standin.start()
+    lcd.ocr_cache.clear()
+    try:
+        report = bench_ocr_pipeline.run_benchmark(corpus, total_requests=9, concurrency=3)
+    finally:
+        lcd.SIMPLETEX_API_URL = original_url
+        standin.stop()
+        lcd.ocr_cache.clear()
+    assert report["requests"] == 9 and report["success_rate"] == 1.0
+    assert set(report["latency_ms"]) == {"p50", "p90", "p95", "p99"}
+    assert sum(report["outcomes"].values()) == 9
+    assert standin.stats()["fixture_misses"] == 0
+    print(f"✅ Benchmark ran at {report['throughput_rps']} req/s")
+
+
+def test_circuit_breaker_fails_fast_and_probes():
+    """Repeated 503s open the breaker; after the cooldown one probe closes it"""
+    now = [0.0]
+    breaker = lcd.CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, cooldown=10,
+                                 clock=lambda: now[0])
+    server = _ScriptedSimpleTex([(0, 503)])
+    try:
+        client = lcd.SimpleTexClient(retries=0)
+        for _ in range(4):
+            try:
+                lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client,
+                                      breaker=breaker)
+            except RuntimeError:
+                pass
+        assert breaker.state == "open" and server.calls == 4
+        try:
+            lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client,
+                                  breaker=breaker)
+        except lcd.OCRUnavailable as e:
+            assert e.retry_after == 10
+        else:
+            raise AssertionError("open breaker should fail fast")
+        assert server.calls == 4
+
+        now[0] = 11
+        server.script = [(0, 200)]
+        assert breaker.allow_request() and breaker.state == "half_open"
+        assert not breaker.allow_request()      # only one probe at a time
+        breaker.record(False, 0.01)
+        assert breaker.state == "closed"
+        assert lcd.send_to_simpletex(b"png", "token", api_url=server.url, client=client,
+                                     breaker=breaker) == "x=4"
+    finally:
+        server.close()
+
+    slow = lcd.CircuitBreaker(min_calls=2, slow_seconds=1.0, slow_rate=1.0)
+    slow.record(False, 2.0)
+    slow.record(False, 2.0)
+    assert slow.state == "open" and slow.stats()["slow_calls"] == 2
+    print("✅ Breaker opens on failures and slow calls, probes after cooldown")
+
+
+def test_circuit_breaker_probe_window_and_stale_results():
+    """Full probe slots report the probe's remaining time; late results are ignored"""
+    now = [0.0]
+    breaker = lcd.CircuitBreaker(min_calls=2, failure_rate=0.5, slow_seconds=4.0, cooldown=10,
+                                 clock=lambda: now[0])
+    before_open = breaker.admit()           # a slow call starts while closed
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    assert breaker.state == "open"
+
+    now[0] = 11
+    probe = breaker.admit()
+    assert probe is not None and breaker.state == "half_open"
+    now[0] = 12
+    assert breaker.admit() is None
+    assert breaker.retry_after() == 3.0 and breaker.is_open()
+    try:
+        lcd.send_to_simpletex(b"png", "token", breaker=breaker)
+    except lcd.OCRUnavailable as e:
+        assert e.retry_after == 3.0
+    else:
+        raise AssertionError("full probe slots should fail fast")
+
+    # The call from before the breaker opened succeeds late: it must not close it
+    breaker.record(False, 0.5, before_open)
+    assert breaker.state == "half_open" and breaker.stats()["stale_results"] == 1
+    breaker.record(False, 0.5, probe)
+    assert breaker.state == "closed"
+
+    # A probe that outlives slow_seconds re-opens the breaker for a full cooldown
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    now[0] = 30
+    stuck = breaker.admit()
+    now[0] = 35
+    assert breaker.retry_after() == 10
+    assert breaker.admit() is None and breaker.state == "open"
+    assert breaker.retry_after() == 10
+    breaker.record(False, 5.0, stuck)
+    assert breaker.state == "open"
+    print("✅ Breaker reports the probe window and ignores stale results")
+
+
+def test_ocr_endpoint_reports_unavailable_while_open():
+    """With the breaker open /api/ocr/process answers 503 and /api/health is degraded"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+
+    lcd.ocr_cache.clear()
+    lcd.ocr_breaker.reset()
+    try:
+        for _ in range(lcd.ocr_breaker.min_calls):
+            lcd.ocr_breaker.record(True, 0.1)
+        client = drawing_solver_api.app.test_client()
+        strokes = lcd.encode_strokes(FRACTION_STROKES)
+        resp = client.post("/api/ocr/process", json={"strokes": strokes})
+        health = client.get("/api/health").get_json()
+    finally:
+        lcd.ocr_breaker.reset()
+    body = resp.get_json()
+    assert resp.status_code == 503 and body["ocr_unavailable"] is True
+    assert body["error"] == "OCR unavailable" and int(resp.headers["Retry-After"]) > 0
+    assert health["status"] == "degraded" and health["ocr_breaker"]["state"] == "open"
+    print("✅ Open breaker surfaces as 503 + degraded health")
+
+
+# Three lines: the fraction equation, "x" alone, and a long stroke line with
+# a stray dot far below the baseline gap threshold
+PAGE_STROKES = FRACTION_STROKES + [
+    [(240, 320), (260, 360), (280, 320)],
+    [(200, 430), (400, 470)], [(300, 475), (301, 476)],
+]
+
+
+def test_segment_lines_by_projection_and_strokes():
+    """Fractions stay on one line; line gaps split; thin bands join a neighbour"""
+    lines = lcd.segment_lines(make_canvas(PAGE_STROKES, size=(600, 520)))
+    assert len(lines) == 3
+    for (_, (top, bottom)), (want_top, want_bottom) in zip(lines, [(120, 261), (320, 361), (430, 477)]):
+        assert abs(top - want_top) <= 2 and abs(bottom - want_bottom) <= 2
+    assert all(img.width == 600 for img, _ in lines)
+
+    groups = lcd.segment_strokes(lcd.encode_strokes(PAGE_STROKES))
+    assert [len(lcd.decode_strokes(group)) for group, _ in groups] == [5, 1, 2]
+    assert [bbox for _, bbox in groups] == [(120, 261), (320, 361), (430, 477)]
+    assert lcd.segment_lines(make_canvas([])) == []
+    print("✅ Lines segmented by ink projection and stroke boxes")
+
+
+def test_process_lines_runs_lines_concurrently():
+    """process_lines keeps reading order and takes about one line's OCR time"""
+    expected = {}
+    for i, (group, _) in enumerate(lcd.segment_strokes(lcd.encode_strokes(PAGE_STROKES))):
+        png, _ = lcd.preprocess_image_for_ocr(lcd.rasterize_strokes(group))
+        expected[png] = f"x={i}"
+
+    def slow_ocr(image, token):
+        time.sleep(0.3)
+        return expected[image]
+
+    original = lcd.send_to_simpletex
+    lcd.send_to_simpletex = slow_ocr
+    lcd.ocr_cache.clear()
+    try:
+        start = time.perf_counter()
+        result = lcd.process_lines(strokes=lcd.encode_strokes(PAGE_STROKES))
+        elapsed = time.perf_counter() - start
+        blank = lcd.process_lines(image=make_canvas([]))
+    finally:
+        lcd.send_to_simpletex = original
+        lcd.ocr_cache.clear()
+    assert result["error"] is None and result["count"] == 3
+    assert [line["latex_raw"] for line in result["lines"]] == ["x=0", "x=1", "x=2"]
+    assert [line["index"] for line in result["lines"]] == [0, 1, 2]
+    assert elapsed < 0.8
+    assert blank["count"] == 0 and "No ink" in blank["error"]
+    print(f"✅ 3 lines OCRed in {elapsed * 1000:.0f} ms")
+
+
+def test_ocr_lines_endpoint():
+    """/api/ocr/lines accepts strokes and uploads and returns ordered lines"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+
+    original = lcd.send_to_simpletex
+    lcd.send_to_simpletex = lambda image, token: "x+1=2"
+    lcd.ocr_cache.clear()
+    try:
+        client = drawing_solver_api.app.test_client()
+        resp = client.post("/api/ocr/lines", json={"strokes": lcd.encode_strokes(PAGE_STROKES)})
+        buf = io.BytesIO()
+        make_canvas(PAGE_STROKES, size=(600, 520)).save(buf, format="PNG")
+        upload = client.post("/api/ocr/lines", data={"image": (io.BytesIO(buf.getvalue()), "page.png")},
+                             content_type="multipart/form-data")
+        bad = client.post("/api/ocr/lines", json={"strokes": [[1, 2, 3]]})
+    finally:
+        lcd.send_to_simpletex = original
+        lcd.ocr_cache.clear()
+    assert resp.status_code == 200 and resp.get_json()["count"] == 3
+    assert all(line["status"] == 200 and line["latex_raw"] == "x+1=2"
+               for line in resp.get_json()["lines"])
+    assert upload.status_code == 200 and upload.get_json()["count"] == 3
+    assert bad.status_code == 400
+    print("✅ /api/ocr/lines returns one result per drawn line")
+
+
+if __name__ == "__main__":
+    test_preprocess_crops_and_shrinks()
+    test_preprocess_keeps_margin()
+    test_preprocess_normalizes_stroke_width()
+    test_preprocess_rejects_blank_canvas()
+    test_ocr_cache_exact_and_near_hits()
+    test_ocr_cache_sqlite_tier()
+    test_process_image_skips_upload_on_cache_hit()
+    test_ocr_cache_coalesces_concurrent_uploads()
+    test_process_image_accepts_in_memory_sources()
+    test_ocr_endpoint_streams_upload()
+    test_stroke_payload_round_trip_and_rasterize()
+    test_ocr_endpoint_accepts_strokes()
+    test_job_queue_caps_concurrency_and_long_polls()
+    test_ocr_job_endpoints()
+    test_client_retries_transient_errors()
+    test_client_hedges_slow_requests()
+    test_standin_serves_fixtures_through_pipeline()
+    test_benchmark_reports_percentiles_and_outcomes()
+    test_circuit_breaker_fails_fast_and_probes()
+    test_circuit_breaker_probe_window_and_stale_results()
+    test_ocr_endpoint_reports_unavailable_while_open()
+    test_segment_lines_by_projection_and_strokes()
+    test_process_lines_runs_lines_concurrently()
+    test_ocr_lines_endpoint()
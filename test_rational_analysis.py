@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Test script for the structured rational function analysis in yessss.py
+"""
+
+import sys
+import os
+import json
+import sympy as sp
+
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import yessss
+from yessss import (RationalFunctionCalculator, RationalAnalysisCache, RealRoot, analyze_batch,
+                    analyze_batch_item, fields_request, batch_request)
+
+
+def test_field_dependency_closure():
+    """Requesting the domain should not touch the numerator"""
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("(x^2-8x-20)/(x+3)", ["domain"])
+    assert values["domain"] == "(-∞, ∞) excluding -3"
+    assert "numerator_roots" not in values
+    assert "factored_numerator" not in values
+    print("✅ Domain computed without numerator work")
+
+
+def test_fields_match_individual_methods():
+    """analyze_fields agrees with the per-field calculator methods"""
+    calculator = RationalFunctionCalculator()
+    func = "(x^2-4)/(x-2)"
+    values = calculator.analyze_fields(func, ["zeros", "holes", "vertical_asymptotes"])
+
+    numerator, denominator = calculator.parse_function(func)
+    common, simplified_num, simplified_den = calculator.find_common_factors(numerator, denominator)
+    assert values["zeros"] == calculator.find_zeros(simplified_num, common)
+    assert values["vertical_asymptotes"] == calculator.find_vertical_asymptotes(denominator, common)
+    assert values["holes"] == calculator.find_holes(common, simplified_num / simplified_den)
+    print("✅ Field results match the individual methods")
+
+
+def test_serialize_fields():
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("(x^2-4)/(x-2)", ["holes", "horizontal_asymptote"])
+    data = RationalFunctionCalculator.serialize_fields(values, ["holes", "horizontal_asymptote"])
+    assert data == {"holes": [["2", "4"]], "horizontal_asymptote": None}
+    print("✅ Fields serialize to JSON-friendly values")
+
+
+def test_unknown_field_rejected():
+    calculator = RationalFunctionCalculator()
+    try:
+        calculator.analyze_fields("(x+1)/(x-1)", ["slope"])
+    except ValueError as e:
+        assert "slope" in str(e)
+        print("✅ Unknown field rejected")
+    else:
+        raise AssertionError("Unknown field was accepted")
+
+
+def test_cache_equivalent_inputs_share_entry():
+    """Spacing, X vs x, f(x)= and factored vs expanded hit one entry"""
+    cache = RationalAnalysisCache(maxsize=8)
+    variants = [
+        "(x^2-4)/(x-2)",
+        "f(x) = (X^2 - 4) / (x - 2)",
+        "(x-2)(x+2)/(x-2)",
+        "((x - 2)(x + 2))/(x-2)",
+    ]
+    for func in variants:
+        assert cache.analyze_fields(func, ["holes"])["holes"] == [(2, 4)]
+    stats = cache.stats()
+    assert stats["size"] == 1
+    assert stats["misses"] == 1 and stats["hits"] == 3
+    print(f"✅ Equivalent inputs share one cache entry: {stats}")
+
+
+def test_cache_is_bounded_and_warmable():
+    cache = RationalAnalysisCache(maxsize=2)
+    warmed = cache.warm(["(x+1)/(x-1)", "(x+2)/(x-2)", "(x+3)/(x-3)", "not a function"])
+    assert warmed == 3
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 0 and stats["misses"] == 0
+    cache.analyze_fields("(x+3)/(x-3)", ["domain"])
+    assert cache.hit_rate == 1.0
+    print("✅ Cache evicts past maxsize and warming is not counted as hits")
+
+
+def test_batch_keeps_input_order_and_dedupes():
+    functions = ["(x^2-4)/(x-2)", "x + 1", "(x - 2)(x + 2)/(x - 2)", "(x+1)/(x-3)"]
+    results = list(analyze_batch(functions, compact=True, window=1))
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["success"] for r in results] == [True, False, True, True]
+    assert results[0]["fields"] == results[2]["fields"]
+    assert "steps" not in results[0]
+    assert results[3]["fields"]["vertical_asymptotes"] == ["3"]
+    print("✅ Batch results come back in input order with per-item errors")
+
+
+def test_full_batch_item_analyses_once():
+    """Steps and fields of a non-compact item come from one cache entry"""
+    calculator = yessss.analysis_cache.calculator
+    calls = []
+    original_common, original_sign = calculator.find_common_factors, calculator.sign_analysis
+    calculator.find_common_factors = lambda *a: calls.append("common") or original_common(*a)
+    calculator.sign_analysis = lambda *a: calls.append("sign") or original_sign(*a)
+    calculator.show_plots = False
+    yessss.analysis_cache.clear()
+    try:
+        item = analyze_batch_item("(x^2-4)/(x-2)")
+    finally:
+        del calculator.find_common_factors, calculator.sign_analysis
+        calculator.show_plots = True
+        yessss.analysis_cache.clear()
+    assert sorted(calls) == ["common", "sign"]
+    assert item["fields"]["holes"] == [["2", "4"]]
+    assert any(step.startswith("• Hole at (2, 4)") for step in item["steps"])
+    print("✅ Full batch items analyse each function once")
+
+
+def test_real_root_isolation_for_cubic_denominator():
+    """Irreducible cubics give one real, isolated restriction and no complex ones"""
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("(x+1)/(x^3-x-1)", ["domain_restrictions", "vertical_asymptotes"])
+    restrictions = values["domain_restrictions"]
+    assert len(restrictions) == 1 and isinstance(restrictions[0], RealRoot)
+    lower, upper = restrictions[0].refine(sp.Rational(1, 10**9))
+    assert upper - lower <= sp.Rational(1, 10**9)
+    assert abs(float(restrictions[0]) - 1.324718) < 1e-6
+    assert str(restrictions[0]) == "≈1.3247"
+    assert values["vertical_asymptotes"] == restrictions
+    print("✅ Cubic denominator restriction isolated and refined")
+
+
+def test_complex_roots_are_not_restrictions():
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("(x^3-1)/(x^2+1)", ["domain", "zeros"])
+    assert values["domain"] == "(-∞, ∞)"
+    assert values["zeros"] == [1]
+    print("✅ Complex roots are excluded from restrictions and zeros")
+
+
+def test_sign_chart_and_pole_behavior():
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("(x^2-8x-20)/(x+3)", ["sign_chart", "pole_behavior", "end_behavior"])
+    assert [entry["sign"] for entry in values["sign_chart"]] == ["-", "+", "-", "+"]
+    assert values["pole_behavior"] == [
+        {"x": -3, "multiplicity": 1, "left": "-∞", "right": "+∞", "sign_change": True}
+    ]
+    assert values["end_behavior"] == {"left": "-∞", "right": "+∞"}
+
+    # Even multiplicity: same side on both sides of the pole
+    values = calculator.analyze_fields("1/(x^2-2x+1)", ["pole_behavior", "end_behavior"])
+    assert values["pole_behavior"][0]["left"] == values["pole_behavior"][0]["right"] == "+∞"
+    assert values["end_behavior"]["right"] == "y → 0 from above"
+
+    # A cancelled factor is a hole, not a pole
+    values = calculator.analyze_fields("(x^2-4)/(x-2)", ["pole_behavior"])
+    assert values["pole_behavior"] == []
+    print("✅ Sign chart and one-sided pole behaviour computed")
+
+
+def test_repeated_factors_use_multiplicities():
+    """A shared root is a hole only when the numerator has it at least as often"""
+    calculator = RationalFunctionCalculator()
+    fields = ["holes", "vertical_asymptotes", "pole_behavior", "common_factors"]
+    values = calculator.analyze_fields("(x-1)^2/(x-1)^3", fields)
+    assert values["holes"] == [] and values["vertical_asymptotes"] == [1]
+    assert [(p["x"], p["multiplicity"]) for p in values["pole_behavior"]] == [(1, 1)]
+
+    values = calculator.analyze_fields("(x-1)^3/(x-1)^2", fields + ["zeros"])
+    assert values["holes"] == [(1, 0)] and values["vertical_asymptotes"] == []
+    assert values["pole_behavior"] == [] and values["zeros"] == []
+
+    report = RationalAnalysisCache(calculator=RationalFunctionCalculator(show_plots=False))
+    text = report.analysis_report("(x-1)^2/(x-1)^3")
+    assert "No vertical asymptotes" not in text and "nan" not in text
+    assert "• VA: x = 1" in text and "Near VA x = 1" in text
+    print("✅ Holes and vertical asymptotes follow factor multiplicities")
+
+
+def test_zero_numerator_is_zero_with_holes():
+    calculator = RationalFunctionCalculator()
+    values = calculator.analyze_fields("0/(x-1)", ["holes", "vertical_asymptotes", "sign_chart",
+                                                   "pole_behavior", "end_behavior"])
+    assert values["holes"] == [(1, 0)] and values["vertical_asymptotes"] == []
+    assert [entry["sign"] for entry in values["sign_chart"]] == ["0", "0"]
+    assert values["pole_behavior"] == []
+    assert values["end_behavior"] == {"left": "y = 0", "right": "y = 0"}
+    print("✅ A zero numerator gives holes, not poles")
+
+
+def test_concurrent_reports_do_not_mix():
+    """Reports are captured per call, not by swapping sys.stdout for the process"""
+    import threading
+    cache = RationalAnalysisCache(calculator=RationalFunctionCalculator(show_plots=False))
+    functions = ["(x+1)/(x-3)", "(x^2-4)/(x+5)", "1/(x^2-2x+1)", "(x-7)/(x+7)"]
+    reports = {}
+    stop = threading.Event()
+
+    def chatter():
+        while not stop.wait(0.001):
+            print("NOISE FROM ANOTHER THREAD")
+
+    def report(func):
+        reports[func] = cache.analysis_report(func)
+
+    noise = threading.Thread(target=chatter)
+    noise.start()
+    workers = [threading.Thread(target=report, args=(func,)) for func in functions]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        stop.set()
+        noise.join()
+    for func in functions:
+        text = reports[func]
+        assert "NOISE" not in text and text.count("RATIONAL FUNCTION CALCULATOR") == 1
+    assert "x = 3" in reports["(x+1)/(x-3)"] and "x = 3" not in reports["(x-7)/(x+7)"]
+    print("✅ Concurrent reports are captured separately")
+
+
+def test_solver_server_without_yessss_answers_503():
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    saved = {name: sys.modules.pop(name, None) for name in ("yessss", "rational_function_solver")}
+    sys.modules["yessss"] = None     # makes the server's import fail
+    try:
+        import rational_function_solver
+        client = rational_function_solver.app.test_client()
+        for resp in (client.post("/api/rational-function/fields", json={"function": "x", "fields": ["domain"]}),
+                     client.get("/api/rational-function/cache"),
+                     client.post("/api/rational-function/batch", json={"functions": ["x"]})):
+            assert resp.status_code == 503 and resp.get_json()["error"] == "Solver not available"
+    finally:
+        for name, module in saved.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+    print("✅ Solver server without yessss reports 503")
+
+
+def test_request_helpers_shared_by_servers():
+    """The /fields and /batch bodies both API servers hand to yessss"""
+    payload, status = fields_request({"function": "(x^2-4)/(x-2)", "fields": ["holes"]})
+    assert status == 200 and payload["fields"] == {"holes": [["2", "4"]]}
+    payload, status = fields_request({"function": "(x^2-4)/(x-2)"})
+    assert status == 400 and "holes" in payload["available_fields"]
+    assert fields_request({"function": "x", "fields": ["slope"]})[1] == 400
+
+    assert batch_request({"functions": []})[1] == 400
+    lines, status = batch_request({"functions": ["(x+1)/(x-3)"], "compact": True})
+    assert status == 200
+    assert [json.loads(line)["success"] for line in lines] == [True]
+    print("✅ Shared request helpers validate and answer like the endpoints")
+
+
+if __name__ == "__main__":
+    test_field_dependency_closure()
+    test_fields_match_individual_methods()
+    test_serialize_fields()
+    test_unknown_field_rejected()
+    test_cache_equivalent_inputs_share_entry()
+    test_cache_is_bounded_and_warmable()
+    test_batch_keeps_input_order_and_dedupes()
+    test_full_batch_item_analyses_once()
+    test_real_root_isolation_for_cubic_denominator()
+    test_complex_roots_are_not_restrictions()
+    test_sign_chart_and_pole_behavior()
+    test_repeated_factors_use_multiplicities()
+    test_zero_numerator_is_zero_with_holes()
+    test_concurrent_reports_do_not_mix()
+    test_solver_server_without_yessss_answers_503()
+    test_request_helpers_shared_by_servers()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Test script for headless solution grading in solution_grader.py
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import sympy as sp
+
+import solution_grader
+from solution_grader import (CRITERIA, EquationReference, get_reference, grade_submission,
+                             grade_batch, summarize_grades, extract_features, line_features,
+                             check_steps, parse_step, GradingSession, GradingSessionStore,
+                             next_step_hint)
+
+EQUATION = "(x+2)/(x-1)=2"
+
+FULL_SOLUTION = [
+    "Denominators: x-1",
+    "Restriction: x ≠ 1",
+    "Multiply both sides by (x-1)",
+    "x+2 = 2x-2",
+    "x = 4",
+    "Check: LHS = 6/3 = 2",
+]
+
+
+def test_full_solution_meets_every_criterion():
+    """A complete worked solution is correct and meets all criteria"""
+    result = grade_submission(EQUATION, FULL_SOLUTION)
+    assert result["correct"] is True and result["error"] is None
+    assert list(result["criteria"]) == CRITERIA
+    assert all(c["met"] for c in result["criteria"].values())
+    assert result["final_answer"] == "4"
+    assert result["equation_info"]["restrictions"] == ["1"]
+    assert result["message"] == " | ".join(result["feedback"])
+    print("✅ Full solution graded correct on every criterion")
+
+
+def test_missing_work_and_wrong_answer_flagged():
+    """Missing restrictions/verification and a wrong answer show up per criterion"""
+    result = grade_submission(EQUATION, ["x+2 = 2x-2", "x = 5"])
+    criteria = result["criteria"]
+    assert result["correct"] is False
+    assert criteria["restrictions"]["required"] and not criteria["restrictions"]["met"]
+    assert criteria["final_answer"]["found"] and not criteria["final_answer"]["met"]
+    assert "❌ Final answer is incorrect" in result["feedback"]
+
+    polynomial = grade_submission("x+1=3", ["x=2"])
+    assert polynomial["correct"] and not polynomial["criteria"]["lcd"]["required"]
+    assert "⚠️ LCD multiplication not explicitly mentioned" not in polynomial["feedback"]
+
+    invalid = grade_submission("x+1", ["x=2"])
+    assert invalid["error"] and invalid["message"] == "Invalid equation format. Missing '='."
+    print("✅ Missing work and wrong answers flagged")
+
+
+def test_stated_final_answer_takes_precedence():
+    """An explicit final answer overrides the solution lines when it parses"""
+    result = grade_submission(EQUATION, ["x = 5"], final_answer="x = 4")
+    assert result["correct"] and result["final_answer"] == "4"
+    fallback = grade_submission(EQUATION, ["x = 4"], final_answer="???")
+    assert fallback["correct"]
+    quadratic = grade_submission("x**2-5*x+6=0", [], final_answer="x = (5 ± 1)/2")
+    assert quadratic["correct"]
+    print("✅ Stated final answers are used before solution lines")
+
+
+def test_batch_keeps_order_and_aggregates():
+    """grade_batch grades in worker processes and summarises the class"""
+    submissions = [
+        {"student_id": "a", "lines": FULL_SOLUTION},
+        {"student_id": "b", "lines": ["x = 5"]},
+        {"student_id": "c", "lines": ["x = 5"]},
+        {"student_id": "d", "equation": "x+1=3", "lines": ["x=2"]},
+        {"student_id": "e", "equation": "nonsense", "lines": ["x=2"]},
+    ]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        batch = grade_batch(submissions, equation=EQUATION, executor=executor)
+    results, summary = batch["results"], batch["summary"]
+    assert [r["student_id"] for r in results] == ["a", "b", "c", "d", "e"]
+    assert [r["index"] for r in results] == list(range(5))
+    assert [r["correct"] for r in results] == [True, False, False, True, False]
+    assert summary["students"] == 5 and summary["graded"] == 4 and summary["errors"] == 1
+    assert summary["correct"] == 2 and summary["accuracy"] == 0.5
+    assert summary["criteria"]["restrictions"] == {"applicable": 3, "met": 1, "rate": 0.3333}
+    assert summary["common_wrong_answers"] == [{"answer": "5", "students": 2}]
+    assert summarize_grades([])["accuracy"] is None
+    print(f"✅ Batch of 5 graded in {summary['wall_ms']} ms")
+
+
+def test_grading_endpoints():
+    """/api/grade and /api/grade/batch return structured results"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+
+    client = drawing_solver_api.app.test_client()
+    resp = client.post("/api/grade", json={"student_id": "a", "equation": EQUATION,
+                                           "lines": FULL_SOLUTION})
+    body = resp.get_json()
+    assert resp.status_code == 200 and body["correct"] and body["student_id"] == "a"
+
+    assert client.post("/api/grade", json={"equation": EQUATION}).status_code == 400
+    assert client.post("/api/grade", json={"equation": EQUATION, "lines": "x=4"}).status_code == 400
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        original = drawing_solver_api.solution_grader.get_grading_executor
+        drawing_solver_api.solution_grader.get_grading_executor = lambda: executor
+        try:
+            batch = client.post("/api/grade/batch", json={
+                "equation": EQUATION,
+                "submissions": [{"student_id": "a", "lines": FULL_SOLUTION},
+                                {"student_id": "b", "lines": ["x = 5"]}]})
+        finally:
+            drawing_solver_api.solution_grader.get_grading_executor = original
+    body = batch.get_json()
+    assert batch.status_code == 200 and body["summary"]["correct"] == 1
+    assert [r["student_id"] for r in body["results"]] == ["a", "b"]
+    bad = client.post("/api/grade/batch", json={"submissions": [{"lines": ["x=1"]}]})
+    assert bad.status_code == 400 and "Submission 0" in bad.get_json()["error"]
+    print("✅ Grading endpoints return per-student and class results")
+
+
+def test_grading_input_never_reaches_eval():
+    """Python smuggled into an equation, a line or a final answer is rejected, not run"""
+    import tempfile
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+
+    with tempfile.TemporaryDirectory() as directory:
+        marker = os.path.join(directory, "ran")
+        payload = f"__import__('os').system('touch {marker}')"
+        client = drawing_solver_api.app.test_client()
+        resp = client.post("/api/grade", json={"equation": f"{payload} = 1", "lines": ["x = 1"]})
+        assert "Unsupported" in resp.get_json()["error"]
+        resp = client.post("/api/grade", json={"equation": EQUATION, "lines": [f"{payload} = x", "x = 4"],
+                                               "final_answer": f"x = {payload}"})
+        assert resp.status_code == 200 and resp.get_json()["correct"]
+        assert client.post("/api/grade/hint", json={"equation": f"{payload}=x",
+                                                    "lines": []}).status_code == 400
+        assert client.post("/api/grade/sessions", json={"equation": f"1=x+{payload}"}).status_code == 400
+        assert not os.path.exists(marker)
+
+    assert parse_step("x = __import__('os').getcwd()") is None
+    assert parse_step("2x + 4 = 3(x - 1)") is not None
+    assert solution_grader.parse_math("sqrt(13)/2 + x^2") == sp.sqrt(13) / 2 + sp.Symbol("x") ** 2
+    assert solution_grader.parse_math("1/x^2 + x^(1/2)") == sp.Symbol("x") ** -2 + sp.sqrt(sp.Symbol("x"))
+
+    # Power towers are refused before anything is evaluated
+    start = time.perf_counter()
+    for tower in ("9**9**9**9", "9^(9^9)", "((x^8)^8)^8", "2^(2^(2^(2^2)))"):
+        try:
+            solution_grader.parse_math(tower)
+        except ValueError as e:
+            assert "Exponent" in str(e)
+        else:
+            raise AssertionError(f"{tower} was evaluated")
+    resp = client.post("/api/grade", json={"equation": EQUATION, "lines": ["x = 9^9^9^9", "9^9^9^9 = x"],
+                                           "final_answer": "x = 9**9**9**9"})
+    assert resp.status_code == 200 and not resp.get_json()["correct"]
+    assert time.perf_counter() - start < 5
+    print("✅ Grading input is parsed against a math-token whitelist")
+
+
+def test_reference_built_once_per_equation():
+    """Submissions on one equation share a single cached EquationReference"""
+    solution_grader.reference_cache.clear()
+    reference = get_reference(EQUATION)
+    assert get_reference(" (x+2)/(x-1) = 2 ") is reference
+    assert get_reference(reference) is reference
+    assert reference.denominator_strs == ["x - 1"] and reference.restriction_strs == ["1"]
+    assert reference.info()["simplified_equation"] == "x + 2 = 2*x - 2"
+
+    for answer in ["x = 4", "x = 5", "x = 4"]:
+        grade_submission(EQUATION, [answer])
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        grade_batch([{"lines": ["x = 4"]}] * 10, equation=EQUATION, executor=executor)
+    assert solution_grader.reference_cache.stats()["misses"] == 1
+
+    prebuilt = EquationReference("1/x = 2")
+    assert grade_submission("ignored", ["x = 1/2"], reference=prebuilt)["correct"]
+    print("✅ Equation analysed once for every submission")
+
+
+def test_extraneous_roots_are_not_solutions():
+    """A root that zeroes a denominator is excluded from the true solutions"""
+    reference = get_reference("x/(x-1) = 1/(x-1) + 2")
+    assert [str(s) for s in reference.candidate_solutions] == ["1"]
+    assert reference.solutions == [] and [str(s) for s in reference.extraneous_solutions] == ["1"]
+    result = grade_submission("x/(x-1) = 1/(x-1) + 2", ["x = 1"])
+    assert not result["correct"] and result["equation_info"]["extraneous_solutions"] == ["1"]
+    print("✅ Extraneous roots rejected")
+
+
+def test_line_features_single_pass():
+    """One feature vector per line carries keyword classes and character classes"""
+    check = line_features("Check: LHS = 6/3 = 2")
+    assert check.has('kw_check_label', 'kw_side_values', 'slash', 'digit', 'equals')
+    assert not check.any_of('star', 'kw_lcd')
+    squared = line_features("x² + x")
+    assert squared.has('digit', 'x') and not squared.has('ascii_digit')
+    assert line_features("x ≠ 3").has('restriction_pattern')
+    assert not line_features("X not equal to 3").has('restriction_pattern')
+    assert line_features("x = 4").is_answer and not line_features("x = y").is_answer
+
+    features = extract_features(["x = 4", "x = 4", "  ", "4/2 = 2"])
+    assert [f.index for f in features] == [0, 1, 2, 3]
+    assert features[3].text == "4/2 = 2" and features[2].flags == 0
+    print("✅ Line features extracted in one pass")
+
+
+def test_verification_analysis_from_features():
+    """Verification scoring reads the shared feature vectors"""
+    score, details = solution_grader.analyze_verification_context(extract_features(FULL_SOLUTION))
+    assert score > 0 and details
+    analysis = solution_grader.get_detailed_verification_analysis(extract_features(FULL_SOLUTION))
+    bare = solution_grader.get_detailed_verification_analysis(extract_features(["x = 4"]))
+    assert analysis != bare
+    assert solution_grader.analyze_verification_context(extract_features(["x = 4"]))[0] == 0
+    print("✅ Verification analysis uses extracted features")
+
+
+def test_step_equivalence_flags_first_broken_line():
+    """Each step is checked against the previous one and the original equation modulo the LCD"""
+    equation = "1/x + 1/(x+1) = 5/6"
+    good = ["LCD: 6x(x+1)", "6(x+1) + 6x = 5x(x+1)", "12x + 6 = 5x^2 + 5x",
+            "5x² - 7x - 6 = 0", "(5x+3)(x-2) = 0", "x = 2"]
+    report = check_steps(good, equation)
+    assert [s['status'] for s in report['steps']] == ['skipped', 'ok', 'ok', 'ok', 'ok', 'answer']
+    assert report['steps'][1]['follows'] == 'original' and report['first_error'] is None
+    assert report['checked'] == 4
+
+    bad = ["6(x+1) + 6x = 5x(x+1)", "12x + 6 = 5x^2 + 5x", "5x² + 7x - 6 = 0", "(5x+3)(x-2) = 0"]
+    report = check_steps(bad, equation)
+    assert report['first_error'] == 2
+    assert [s['status'] for s in report['steps']] == ['ok', 'ok', 'broken', 'ok']
+    assert report['steps'][3]['follows'] == 'original'
+
+    result = grade_submission(EQUATION, ["x+2 = 2(x-1)", "x+2 = 2x-1", "x = 3"])
+    assert not result['criteria']['steps']['met'] and result['criteria']['steps']['first_error'] == 1
+    assert "❌ Line 2 does not follow from the previous step: x+2 = 2x-1" in result['feedback']
+    assert not grade_submission(EQUATION, ["x = 4"])['criteria']['steps']['required']
+
+    assert parse_step("Check: LHS = 6/3 = 2") is None and parse_step("x ≠ 1") is None
+    assert parse_step("LCD = x(x-1)") is None and parse_step("Step 2: 2x = 8") is not None
+    print(f"✅ First broken step flagged in {report['ms']} ms")
+
+
+def test_zero_product_branches_follow_the_factored_step():
+    """'factor = 0' lines after a factored step are branches, not broken steps"""
+    equation = "x + 6/x = 5"
+    lines = ["x^2 + 6 = 5x", "x^2 - 5x + 6 = 0", "(x-2)(x-3) = 0",
+             "x - 2 = 0", "x = 2", "x - 3 = 0", "x = 3"]
+    result = grade_submission(equation, lines)
+    assert result['correct'] and result['criteria']['steps']['met']
+    assert not any("does not follow" in message for message in result['feedback'])
+    assert [s['follows'] for s in result['steps']] == ['original', 'previous', 'previous', 'branch',
+                                                       None, 'branch', None]
+    session = GradingSession(equation).add_lines(lines)
+    assert [s['status'] for s in session.steps] == [s['status'] for s in result['steps']]
+
+    # A factor that is not one of the previous step's is still broken
+    report = check_steps(["(x-2)(x-3) = 0", "x - 4 = 0"], equation)
+    assert report['first_error'] == 1
+
+    # Denominator factors are not branches: the cleared equation is -23 = 0
+    no_solution = "(2*x+1)/(x**2-9) + 3/(x+3) = 5/(x-3)"
+    assert get_reference(no_solution).residual_numerator.degree() == 0
+    result = grade_submission(no_solution, ["x - 3 = 0", "x = 3"])
+    assert result['steps'][0]['status'] == 'broken' and not result['criteria']['steps']['met']
+    assert not result['correct']
+    print("✅ Zero-product branches accepted")
+
+
+def test_grading_session_is_incremental():
+    """Lines added one at a time give the same grade as grading them all at once"""
+    session = GradingSession(EQUATION)
+    analyses = [session.add_line(line) for line in FULL_SOLUTION]
+    assert [a['index'] for a in analyses] == list(range(len(FULL_SOLUTION)))
+    assert analyses[3]['step']['status'] == 'ok' and 'kw_check_label' in analyses[5]['features']
+
+    expected, result = grade_submission(EQUATION, FULL_SOLUTION), session.result()
+    for key in ('correct', 'final_answer', 'criteria', 'steps', 'feedback', 'message', 'equation_info'):
+        assert result[key] == expected[key], key
+
+    # Checks that look at the next line apply once that line arrives
+    session = GradingSession(EQUATION)
+    session.add_line("x = 4")
+    assert not session.result()['criteria']['verification']['met']
+    session.add_line("substitute: (4+2)/(4-1) = 2")
+    assert session.result()['criteria']['verification']['met']
+    assert session.result(final_answer="x = 5")['final_answer'] == "5"
+
+    # The line analysis never revisits earlier lines
+    calls = []
+    original = solution_grader.line_features
+    solution_grader.line_features = lambda line, index=0: calls.append(line) or original(line, index)
+    try:
+        session.add_line("x+2 = 2x-2")
+    finally:
+        solution_grader.line_features = original
+    assert calls == ["x+2 = 2x-2"]
+    print("✅ Grading session analyses each line once")
+
+
+def test_grading_session_store_ttl():
+    """Sessions are looked up by id and evicted after the idle TTL or over capacity"""
+    now = [0.0]
+    store = GradingSessionStore(ttl=60, maxsize=2, clock=lambda: now[0])
+    first = store.create(EQUATION)
+    assert len(first.session_id) == 32
+    now[0] = 50
+    assert store.get(first.session_id) is first
+    second = store.create("x+1=3")
+    now[0] = 100
+    assert store.get(first.session_id) is first     # last used at 50, refreshed now
+    now[0] = 155
+    assert store.get(second.session_id) is None     # idle since 50
+    assert store.stats()['expired'] == 1 and store.stats()['active'] == 1
+
+    store.create("x+2=3")
+    store.create("x+3=3")
+    assert store.get(first.session_id) is None and store.stats()['evicted'] == 1
+    try:
+        store.create("x+1")
+        assert False, "expected a parse error"
+    except Exception:
+        pass
+    print("✅ Grading sessions expire after their TTL")
+
+
+def test_grading_session_endpoints():
+    """/api/grade/sessions creates a session, takes lines one at a time and summarises"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+
+    client = drawing_solver_api.app.test_client()
+    created = client.post("/api/grade/sessions", json={"equation": EQUATION})
+    assert created.status_code == 201
+    session_id = created.get_json()["session_id"]
+    assert created.get_json()["equation_info"]["restrictions"] == ["1"]
+
+    for line in FULL_SOLUTION[:-1]:
+        resp = client.post(f"/api/grade/sessions/{session_id}/lines", json={"line": line})
+        assert resp.status_code == 200
+    resp = client.post(f"/api/grade/sessions/{session_id}/lines", json={"lines": FULL_SOLUTION[-1:]})
+    body = resp.get_json()
+    assert body["line_count"] == len(FULL_SOLUTION) and body["lines"][0]["index"] == 5
+
+    result = client.get(f"/api/grade/sessions/{session_id}").get_json()
+    assert result["correct"] and result["session_id"] == session_id
+    assert result["message"] == grade_submission(EQUATION, FULL_SOLUTION)["message"]
+    assert client.get(f"/api/grade/sessions/{session_id}?final_answer=x%3D5").get_json()["correct"] is False
+
+    assert client.post(f"/api/grade/sessions/{session_id}/lines", json={"line": 3}).status_code == 400
+    assert client.post("/api/grade/sessions", json={"equation": "x+1"}).status_code == 400
+    assert client.delete(f"/api/grade/sessions/{session_id}").status_code == 200
+    assert client.get(f"/api/grade/sessions/{session_id}").status_code == 404
+    assert "grading_sessions" in client.get("/api/health").get_json()
+    print("✅ Grading session endpoints work line by line")
+
+
+def test_mistake_catalogue_diagnoses_wrong_answers():
+    """Wrong answers produced by typical mistakes are diagnosed by lookup"""
+    reference = get_reference("3/(x-1) - (2*x+1)/(x-1) = 4")
+    mistakes = {entry['mistake'] for entries in reference.mistakes.values() for entry in entries}
+    assert mistakes == {'kept_excluded_root', 'sign_error', 'unmultiplied_term', 'dropped_denominator'}
+    assert reference.diagnose(sp.Integer(1))[0]['mistake'] == 'kept_excluded_root'
+    assert reference.diagnose(sp.Rational(4, 3))[0]['mistake'] == 'sign_error'
+    assert reference.diagnose(sp.Integer(-1))[0]['mistake'] == 'unmultiplied_term'
+    assert reference.diagnose(sp.Integer(0))[0]['mistake'] == 'dropped_denominator'
+    assert reference.diagnose(sp.Integer(7)) == []
+
+    # True solutions are never catalogued as mistakes
+    other = get_reference("x/(x+2) - 3/(x-1) = 1")
+    assert other.diagnose(sp.Rational(-4, 5)) == []
+    assert other.diagnose(sp.Rational(8, 5))[0]['mistake'] == 'sign_error'
+
+    result = grade_submission("x/(x+2) - 3/(x-1) = 1", ["x = 8/5"])
+    assert result['criteria']['final_answer']['diagnosis'][0]['mistake'] == 'sign_error'
+    assert "❌ Final answer is incorrect - likely sign error distributing the LCD over -3/(x - 1)" \
+        in result['feedback']
+    assert grade_submission(EQUATION, ["x = 5"])['criteria']['final_answer']['diagnosis'] == []
+
+    summary = summarize_grades([result, result, grade_submission(EQUATION, ["x = 4"])])
+    assert summary['common_mistakes'] == [{'mistake': 'sign_error', 'students': 2}]
+    print("✅ Common mistakes diagnosed from the catalogue")
+
+
+def test_next_step_hints_follow_the_step_graph():
+    """The latest recognised line is matched to the nearest node of the cached step graph"""
+    equation = "1/x + 1/(x+1) = 5/6"
+    reference = get_reference(equation)
+    assert [node.id for node in reference.step_graph] == [
+        'equation', 'denominators_factored', 'lcd_identified', 'terms_multiplied',
+        'cleared_polynomial', 'factored', 'roots', 'verified_roots']
+    assert reference.step_graph[5].form == "(x - 2)*(5*x + 3) = 0"
+
+    progress = [
+        ([], 'equation'),
+        (["Denominators: x, x+1"], 'denominators_factored'),
+        (["LCD = 6x(x+1)"], 'lcd_identified'),
+        (["6(x+1) + 6x = 5x(x+1)"], 'terms_multiplied'),
+        (["5x^2 - 7x - 6 = 0"], 'cleared_polynomial'),
+        (["(5x+3)(x-2) = 0", "  "], 'factored'),
+        (["(5x+3)(x-2) = 0", "x - 2 = 0"], 'factored'),
+        (["x = 2"], 'roots'),
+    ]
+    for lines, node_id in progress:
+        hint = next_step_hint(equation, lines)
+        assert hint['matched']['id'] == node_id, (lines, hint)
+        following = reference.step_graph[[n.id for n in reference.step_graph].index(node_id) + 1]
+        assert hint['next']['id'] == following.id and hint['hint'] == following.instruction
+    assert next_step_hint(equation, [])['status'] == 'start'
+
+    assert next_step_hint(equation, ["x = 2", "Check: 1/2 + 1/3 = 5/6"])['status'] == 'done'
+    off = next_step_hint(equation, ["2x = 5x^2"])
+    assert off['status'] == 'off_track' and off['next'] is None
+    assert "dropped the denominator" in next_step_hint(equation, ["x = -6"])['hint']
+    # A zero-product branch is on track, even straight from the equation
+    branch = next_step_hint("x + 6/x = 5", ["(x-2)(x-3) = 0", "x - 2 = 0"])
+    assert branch['status'] == 'on_track' and branch['next']['id'] == 'roots'
+    assert next_step_hint("x + 6/x = 5", ["x - 3 = 0"])['status'] == 'on_track'
+    assert next_step_hint("x + 6/x = 5", ["x - 4 = 0"])['status'] == 'off_track'
+
+    # No-solution equations: the hints say so instead of "set each factor to zero"
+    no_solution = "(2*x+1)/(x**2-9) + 3/(x+3) = 5/(x-3)"
+    assert 'factored' not in [node.id for node in get_reference(no_solution).step_graph]
+    hint = next_step_hint(no_solution, ["2x + 1 + 3(x - 3) = 5(x + 3)"])
+    assert hint['status'] == 'on_track' and hint['next']['id'] == 'roots'
+    assert "no solution" in hint['hint'] and "factor" not in hint['hint']
+    assert next_step_hint(no_solution, ["x - 3 = 0"])['status'] == 'off_track'
+    excluded = get_reference("x/(x-1) = 1/(x-1)").step_graph
+    assert "no solution" in [node for node in excluded if node.id == 'roots'][0].instruction
+
+    # Polynomial equations skip the fraction steps; excluded roots are called out
+    assert [n.id for n in get_reference("x**2-5*x+6=0").step_graph][:2] == ['equation', 'cleared_polynomial']
+    rejected = next_step_hint("x/(x-1) = 1/(x-1) + 2", ["x = 1"])
+    assert rejected['next']['id'] == 'verified_roots' and "reject" in rejected['hint']
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import drawing_solver_api
+    client = drawing_solver_api.app.test_client()
+    resp = client.post("/api/grade/hint", json={"equation": equation, "line": "5x^2 - 7x - 6 = 0"})
+    assert resp.status_code == 200 and resp.get_json()['next']['id'] == 'factored'
+    assert client.post("/api/grade/hint", json={"lines": []}).status_code == 400
+    session_id = client.post("/api/grade/sessions", json={"equation": equation}).get_json()["session_id"]
+    client.post(f"/api/grade/sessions/{session_id}/lines", json={"line": "x = 2"})
+    assert client.get(f"/api/grade/sessions/{session_id}/hint").get_json()['matched']['id'] == 'roots'
+    print(f"✅ Next-step hints in {hint['ms']} ms")
+
+
+def test_grading_benchmark_reports_latency_and_agreement():
+    """bench_grading grades the labelled corpus in-process and reports agreement per category"""
+    import json
+    import tempfile
+    import bench_grading
+
+    corpus = bench_grading.build_corpus(noisy_copies=1, seed=0)
+    assert {entry["category"] for entry in corpus} == set(bench_grading.CATEGORIES)
+    assert len(corpus) == len(bench_grading.BASE_SOLUTIONS) * len(bench_grading.CATEGORIES)
+
+    report = bench_grading.run_benchmark(corpus, repeat=2)
+    assert report["graded"] == 2 * len(corpus) and not report["errors"]
+    assert set(report["latency_ms"]) == {"p50", "p90", "p95", "p99"}
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"] <= report["max_ms"]
+    for category in ("correct", "wrong_answer", "missing_restrictions"):
+        assert report["categories"][category]["agreement"] == 1.0, category
+    assert 0 < report["agreement"] <= 1
+    assert all(miss["disagreements"] for miss in report["disagreements"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in corpus[:3]:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        assert bench_grading.load_corpus(path) == corpus[:3]
+    print(f"✅ Grading benchmark: {report['agreement']:.0%} agreement, p50 {report['latency_ms']['p50']} ms")
+
+
+def test_worksheet_cli_grades_resumes_and_reports():
+    """grade_worksheets grades text and OCRed image submissions and resumes from its manifest"""
+    import csv
+    import json
+    import tempfile
+    import zipfile
+    from PIL import Image, ImageDraw
+    import lcd
+    import grade_worksheets
+
+    with tempfile.TemporaryDirectory() as directory:
+        section = os.path.join(directory, "section")
+        os.makedirs(os.path.join(section, "carol"))
+        os.makedirs(os.path.join(section, "dave"))
+        with open(os.path.join(section, "equation.txt"), "w", encoding="utf-8") as f:
+            f.write(EQUATION + "\n")
+        with open(os.path.join(section, "alice.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(FULL_SOLUTION))
+        with open(os.path.join(section, "bob.txt"), "w", encoding="utf-8") as f:
+            f.write("x+2 = 2\nx = 0\n")
+        for number, width in ((1, 3), (2, 9)):
+            img = Image.new("RGB", (400, 120), "white")
+            ImageDraw.Draw(img).rectangle([40 * number, 30, 40 * number + 200, 30 + 20 * number],
+                                          outline="black", width=width)
+            img.save(os.path.join(section, "carol", f"{number:02d}.png"))
+
+        replies = iter(["x+2=2x-2", "x=4"])
+        original_send = lcd.send_to_simpletex
+        lcd.send_to_simpletex = lambda image, token, **kw: next(replies)
+        lcd.ocr_cache.clear()
+        out = os.path.join(directory, "grades")
+        logged = []
+        try:
+            records, counts = grade_worksheets.grade_section(section, out, workers=0, log=logged.append)
+        finally:
+            lcd.send_to_simpletex = original_send
+            lcd.ocr_cache.clear()
+        assert counts == {'students': 4, 'skipped': 0, 'graded': 3, 'failed': 1}
+        by_id = {r['student_id']: r for r in records}
+        assert [r['student_id'] for r in records] == ["alice", "bob", "carol", "dave"]
+        assert by_id["alice"]['result']['correct'] and not by_id["bob"]['result']['correct']
+        assert by_id["carol"]['lines'] == ["x + 2 = 2*x - 2", "x = 4"] and by_id["carol"]['ocr_lines'] == 2
+        assert by_id["carol"]['result']['correct']
+        assert by_id["dave"]['status'] == 'failed'
+
+        summary = grade_worksheets.write_report(records, out)
+        with open(os.path.join(out, "grades.csv"), newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        assert [row['correct'] for row in rows] == ["True", "False", "True", ""]
+        assert rows[1]['likely_mistake'] == "dropped_denominator"
+        assert summary['correct'] == 2 and summary['failed'][0]['student_id'] == "dave"
+
+        # Interrupted mid-write, then rerun: only changed or failed students are redone
+        with open(os.path.join(out, grade_worksheets.MANIFEST_NAME), "a", encoding="utf-8") as f:
+            f.write('{"student_id": "trunc')
+        with open(os.path.join(section, "bob.txt"), "w", encoding="utf-8") as f:
+            f.write("x+2 = 2x-2\nx = 4\n")
+        records, counts = grade_worksheets.grade_section(section, out, workers=1, log=logged.append)
+        assert counts == {'students': 4, 'skipped': 2, 'graded': 1, 'failed': 1}
+        assert {r['student_id']: r['status'] for r in records}["bob"] == 'graded'
+        assert [r['result']['correct'] for r in records if r['status'] == 'graded'] == [True, True, True]
+
+        archive = os.path.join(directory, "section.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.write(os.path.join(section, "equation.txt"), "section/equation.txt")
+            zf.write(os.path.join(section, "alice.txt"), "section/alice.txt")
+        root = grade_worksheets.extract_archive(archive, os.path.join(directory, "unpacked"))
+        assert [s['student_id'] for s in grade_worksheets.discover_submissions(root)] == ["alice"]
+        with zipfile.ZipFile(os.path.join(directory, "evil.zip"), "w") as zf:
+            zf.writestr("../escape.txt", "x = 1")
+        try:
+            grade_worksheets.extract_archive(os.path.join(directory, "evil.zip"),
+                                             os.path.join(directory, "evil"))
+            assert False, "expected the escaping member to be refused"
+        except ValueError:
+            pass
+    print("✅ Worksheet CLI grades, resumes and writes its report")
+
+
+if __name__ == "__main__":
+    test_full_solution_meets_every_criterion()
+    test_missing_work_and_wrong_answer_flagged()
+    test_stated_final_answer_takes_precedence()
+    test_batch_keeps_order_and_aggregates()
+    test_grading_endpoints()
+    test_grading_input_never_reaches_eval()
+    test_reference_built_once_per_equation()
+    test_extraneous_roots_are_not_solutions()
+    test_line_features_single_pass()
+    test_verification_analysis_from_features()
+    test_step_equivalence_flags_first_broken_line()
+    test_zero_product_branches_follow_the_factored_step()
+    test_grading_session_is_incremental()
+    test_grading_session_store_ttl()
+    test_grading_session_endpoints()
+    test_mistake_catalogue_diagnoses_wrong_answers()
+    test_next_step_hints_follow_the_step_graph()
+    test_grading_benchmark_reports_latency_and_agreement()
+    test_worksheet_cli_grades_resumes_and_reports()
+    print("\n🎉 All solution grader tests passed!")
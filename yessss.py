@@ -1,7 +1,7 @@
 import sympy as sp
 import matplotlib.pyplot as plt
 import numpy as np
-from sympy import symbols, solve, factor, limit, degree, simplify, cancel, div, expand
+from sympy import symbols, solve, factor, degree, simplify, cancel, div, expand
 from sympy.parsing.sympy_parser import (
     parse_expr,
     standard_transformations,
@@ -9,11 +9,105 @@ from sympy.parsing.sympy_parser import (
     convert_xor,
 )
 import re
+import io
+import json
+import os
+import threading
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+
+
+class RealRoot:
+    """A real root of an irreducible factor of degree > 2.
+
+    Instead of radicals or an opaque CRootOf, the root is kept as an isolating
+    interval with exact rational endpoints, which can be narrowed on demand
+    with refine().  It prints as a decimal approximation and converts to an
+    exact CRootOf whenever SymPy needs it (e.g. in subs()).
+    """
+
+    def __init__(self, poly, index, interval):
+        self.poly = poly
+        self.index = index
+        self.interval = interval
+        self._approx = None
+
+    def refine(self, eps=sp.Rational(1, 10**6)):
+        """Narrow the isolating interval to width <= eps and return it"""
+        lower, upper = self.interval
+        if upper - lower > eps:
+            self.interval = self.poly.refine_root(lower, upper, eps=eps)
+        return self.interval
+
+    def __float__(self):
+        if self._approx is None:
+            lower, upper = self.refine()
+            self._approx = float((lower + upper) / 2)
+        return self._approx
+
+    def _sympy_(self):
+        return sp.CRootOf(self.poly, self.index)
+
+    def __eq__(self, other):
+        if isinstance(other, RealRoot):
+            return self.poly == other.poly and self.index == other.index
+        # An irreducible factor of degree > 2 has no rational roots
+        return False
+
+    def __hash__(self):
+        return hash((self.poly, self.index))
+
+    def __lt__(self, other):
+        return float(self) < float(other)
+
+    def __str__(self):
+        return f"≈{float(self):.4f}"
+
+    __repr__ = __str__
 
 
 class RationalFunctionCalculator:
-    def __init__(self):
+    # Fields that analyze_fields() can compute, mapped to the fields they need.
+    # A request only pays for the closure of what it asks for, e.g. 'domain'
+    # needs the denominator roots but never factors the numerator.
+    FIELD_DEPENDENCIES = {
+        'numerator': [],
+        'denominator': [],
+        'factored_numerator': ['numerator'],
+        'factored_denominator': ['denominator'],
+        'numerator_multiplicities': ['numerator'],
+        'denominator_multiplicities': ['denominator'],
+        'numerator_roots': ['numerator_multiplicities'],
+        'denominator_roots': ['denominator_multiplicities'],
+        'common_factors': ['numerator_multiplicities', 'denominator_multiplicities'],
+        'simplified_numerator': ['common_factors'],
+        'simplified_denominator': ['common_factors'],
+        'domain_restrictions': ['denominator_roots'],
+        'domain': ['domain_restrictions'],
+        'zeros': ['simplified_numerator', 'common_factors'],
+        'x_intercepts': ['zeros'],
+        'y_intercept': ['simplified_numerator', 'simplified_denominator', 'domain_restrictions'],
+        'vertical_asymptotes': ['denominator_roots', 'common_factors'],
+        'horizontal_asymptote': ['numerator', 'denominator'],
+        'oblique_asymptote': ['numerator', 'denominator'],
+        'holes': ['simplified_numerator', 'simplified_denominator', 'common_factors'],
+        'sign_chart': ['numerator_multiplicities', 'denominator_multiplicities'],
+        'pole_behavior': ['sign_chart'],
+        'end_behavior': ['sign_chart'],
+    }
+
+    # Everything the full text report prints
+    REPORT_FIELDS = [
+        'factored_numerator', 'factored_denominator', 'domain', 'zeros', 'x_intercepts',
+        'y_intercept', 'vertical_asymptotes', 'horizontal_asymptote', 'oblique_asymptote',
+        'holes', 'sign_chart', 'pole_behavior', 'end_behavior',
+    ]
+
+    def __init__(self, show_plots=True):
         self.x = symbols('x')
+        # Headless callers (batch workers) skip the matplotlib figure
+        self.show_plots = show_plots
 
     def parse_function(self, func_str):
         """Parse the rational function string and return numerator and denominator"""
@@ -23,6 +117,8 @@ class RationalFunctionCalculator:
         s = re.sub(r'(?i)\bf\s*\(\s*x\s*\)\s*=\s*', '', s)
         s = s.replace('−', '-').replace('–', '-').replace('—', '-')
         s = s.replace('÷', '/').replace('·', '*')
+        # Spacing carries no meaning ("(x - 2) (x + 2)" == "(x-2)(x+2)")
+        s = re.sub(r'\s+', '', s)
 
         # Convert ^ to ** for exponents, but handle negative exponents properly
         s = re.sub(r'\^(\d+)', r'**\1', s)
@@ -47,14 +143,23 @@ class RationalFunctionCalculator:
         num_str = num_str.strip()
         den_str = den_str.strip()
 
-        # Remove balanced outer parentheses if they exist
-        if (num_str.startswith('(') and num_str.endswith(')') and
-                num_str.count('(') == num_str.count(')')):
-            num_str = num_str[1:-1]
+        # Remove outer parentheses only when they enclose the whole part,
+        # so "(x-2)(x+2)" is left alone
+        def strip_outer_parens(expr: str) -> str:
+            if not (expr.startswith('(') and expr.endswith(')')):
+                return expr
+            depth = 0
+            for i, ch in enumerate(expr):
+                if ch == '(':
+                    depth += 1
+                elif ch == ')':
+                    depth -= 1
+                    if depth == 0 and i < len(expr) - 1:
+                        return expr
+            return expr[1:-1]
 
-        if (den_str.startswith('(') and den_str.endswith(')') and
-                den_str.count('(') == den_str.count(')')):
-            den_str = den_str[1:-1]
+        num_str = strip_outer_parens(num_str)
+        den_str = strip_outer_parens(den_str)
 
         # Add explicit multiplication where needed
         def add_explicit_mult(text: str) -> str:
@@ -90,41 +195,180 @@ class RationalFunctionCalculator:
         except:
             return poly
 
-    def find_common_factors(self, num, den):
-        """Find common factors between numerator and denominator"""
-        num_factors = factor(num)
-        den_factors = factor(den)
+    def find_common_factors(self, num, den, num_mult=None, den_mult=None):
+        """Find common factors between numerator and denominator
+
+        A shared root r with multiplicity a in the numerator and b in the
+        denominator cancels min(a, b) times.  It is a hole (returned in
+        ``common``) only when a >= b; otherwise the leftover factor of order
+        b - a is still a vertical asymptote.  A zero numerator makes every
+        denominator root a hole.  (root, multiplicity) lists already computed
+        by the caller can be passed in to avoid factoring either polynomial a
+        second time.
+        """
+        if num_mult is None:
+            num_mult = self.real_root_multiplicities(num)
+        if den_mult is None:
+            den_mult = self.real_root_multiplicities(den)
+
+        if expand(num) == 0:
+            return [root for root, _ in den_mult], sp.Integer(0), sp.Integer(1)
 
-        # Extract factors (this is a simplified approach)
         common = []
         simplified_num = num
         simplified_den = den
+        den_orders = dict(den_mult)
 
-        # Check for common linear factors
-        num_roots = solve(num, self.x)
-        den_roots = solve(den, self.x)
-
-        for root in num_roots:
-            if root in den_roots:
+        cancelled_polys = set()
+        for root, num_order in num_mult:
+            den_order = den_orders.get(root, 0)
+            if not den_order:
+                continue
+            if num_order >= den_order:
                 common.append(root)
-                # Cancel the common factor
-                simplified_num = cancel(simplified_num / (self.x - root))
-                simplified_den = cancel(simplified_den / (self.x - root))
+            # Cancel the common factor; an isolated root cancels its whole
+            # irreducible factor, once
+            if isinstance(root, RealRoot):
+                if root.poly in cancelled_polys:
+                    continue
+                cancelled_polys.add(root.poly)
+                factor_expr = root.poly.as_expr()
+            else:
+                factor_expr = self.x - root
+            factor_expr = factor_expr ** min(num_order, den_order)
+            simplified_num = cancel(simplified_num / factor_expr)
+            simplified_den = cancel(simplified_den / factor_expr)
 
         return common, simplified_num, simplified_den
 
+    def find_real_roots(self, poly):
+        """Real roots of a polynomial, in increasing order
+
+        Factors of degree <= 2 are solved exactly.  Higher-degree irreducible
+        factors are handled by real-root isolation (RealRoot), which stays
+        fast for any degree and never produces complex roots.
+        """
+        return [root for root, _ in self.real_root_multiplicities(poly)]
+
+    def real_root_multiplicities(self, poly):
+        """(root, multiplicity) pairs for the real roots of a polynomial, sorted"""
+        multiplicities = []
+        if expand(poly) == 0:
+            return multiplicities
+        _, factors = sp.factor_list(poly, self.x)
+        for factor_expr, multiplicity in factors:
+            factor_poly = sp.Poly(factor_expr, self.x)
+            if factor_poly.degree() <= 0:
+                continue
+            if factor_poly.degree() <= 2:
+                roots = [r for r in solve(factor_expr, self.x) if r.is_real]
+            else:
+                roots = [RealRoot(factor_poly, index, interval)
+                         for index, (interval, _) in enumerate(factor_poly.intervals())]
+            for root in roots:
+                # Distinct irreducible factors never share a root, but the same
+                # linear factor can appear once per input factor before expansion
+                for i, (seen, count) in enumerate(multiplicities):
+                    if seen == root:
+                        multiplicities[i] = (seen, count + multiplicity)
+                        break
+                else:
+                    multiplicities.append((root, multiplicity))
+        return sorted(multiplicities, key=lambda pair: float(pair[0]))
+
+    @staticmethod
+    def _simple_rational_between(a, b):
+        """Smallest-denominator dyadic rational strictly between a and b"""
+        d = 1
+        while True:
+            k = int(np.floor(a * d)) + 1
+            if k / d < b:
+                return sp.Rational(k, d)
+            d *= 2
+
+    def sign_analysis(self, numerator, denominator, num_mult=None, den_mult=None):
+        """Sign chart plus one-sided pole and end behaviour, without limits.
+
+        The real zeros and poles (with multiplicities) split the line into
+        intervals; f is evaluated exactly at one rational sample point per
+        interval.  At a pole the approach to ±∞ on each side is the sign of the
+        neighbouring interval, and the sign changes across it exactly when the
+        net multiplicity (denominator minus numerator) is odd.
+
+        A zero numerator makes f identically 0 on its domain: every interval
+        has sign '0' and there are no poles.
+
+        Returns (sign_chart, pole_behavior, end_behavior) as plain dicts.
+        """
+        num_mult = dict(self.real_root_multiplicities(numerator) if num_mult is None else num_mult)
+        den_mult = dict(self.real_root_multiplicities(denominator) if den_mult is None else den_mult)
+        points = sorted(set(num_mult) | set(den_mult), key=float)
+
+        num_poly = sp.Poly(numerator, self.x)
+        den_poly = sp.Poly(denominator, self.x)
+
+        def sign_at(sample):
+            value = num_poly.eval(sample) / den_poly.eval(sample)
+            return '+' if value > 0 else '-' if value < 0 else '0'
+
+        positions = [float(p) for p in points]
+        if positions:
+            samples = [sp.Integer(int(np.floor(positions[0])) - 1)]
+            samples += [self._simple_rational_between(a, b) for a, b in zip(positions, positions[1:])]
+            samples.append(sp.Integer(int(np.ceil(positions[-1])) + 1))
+        else:
+            samples = [sp.Integer(0)]
+        bounds = ['-∞'] + points + ['∞']
+
+        sign_chart = []
+        for i, sample in enumerate(samples):
+            sign_chart.append({
+                'interval': (bounds[i], bounds[i + 1]),
+                'sample': sample,
+                'sign': sign_at(sample),
+            })
+
+        if num_poly.is_zero:
+            return sign_chart, [], {'left': 'y = 0', 'right': 'y = 0'}
+
+        pole_behavior = []
+        for i, point in enumerate(points):
+            multiplicity = den_mult.get(point, 0) - num_mult.get(point, 0)
+            if multiplicity <= 0:
+                continue  # zero of f, or a hole
+            pole_behavior.append({
+                'x': point,
+                'multiplicity': multiplicity,
+                'left': sign_chart[i]['sign'] + '∞',
+                'right': sign_chart[i + 1]['sign'] + '∞',
+                'sign_change': multiplicity % 2 == 1,
+            })
+
+        n, m = num_poly.degree(), den_poly.degree()
+        left_sign, right_sign = sign_chart[0]['sign'], sign_chart[-1]['sign']
+        if n > m:
+            end_behavior = {'left': left_sign + '∞', 'right': right_sign + '∞'}
+        elif n == m:
+            ratio = num_poly.LC() / den_poly.LC()
+            end_behavior = {'left': f"y → {ratio}", 'right': f"y → {ratio}"}
+        else:
+            end_behavior = {
+                'left': 'y → 0 from ' + ('above' if left_sign == '+' else 'below'),
+                'right': 'y → 0 from ' + ('above' if right_sign == '+' else 'below'),
+            }
+        return sign_chart, pole_behavior, end_behavior
+
     def find_domain(self, denominator):
         """Find domain restrictions by solving denominator = 0"""
         try:
-            roots = solve(denominator, self.x)
-            return roots
+            return self.find_real_roots(denominator)
         except:
             return []
 
     def find_zeros(self, numerator, cancelled_roots):
         """Find zeros of the function (roots of numerator after cancellations)"""
         try:
-            roots = solve(numerator, self.x)
+            roots = self.find_real_roots(numerator)
             # Remove cancelled roots (these become holes, not zeros)
             valid_roots = [r for r in roots if r not in cancelled_roots]
             return valid_roots
@@ -150,7 +394,7 @@ class RationalFunctionCalculator:
     def find_vertical_asymptotes(self, denominator, cancelled_roots):
         """Find vertical asymptotes from uncancelled roots of denominator"""
         try:
-            roots = solve(denominator, self.x)
+            roots = self.find_real_roots(denominator)
             # Only roots that weren't cancelled become asymptotes
             asymptotes = [r for r in roots if r not in cancelled_roots]
             return asymptotes
@@ -197,97 +441,220 @@ class RationalFunctionCalculator:
             try:
                 # Use simplified function to find y-value
                 y_val = simplified_func.subs(self.x, root)
+                if isinstance(root, RealRoot):
+                    # Exact value would be in terms of CRootOf; show a decimal
+                    y_val = sp.N(y_val, 6)
                 holes.append((root, y_val))
             except:
                 pass
         return holes
 
-    def analyze_rational_function(self, func_str):
-        """Complete analysis of a rational function"""
-        print("=" * 60)
-        print("RATIONAL FUNCTION CALCULATOR")
-        print("=" * 60)
+    def resolve_fields(self, fields):
+        """Return the requested fields plus their dependencies, dependencies first"""
+        ordered = []
+
+        def visit(field):
+            if field in ordered:
+                return
+            for dep in self.FIELD_DEPENDENCIES[field]:
+                visit(dep)
+            ordered.append(field)
+
+        for field in fields:
+            visit(field)
+        return ordered
+
+    def analyze_fields(self, func_str, fields, values=None):
+        """Compute only the requested analysis fields and what they depend on.
+
+        Returns a dict of SymPy values keyed by field name.  The function is
+        parsed once and every intermediate result (roots, factorizations,
+        cancellations) is shared between the fields that need it.  Passing a
+        ``values`` dict from an earlier call for the same function reuses
+        whatever it already holds.
+        """
+        unknown = [f for f in fields if f not in self.FIELD_DEPENDENCIES]
+        if unknown:
+            raise ValueError(f"Unknown analysis field(s): {', '.join(unknown)}")
+
+        values = {} if values is None else values
+        if 'numerator' not in values or 'denominator' not in values:
+            values['numerator'], values['denominator'] = self.parse_function(func_str)
+
+        for field in self.resolve_fields(fields):
+            if field not in values:
+                self._compute_field(field, values)
+        return values
+
+    def _compute_field(self, field, values):
+        if field == 'factored_numerator':
+            values[field] = self.factor_polynomial(values['numerator'])
+        elif field == 'factored_denominator':
+            values[field] = self.factor_polynomial(values['denominator'])
+        elif field == 'numerator_multiplicities':
+            values[field] = self.real_root_multiplicities(values['numerator'])
+        elif field == 'denominator_multiplicities':
+            values[field] = self.real_root_multiplicities(values['denominator'])
+        elif field == 'numerator_roots':
+            values[field] = [root for root, _ in values['numerator_multiplicities']]
+        elif field == 'denominator_roots':
+            values[field] = [root for root, _ in values['denominator_multiplicities']]
+        elif field in ('common_factors', 'simplified_numerator', 'simplified_denominator'):
+            common, simplified_num, simplified_den = self.find_common_factors(
+                values['numerator'], values['denominator'],
+                values['numerator_multiplicities'], values['denominator_multiplicities'])
+            values['common_factors'] = common
+            values['simplified_numerator'] = simplified_num
+            values['simplified_denominator'] = simplified_den
+        elif field == 'domain_restrictions':
+            values[field] = values['denominator_roots']
+        elif field == 'domain':
+            restrictions = values['domain_restrictions']
+            if restrictions:
+                values[field] = "(-∞, ∞) excluding " + ", ".join([str(r) for r in restrictions])
+            else:
+                values[field] = "(-∞, ∞)"
+        elif field == 'zeros':
+            values[field] = self.find_zeros(values['simplified_numerator'], values['common_factors'])
+        elif field == 'x_intercepts':
+            values[field] = [(z, 0) for z in values['zeros']]
+        elif field == 'y_intercept':
+            _, values[field] = self.find_intercepts(
+                values['simplified_numerator'] / values['simplified_denominator'],
+                [], values['domain_restrictions'])
+        elif field == 'vertical_asymptotes':
+            values[field] = [r for r in values['denominator_roots'] if r not in values['common_factors']]
+        elif field == 'horizontal_asymptote':
+            values[field] = self.find_horizontal_asymptote(values['numerator'], values['denominator'])
+        elif field == 'oblique_asymptote':
+            values[field] = self.find_oblique_asymptote(values['numerator'], values['denominator'])
+        elif field in ('sign_chart', 'pole_behavior', 'end_behavior'):
+            sign_chart, pole_behavior, end_behavior = self.sign_analysis(
+                values['numerator'], values['denominator'],
+                values['numerator_multiplicities'], values['denominator_multiplicities'])
+            values['sign_chart'] = sign_chart
+            values['pole_behavior'] = pole_behavior
+            values['end_behavior'] = end_behavior
+        elif field == 'holes':
+            values[field] = self.find_holes(
+                values['common_factors'],
+                values['simplified_numerator'] / values['simplified_denominator'])
+
+    @staticmethod
+    def serialize_fields(values, fields):
+        """Convert analyze_fields() output for ``fields`` into JSON-friendly values"""
+        def serialize(value):
+            if value is None or isinstance(value, (str, bool)):
+                return value
+            if isinstance(value, (list, tuple)):
+                return [serialize(v) for v in value]
+            if isinstance(value, dict):
+                return {k: serialize(v) for k, v in value.items()}
+            return str(value)
+
+        return {field: serialize(values[field]) for field in fields}
+
+    def analyze_rational_function(self, func_str, values=None, out=None):
+        """Complete analysis of a rational function
+
+        The report is printed from analyze_fields() results, so a ``values``
+        dict already holding some fields (e.g. a RationalAnalysisCache entry)
+        is reused and comes back holding every field the report needed.
+        It is written to ``out`` (default sys.stdout), so callers can capture
+        it without swapping sys.stdout for the whole process.
+        """
+        emit = functools.partial(print, file=out)
+        emit("=" * 60)
+        emit("RATIONAL FUNCTION CALCULATOR")
+        emit("=" * 60)
 
         try:
             # 1) Parse and clean function
-            print("\n1) CLEANED FUNCTION")
-            print("-" * 30)
-            numerator, denominator = self.parse_function(func_str)
-            print(f"Original: f(x) = {numerator}/{denominator}")
+            emit("\n1) CLEANED FUNCTION")
+            emit("-" * 30)
+            values = self.analyze_fields(func_str, self.REPORT_FIELDS, values)
+            numerator, denominator = values['numerator'], values['denominator']
+            emit(f"Original: f(x) = {numerator}/{denominator}")
 
             # Factor both
-            factored_num = self.factor_polynomial(numerator)
-            factored_den = self.factor_polynomial(denominator)
-            print(f"Factored: f(x) = {factored_num}/{factored_den}")
+            factored_num = values['factored_numerator']
+            factored_den = values['factored_denominator']
+            emit(f"Factored: f(x) = {factored_num}/{factored_den}")
 
             # Also show the factored denominator separately for clarity
             if factored_den != denominator:
-                print(f"  Denominator factors: {denominator} = {factored_den}")
+                emit(f"  Denominator factors: {denominator} = {factored_den}")
 
             # Find common factors
-            common_factors, simplified_num, simplified_den = self.find_common_factors(numerator, denominator)
+            common_factors = values['common_factors']
+            simplified_num, simplified_den = values['simplified_numerator'], values['simplified_denominator']
             if common_factors:
-                print(f"Simplified: f(x) = {simplified_num}/{simplified_den}")
-                print(f"Common factors cancelled: {common_factors}")
+                emit(f"Simplified: f(x) = {simplified_num}/{simplified_den}")
+                emit(f"Common factors cancelled: {common_factors}")
+            elif (simplified_num, simplified_den) != (numerator, denominator):
+                # Part of a repeated factor cancelled; what is left is still a VA
+                emit(f"Simplified: f(x) = {simplified_num}/{simplified_den}")
+                emit("Common factors cancelled, but the denominator keeps a power of each")
             else:
-                print("No common factors to cancel")
+                emit("No common factors to cancel")
 
             # 2) Domain & Restrictions
-            print("\n2) DOMAIN & DOMAIN RESTRICTIONS")
-            print("-" * 40)
-            domain_restrictions = self.find_domain(denominator)
-            print("Steps:")
-            print(f"  • Solve {denominator} = 0")
+            emit("\n2) DOMAIN & DOMAIN RESTRICTIONS")
+            emit("-" * 40)
+            domain_restrictions = values['domain_restrictions']
+            emit("Steps:")
+            emit(f"  • Solve {denominator} = 0")
             if factored_den != denominator:
-                print(f"  • Factored: {factored_den} = 0")
+                emit(f"  • Factored: {factored_den} = 0")
             if domain_restrictions:
-                print(f"  • Excluded x-values: {domain_restrictions}")
-                domain_str = "(-∞, ∞) excluding " + ", ".join([str(r) for r in domain_restrictions])
+                emit(f"  • Excluded x-values: {domain_restrictions}")
             else:
-                print("  • No excluded values")
-                domain_str = "(-∞, ∞)"
-            print(f"  • Domain: {domain_str}")
-            print("Explain: We exclude values that make the denominator zero.")
+                emit("  • No excluded values")
+            domain_str = values['domain']
+            emit(f"  • Domain: {domain_str}")
+            emit("Explain: We exclude values that make the denominator zero.")
 
             # 3) Zeros
-            print("\n3) ZEROS (ROOTS OF f)")
-            print("-" * 30)
-            zeros = self.find_zeros(simplified_num, common_factors)
-            print("Steps:")
-            print(f"  • Solve {simplified_num} = 0 (after cancellations)")
+            emit("\n3) ZEROS (ROOTS OF f)")
+            emit("-" * 30)
+            zeros = values['zeros']
+            emit("Steps:")
+            emit(f"  • Solve {simplified_num} = 0 (after cancellations)")
             if zeros:
-                print("  • Solving step by step:")
+                emit("  • Solving step by step:")
                 # Show the factored form and solve each factor
                 try:
                     factored_num = sp.factor(simplified_num)
                     if factored_num != simplified_num:
-                        print(f"    {simplified_num} = {factored_num}")
+                        emit(f"    {simplified_num} = {factored_num}")
                         # Extract factors and show solving steps
                         factors = sp.factor_list(simplified_num, self.x)[1]
                         for factor_expr, multiplicity in factors:
                             if multiplicity > 0:
-                                sol = sp.solve(factor_expr, self.x)[0]
-                                print(f"    {factor_expr} = 0 → x = {sol}")
+                                sols = self.find_real_roots(factor_expr)
+                                if sols:
+                                    emit(f"    {factor_expr} = 0 → x = {', '.join(str(r) for r in sols)}")
+                                else:
+                                    emit(f"    {factor_expr} = 0 → no real solution")
                     else:
                         # If it can't be factored, show the solving directly
-                        print(f"    {simplified_num} = 0 → x = {zeros[0] if zeros else 'no solution'}")
+                        emit(f"    {simplified_num} = 0 → x = {zeros[0] if zeros else 'no solution'}")
                 except:
                     # Fallback if factoring doesn't work
-                    print(f"    {simplified_num} = 0 → x = {zeros[0] if zeros else 'no solution'}")
-                print(f"  • Zeros: {zeros}")
-                print("Explain: Zeros come from the numerator, unless cancelled by the denominator.")
+                    emit(f"    {simplified_num} = 0 → x = {zeros[0] if zeros else 'no solution'}")
+                emit(f"  • Zeros: {zeros}")
+                emit("Explain: Zeros come from the numerator, unless cancelled by the denominator.")
             else:
-                print("  • No zeros found")
+                emit("  • No zeros found")
 
             # 4) Intercepts
-            print("\n4) INTERCEPTS")
-            print("-" * 20)
-            x_intercepts, y_intercept = self.find_intercepts(simplified_num / simplified_den, zeros,
-                                                             domain_restrictions)
+            emit("\n4) INTERCEPTS")
+            emit("-" * 20)
+            x_intercepts, y_intercept = values['x_intercepts'], values['y_intercept']
 
-            print("X-intercepts:")
+            emit("X-intercepts:")
             if x_intercepts:
-                print("  • f(x) = 0, y = 0")
+                emit("  • f(x) = 0, y = 0")
                 for x_int in x_intercepts:
                     x_val = x_int[0]
                     # Show the complete solving step
@@ -297,164 +664,181 @@ class RationalFunctionCalculator:
                             factors = sp.factor_list(simplified_num, self.x)[1]
                             for factor_expr, multiplicity in factors:
                                 if multiplicity > 0:
-                                    sol = sp.solve(factor_expr, self.x)[0]
-                                    if sol == x_val:
-                                        print(f"    → {factor_expr} = 0 → x = {x_val}")
-                                        print(f"    → ({x_val}, 0)")
+                                    if x_val in self.find_real_roots(factor_expr):
+                                        emit(f"    → {factor_expr} = 0 → x = {x_val}")
+                                        emit(f"    → ({x_val}, 0)")
                                         break
                     except:
                         # If factoring doesn't work, show the direct solving
-                        print(f"    → {simplified_num} = 0 → x = {x_val}")
-                        print(f"    → ({x_val}, 0)")
+                        emit(f"    → {simplified_num} = 0 → x = {x_val}")
+                        emit(f"    → ({x_val}, 0)")
             else:
-                print("  • None")
+                emit("  • None")
 
-            print("Y-intercept:")
+            emit("Y-intercept:")
             if y_intercept:
-                print("  • f(0) = substitute x = 0")
+                emit("  • f(0) = substitute x = 0")
                 try:
                     # Show the complete substitution step by step
-                    print(f"    f(0) = {simplified_num}/{simplified_den}")
-                    print(f"    f(0) = {simplified_num.subs(self.x, 0)}/{simplified_den.subs(self.x, 0)}")
+                    emit(f"    f(0) = {simplified_num}/{simplified_den}")
+                    emit(f"    f(0) = {simplified_num.subs(self.x, 0)}/{simplified_den.subs(self.x, 0)}")
                     
                     # Show the calculation step by step
                     num_val = simplified_num.subs(self.x, 0)
                     den_val = simplified_den.subs(self.x, 0)
                     if den_val != 0:
                         result = num_val / den_val
-                        print(f"    f(0) = {num_val}/{den_val} = {result}")
-                        print(f"    → (0, {result})")
+                        emit(f"    f(0) = {num_val}/{den_val} = {result}")
+                        emit(f"    → (0, {result})")
                     else:
-                        print(f"    → Undefined (denominator = 0)")
+                        emit(f"    → Undefined (denominator = 0)")
                 except Exception as e:
-                    print(f"    → Error calculating y-intercept: {e}")
+                    emit(f"    → Error calculating y-intercept: {e}")
             else:
-                print("  • None (x=0 is excluded from domain)")
+                emit("  • None (x=0 is excluded from domain)")
 
             # 5) Vertical Asymptotes
-            print("\n5) VERTICAL ASYMPTOTES")
-            print("-" * 30)
-            v_asymptotes = self.find_vertical_asymptotes(denominator, common_factors)
-            print("Rule: Uncancelled real roots of q(x) produce VAs.")
-            print("Steps:")
-            print(f"  • Solve {denominator} = 0")
+            emit("\n5) VERTICAL ASYMPTOTES")
+            emit("-" * 30)
+            v_asymptotes = values['vertical_asymptotes']
+            sign_chart, end_behavior = values['sign_chart'], values['end_behavior']
+            # One-sided behaviour for exactly the asymptotes listed above
+            poles = {pole['x']: pole for pole in values['pole_behavior']}
+            pole_behavior = [poles[va] for va in v_asymptotes if va in poles]
+            emit("Rule: Uncancelled real roots of q(x) produce VAs.")
+            emit("Steps:")
+            emit(f"  • Solve {denominator} = 0")
             if factored_den != denominator:
-                print(f"  • Factored: {factored_den} = 0")
-            print(f"  • Check for cancellations: {common_factors}")
+                emit(f"  • Factored: {factored_den} = 0")
+            emit(f"  • Check for cancellations: {common_factors}")
             if v_asymptotes:
                 for va in v_asymptotes:
-                    print(f"  • VA: x = {va}")
-                    print(f"    lim(x→{va}±) f(x) = ±∞")
+                    emit(f"  • VA: x = {va}")
+                    if va in poles:
+                        emit(f"    lim(x→{va}⁻) f(x) = {poles[va]['left']}, "
+                              f"lim(x→{va}⁺) f(x) = {poles[va]['right']}")
             else:
-                print("  • No vertical asymptotes")
+                emit("  • No vertical asymptotes")
 
             # 6) Horizontal/Oblique Asymptotes
-            print("\n6) HORIZONTAL / OBLIQUE ASYMPTOTES")
-            print("-" * 40)
+            emit("\n6) HORIZONTAL / OBLIQUE ASYMPTOTES")
+            emit("-" * 40)
             n = degree(numerator, self.x)
             m = degree(denominator, self.x)
-            print(f"Degrees: n = {n} (numerator), m = {m} (denominator)")
+            emit(f"Degrees: n = {n} (numerator), m = {m} (denominator)")
 
             # Explain the rules clearly with mathematical notation
-            print("Rules for horizontal asymptotes:")
-            print("• If degree numerator < degree denominator → y = 0")
-            print("• If degree numerator = degree denominator → y = a/b (ratio of leading coefficients)")
-            print(
+            emit("Rules for horizontal asymptotes:")
+            emit("• If degree numerator < degree denominator → y = 0")
+            emit("• If degree numerator = degree denominator → y = a/b (ratio of leading coefficients)")
+            emit(
                 "• If degree numerator > degree denominator → no horizontal asymptote (instead: maybe oblique or higher polynomial asymptote)")
 
             # Apply the specific rule for this function
-            print(f"\nFor this function:")
+            emit(f"\nFor this function:")
             if n < m:
-                print(f"  Since degree numerator ({n}) < degree denominator ({m}) → y = 0")
+                emit(f"  Since degree numerator ({n}) < degree denominator ({m}) → y = 0")
             elif n == m:
-                print(f"  Since degree numerator ({n}) = degree denominator ({m}) → y = a/b")
+                emit(f"  Since degree numerator ({n}) = degree denominator ({m}) → y = a/b")
             else:
-                print(f"  Since degree numerator ({n}) > degree denominator ({m}) → no horizontal asymptote")
+                emit(f"  Since degree numerator ({n}) > degree denominator ({m}) → no horizontal asymptote")
 
-            ha = self.find_horizontal_asymptote(numerator, denominator)
+            ha = values['horizontal_asymptote']
             if ha:
-                print(f"Horizontal asymptote: {ha}")
+                emit(f"Horizontal asymptote: {ha}")
 
-            oa = self.find_oblique_asymptote(numerator, denominator)
+            oa = values['oblique_asymptote']
             if oa:
-                print(f"Oblique asymptote: {oa}")
-                print("Long division work:")
+                emit(f"Oblique asymptote: {oa}")
+                emit("Long division work:")
                 try:
                     quotient, remainder = div(numerator, denominator)
-                    print(f"  {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
-                    print(f"  So the slant asymptote is: y = {quotient}")
+                    emit(f"  {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
+                    emit(f"  So the slant asymptote is: y = {quotient}")
                 except:
-                    print("  Division calculation shown above")
+                    emit("  Division calculation shown above")
             elif n > m:
-                print("Since numerator degree > denominator degree, check for oblique asymptote:")
+                emit("Since numerator degree > denominator degree, check for oblique asymptote:")
                 try:
                     quotient, remainder = div(numerator, denominator)
                     if degree(quotient, self.x) > 1:
-                        print(f"  Long division: {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
-                        print(
+                        emit(f"  Long division: {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
+                        emit(
                             f"  This gives a polynomial asymptote of degree {degree(quotient, self.x)}: y = {quotient}")
                     else:
-                        print(f"  Long division: {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
-                        print(f"  No linear oblique asymptote found")
+                        emit(f"  Long division: {numerator} ÷ {denominator} = {quotient} + {remainder}/{denominator}")
+                        emit(f"  No linear oblique asymptote found")
                 except:
-                    print("  Long division could not be performed")
+                    emit("  Long division could not be performed")
 
             if not ha and not oa:
-                print("No horizontal or oblique asymptote")
+                emit("No horizontal or oblique asymptote")
                 if n <= m:
-                    print("  This is expected since numerator degree ≤ denominator degree")
+                    emit("  This is expected since numerator degree ≤ denominator degree")
                 else:
-                    print("  Long division was performed but no linear asymptote found")
+                    emit("  Long division was performed but no linear asymptote found")
 
             # 7) Holes
-            print("\n7) HOLES (REMOVABLE DISCONTINUITIES)")
-            print("-" * 40)
-            holes = self.find_holes(common_factors, simplified_num / simplified_den)
-            print("Rule: Any common factor between p(x) and q(x) that was cancelled creates a hole.")
+            emit("\n7) HOLES (REMOVABLE DISCONTINUITIES)")
+            emit("-" * 40)
+            holes = values['holes']
+            emit("Rule: Any common factor between p(x) and q(x) that was cancelled creates a hole.")
             if holes:
                 for hole in holes:
                     x_val = hole[0]
-                    print(f"  • Hole at ({x_val}, {hole[1]})")
-                    print(f"    (from cancelled factor x - {x_val} = 0 → x = {x_val})")
+                    emit(f"  • Hole at ({x_val}, {hole[1]})")
+                    emit(f"    (from cancelled factor x - {x_val} = 0 → x = {x_val})")
             else:
-                print("  • No holes")
+                emit("  • No holes")
 
             # 8) End Behavior
-            print("\n8) END BEHAVIOR & LOCAL BEHAVIOR")
-            print("-" * 40)
-            if v_asymptotes:
-                for va in v_asymptotes:
-                    print(f"  • Near VA x = {va}: function approaches ±∞")
+            emit("\n8) END BEHAVIOR & LOCAL BEHAVIOR")
+            emit("-" * 40)
+            emit("Sign chart (one test value per interval):")
+            for entry in sign_chart:
+                left, right = entry['interval']
+                relation = {'+': "> 0", '-': "< 0"}.get(entry['sign'], "= 0")
+                emit(f"  • ({left}, {right}): test x = {entry['sample']} → f(x) {relation}")
+            for pole in pole_behavior:
+                change = "changes sign" if pole['sign_change'] else "keeps its sign"
+                emit(f"  • Near VA x = {pole['x']}: f(x) → {pole['left']} from the left, "
+                      f"{pole['right']} from the right")
+                emit(f"    (factor multiplicity {pole['multiplicity']}, so f {change} across it)")
+            emit(f"  • As x → -∞: {end_behavior['left']}; as x → ∞: {end_behavior['right']}")
             if ha:
-                print(f"  • End behavior: approaches {ha}")
+                emit(f"  • End behavior: approaches {ha}")
             elif oa:
-                print(f"  • End behavior: approaches {oa}")
+                emit(f"  • End behavior: approaches {oa}")
             else:
-                print(f"  • End behavior: dominated by highest degree terms")
+                emit(f"  • End behavior: dominated by highest degree terms")
 
             # 9) Graph
-            print("\n9) GRAPH")
-            print("-" * 10)
-            self.plot_function(numerator, denominator, simplified_num, simplified_den,
-                               zeros, y_intercept, v_asymptotes, ha, oa, holes, domain_restrictions)
+            emit("\n9) GRAPH")
+            emit("-" * 10)
+            if self.show_plots:
+                self.plot_function(numerator, denominator, simplified_num, simplified_den,
+                                   zeros, y_intercept, v_asymptotes, ha, oa, holes, domain_restrictions,
+                                   out=out)
+            else:
+                emit("Graph skipped")
 
             # 10) Final Checklist
-            print("\n10) FINAL CHECKLIST")
-            print("-" * 20)
-            print(f"✓ Domain: {domain_str}")
-            print(f"✓ Domain restrictions: {domain_restrictions if domain_restrictions else 'None'}")
-            print(f"✓ Zeros: {zeros if zeros else 'None'}")
-            print(f"✓ X-intercepts: {x_intercepts if x_intercepts else 'None'}")
-            print(f"✓ Y-intercept: {y_intercept if y_intercept else 'None'}")
-            print(f"✓ Vertical asymptotes: {v_asymptotes if v_asymptotes else 'None'}")
-            print(f"✓ Horizontal/Oblique asymptote: {ha if ha else oa if oa else 'None'}")
-            print(f"✓ Holes: {holes if holes else 'None'}")
+            emit("\n10) FINAL CHECKLIST")
+            emit("-" * 20)
+            emit(f"✓ Domain: {domain_str}")
+            emit(f"✓ Domain restrictions: {domain_restrictions if domain_restrictions else 'None'}")
+            emit(f"✓ Zeros: {zeros if zeros else 'None'}")
+            emit(f"✓ X-intercepts: {x_intercepts if x_intercepts else 'None'}")
+            emit(f"✓ Y-intercept: {y_intercept if y_intercept else 'None'}")
+            emit(f"✓ Vertical asymptotes: {v_asymptotes if v_asymptotes else 'None'}")
+            emit(f"✓ Horizontal/Oblique asymptote: {ha if ha else oa if oa else 'None'}")
+            emit(f"✓ Holes: {holes if holes else 'None'}")
 
         except Exception as e:
-            print(f"Error analyzing function: {e}")
+            emit(f"Error analyzing function: {e}")
 
     def plot_function(self, numerator, denominator, simplified_num, simplified_den,
-                      zeros, y_intercept, v_asymptotes, ha, oa, holes, domain_restrictions):
+                      zeros, y_intercept, v_asymptotes, ha, oa, holes, domain_restrictions, out=None):
         """Create a comprehensive plot of the rational function"""
         try:
             # Create the function for plotting
@@ -466,12 +850,15 @@ class RationalFunctionCalculator:
             # Create plot
             fig, ax = plt.subplots(figsize=(12, 8))
 
+            # Isolated roots (RealRoot) only have numeric positions
+            va_positions = [float(va) for va in v_asymptotes]
+
             # Determine x-range (avoid asymptotes)
             x_min, x_max = -10, 10
-            if v_asymptotes:
+            if va_positions:
                 # Adjust range to show asymptotes clearly
-                x_min = min(x_min, min(v_asymptotes) - 2)
-                x_max = max(x_max, max(v_asymptotes) + 2)
+                x_min = min(x_min, min(va_positions) - 2)
+                x_max = max(x_max, max(va_positions) + 2)
 
             # Generate x values, avoiding asymptotes
             x_vals = []
@@ -480,7 +867,7 @@ class RationalFunctionCalculator:
             for x in np.linspace(x_min, x_max, 1000):
                 # Skip values too close to asymptotes
                 skip = False
-                for va in v_asymptotes:
+                for va in va_positions:
                     if abs(x - va) < 0.1:
                         skip = True
                         break
@@ -498,8 +885,8 @@ class RationalFunctionCalculator:
             ax.plot(x_vals, y_vals, 'b-', linewidth=2, label='f(x)')
 
             # Plot asymptotes
-            for va in v_asymptotes:
-                ax.axvline(x=va, color='r', linestyle='--', alpha=0.7, label=f'VA: x={va}')
+            for va, va_pos in zip(v_asymptotes, va_positions):
+                ax.axvline(x=va_pos, color='r', linestyle='--', alpha=0.7, label=f'VA: x={va}')
 
             # Plot horizontal asymptote
             if ha and ha != "y = 0":
@@ -535,14 +922,14 @@ class RationalFunctionCalculator:
 
             # Plot intercepts
             for zero in zeros:
-                ax.plot(zero, 0, 'ko', markersize=8, label=f'x-int: ({zero}, 0)')
+                ax.plot(float(zero), 0, 'ko', markersize=8, label=f'x-int: ({zero}, 0)')
 
             if y_intercept:
                 ax.plot(0, y_intercept[1], 'ko', markersize=8, label=f'y-int: (0, {y_intercept[1]:.2f})')
 
             # Plot holes
             for hole in holes:
-                ax.plot(hole[0], hole[1], 'wo', markersize=8, markeredgecolor='red',
+                ax.plot(float(hole[0]), float(hole[1]), 'wo', markersize=8, markeredgecolor='red',
                         markeredgewidth=2, label=f'Hole: ({hole[0]}, {hole[1]:.2f})')
 
             # Customize plot
@@ -562,10 +949,309 @@ class RationalFunctionCalculator:
 
             plt.tight_layout()
             plt.show()
+            # Non-interactive backends return immediately; don't keep the figure alive
+            plt.close(fig)
 
         except Exception as e:
-            print(f"Error plotting function: {e}")
-            print("Graph could not be generated.")
+            print(f"Error plotting function: {e}", file=out)
+            print("Graph could not be generated.", file=out)
+
+
+class RationalAnalysisCache:
+    """Bounded LRU cache of rational function analysis results.
+
+    Entries are keyed on the expanded (numerator, denominator) pair returned
+    by parse_function, so spacing, X vs x, an "f(x) =" prefix and factored vs
+    expanded input all land on the same entry.  Common factors are not
+    cancelled in the key because they are what produce the holes.
+
+    Each entry is the ``values`` dict used by analyze_fields(), so fields are
+    still computed lazily: a later request for more fields extends the entry.
+    """
+
+    def __init__(self, maxsize=256, calculator=None):
+        self.maxsize = maxsize
+        self.calculator = calculator or RationalFunctionCalculator()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def canonical_key(self, func_str):
+        """Return (key, numerator, denominator) for a function string"""
+        numerator, denominator = self.calculator.parse_function(func_str)
+        numerator, denominator = expand(numerator), expand(denominator)
+        return (str(numerator), str(denominator)), numerator, denominator
+
+    def _entry(self, func_str, record=True):
+        key, numerator, denominator = self.canonical_key(func_str)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if record:
+                    self.hits += 1
+                return entry
+            if record:
+                self.misses += 1
+            entry = {'numerator': numerator, 'denominator': denominator}
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return entry
+
+    def analyze_fields(self, func_str, fields, record=True):
+        """Cached equivalent of RationalFunctionCalculator.analyze_fields()"""
+        entry = self._entry(func_str, record)
+        return self.calculator.analyze_fields(func_str, fields, values=entry)
+
+    def analysis_report(self, func_str, record=True):
+        """Cached text of analyze_rational_function() for the canonical function
+
+        The report is built from the entry's field values, so fields already
+        computed for the function are not worked out again, and fields
+        requested afterwards are already there.
+        """
+        try:
+            entry = self._entry(func_str, record)
+        except ValueError:
+            # Unparseable input is not cached; let the calculator report the error
+            entry = {}
+            target = func_str
+        else:
+            target = f"({entry['numerator']})/({entry['denominator']})"
+        if 'report' not in entry:
+            # Written into a private buffer: other threads' prints never end up in the cached text
+            output = io.StringIO()
+            self.calculator.analyze_rational_function(target, values=entry, out=output)
+            entry['report'] = output.getvalue()
+        return entry['report']
+
+    def warm(self, functions, fields=None):
+        """Pre-compute entries for known functions; returns how many were warmed
+
+        Warming does not count towards the hit rate.  Functions that fail to
+        parse are skipped.
+        """
+        fields = fields or list(RationalFunctionCalculator.FIELD_DEPENDENCIES)
+        warmed = 0
+        for func_str in functions:
+            try:
+                self.analyze_fields(func_str, fields, record=False)
+                warmed += 1
+            except ValueError:
+                continue
+        return warmed
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Functions the lessons and QuantumRationalSolver analyse over and over
+COMMON_FUNCTIONS = [
+    "(x^2-8x-20)/(x+3)",
+    "(x^2-4)/(x-2)",
+    "(x^3-1)/(x^2-1)",
+]
+
+analysis_cache = RationalAnalysisCache()
+
+# Fields reported by the FINAL CHECKLIST section of analyze_rational_function
+CHECKLIST_FIELDS = [
+    'domain',
+    'domain_restrictions',
+    'zeros',
+    'x_intercepts',
+    'y_intercept',
+    'vertical_asymptotes',
+    'horizontal_asymptote',
+    'oblique_asymptote',
+    'holes',
+]
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def _init_batch_worker():
+    analysis_cache.calculator.show_plots = False
+
+
+def get_batch_executor():
+    """Process pool shared by all batch requests, created on first use"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                  initializer=_init_batch_worker)
+        return _batch_executor
+
+
+def analyze_batch_item(func_str, compact=False):
+    """Analyse one batch item in a worker; returns a JSON-friendly dict"""
+    fields = CHECKLIST_FIELDS if compact else ['factored_numerator', 'factored_denominator'] + CHECKLIST_FIELDS
+    steps = None
+    if not compact:
+        # The report fills the cache entry the fields below are read from
+        report = analysis_cache.analysis_report(func_str)
+        steps = [line.strip() for line in report.split('\n')
+                 if line.strip() and not line.strip().startswith(('=', '-'))]
+    values = analysis_cache.analyze_fields(func_str, fields)
+    item = {'fields': RationalFunctionCalculator.serialize_fields(values, fields)}
+    if steps is not None:
+        item['steps'] = steps
+    return item
+
+
+def analyze_batch(functions, compact=False, executor=None, window=None):
+    """Analyse many functions in parallel, yielding one result per input in order.
+
+    Inputs are deduplicated on the cache key, so each distinct function is
+    analysed once.  At most ``window`` distinct functions are in flight, and a
+    result is only kept after it is yielded while later duplicates still need
+    it, so memory stays bounded however long the batch is.  Each yielded dict
+    has ``index``, ``function`` and ``success`` plus ``fields``/``steps`` or
+    ``error``.
+    """
+    executor = executor or get_batch_executor()
+    window = window or 4 * (os.cpu_count() or 1)
+
+    # First pass: map every input to a distinct key (parse errors are per item)
+    keys = []
+    remaining = {}
+    unique = []
+    for func_str in functions:
+        try:
+            key = analysis_cache.canonical_key(func_str)[0]
+        except Exception as e:
+            keys.append(e)
+            continue
+        keys.append(key)
+        if key not in remaining:
+            remaining[key] = 0
+            unique.append((key, func_str))
+        remaining[key] += 1
+
+    pending = OrderedDict()
+    results = {}
+    next_unique = 0
+
+    def submit_upto(limit):
+        nonlocal next_unique
+        while next_unique < len(unique) and len(pending) < limit:
+            key, func_str = unique[next_unique]
+            pending[key] = executor.submit(analyze_batch_item, func_str, compact)
+            next_unique += 1
+
+    for index, (func_str, key) in enumerate(zip(functions, keys)):
+        if isinstance(key, Exception):
+            yield {'index': index, 'function': func_str, 'success': False, 'error': str(key)}
+            continue
+
+        submit_upto(window)
+        if key not in results:
+            future = pending.pop(key)
+            try:
+                results[key] = {'success': True, **future.result()}
+            except Exception as e:
+                results[key] = {'success': False, 'error': str(e)}
+            submit_upto(window)
+
+        yield {'index': index, 'function': func_str, **results[key]}
+        remaining[key] -= 1
+        if remaining[key] == 0:
+            del results[key]
+
+
+# --- Shared request handling for the API servers ---
+# api/rational_function_solver.py and api/hybrid_db_server.py expose the same
+# /fields, /cache and /batch endpoints.  Each helper takes the decoded JSON
+# body and returns (payload, status); the servers only add the Flask layer.
+
+MAX_BATCH_FUNCTIONS = 1000
+
+
+def fields_request(data):
+    """Body of POST /api/rational-function/fields"""
+    data = data or {}
+    function_str = str(data.get('function') or '').strip()
+    fields = data.get('fields') or []
+
+    if not function_str:
+        return {'success': False, 'error': 'No function provided'}, 400
+
+    if not isinstance(fields, list) or not fields:
+        return {
+            'success': False,
+            'error': 'No fields requested',
+            'available_fields': sorted(RationalFunctionCalculator.FIELD_DEPENDENCIES)
+        }, 400
+
+    try:
+        values = analysis_cache.analyze_fields(function_str, fields)
+    except Exception as e:
+        return {'success': False, 'error': f'Error analyzing function: {str(e)}'}, 400
+
+    return {
+        'success': True,
+        'function': function_str,
+        'fields': RationalFunctionCalculator.serialize_fields(values, fields)
+    }, 200
+
+
+def cache_request(data=None):
+    """Body of GET (``data`` None) or POST /api/rational-function/cache"""
+    if data is None:
+        return {'success': True, 'cache': analysis_cache.stats()}, 200
+
+    functions = data.get('functions') or COMMON_FUNCTIONS
+    warmed = analysis_cache.warm(functions, data.get('fields'))
+    return {'success': True, 'warmed': warmed, 'cache': analysis_cache.stats()}, 200
+
+
+def batch_request(data):
+    """Body of POST /api/rational-function/batch
+
+    On success the payload is an iterator of NDJSON lines, produced as the
+    results complete so the full step text of a large batch is never held in
+    memory at once; on a bad request it is the usual error dict.
+    """
+    data = data or {}
+    functions = data.get('functions')
+    compact = bool(data.get('compact', False))
+
+    if not isinstance(functions, list) or not functions:
+        return {'success': False, 'error': 'No functions provided'}, 400
+
+    if len(functions) > MAX_BATCH_FUNCTIONS:
+        return {'success': False, 'error': f'Too many functions (max {MAX_BATCH_FUNCTIONS})'}, 400
+
+    functions = [str(f).strip() for f in functions]
+
+    def lines():
+        for item in analyze_batch(functions, compact=compact):
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+
+    return lines(), 200
 
 
 def main():